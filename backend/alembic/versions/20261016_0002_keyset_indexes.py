@@ -0,0 +1,48 @@
+"""Composite indexes for keyset pagination of realtime history"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20261016_0002"
+down_revision = "20240229_0001"
+branch_labels = None
+depends_on = None
+
+# The realtime tables are created by the application on startup, so a database may
+# be migrated before or after they exist; only index tables that are present.
+INDEXES = {
+    "environment_readings": {
+        "ix_environment_readings_created_at_id": ["created_at", "id"],
+        "ix_environment_readings_location_created_at_id": ["location", "created_at", "id"],
+    },
+    "alarm_events": {
+        "ix_alarm_events_created_at_id": ["created_at", "id"],
+        "ix_alarm_events_device_id_created_at_id": ["device_id", "created_at", "id"],
+        "ix_alarm_events_severity_created_at_id": ["severity", "created_at", "id"],
+    },
+}
+
+
+def _existing_tables() -> set[str]:
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def upgrade() -> None:
+    tables = _existing_tables()
+    for table, indexes in INDEXES.items():
+        if table not in tables:
+            continue
+        for name, columns in indexes.items():
+            op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade() -> None:
+    tables = _existing_tables()
+    for table, indexes in INDEXES.items():
+        if table not in tables:
+            continue
+        for name in indexes:
+            op.drop_index(name, table_name=table, if_exists=True)
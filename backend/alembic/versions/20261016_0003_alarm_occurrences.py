@@ -0,0 +1,44 @@
+"""Occurrence tracking columns for coalesced alarms"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20261016_0003"
+down_revision = "20261016_0002"
+branch_labels = None
+depends_on = None
+
+COLUMNS = ("occurrence_count", "first_seen_at", "last_seen_at")
+
+
+def _existing_columns() -> set[str] | None:
+    inspector = sa.inspect(op.get_bind())
+    if "alarm_events" not in inspector.get_table_names():
+        # Created by the application on startup with these columns already present.
+        return None
+    return {column["name"] for column in inspector.get_columns("alarm_events")}
+
+
+def upgrade() -> None:
+    existing = _existing_columns()
+    if existing is None or set(COLUMNS) <= existing:
+        return
+    with op.batch_alter_table("alarm_events") as batch:
+        batch.add_column(sa.Column("occurrence_count", sa.Integer(), nullable=False, server_default="1"))
+        batch.add_column(sa.Column("first_seen_at", sa.DateTime(), nullable=True))
+        batch.add_column(sa.Column("last_seen_at", sa.DateTime(), nullable=True))
+        batch.create_index("ix_alarm_events_last_seen_at", ["last_seen_at"])
+    op.execute("UPDATE alarm_events SET first_seen_at = created_at, last_seen_at = created_at")
+
+
+def downgrade() -> None:
+    existing = _existing_columns()
+    if existing is None or not set(COLUMNS) & existing:
+        return
+    with op.batch_alter_table("alarm_events") as batch:
+        batch.drop_index("ix_alarm_events_last_seen_at")
+        for column in COLUMNS:
+            batch.drop_column(column)
@@ -0,0 +1,197 @@
+"""Aggregation of repeated alarms into open alarms.
+
+An alarm stays open while the same ``(code, device_id)`` pair keeps recurring within
+``alarm_coalesce_window_seconds`` of its last occurrence. Repeats update the open row's
+``occurrence_count`` and ``last_seen_at`` instead of inserting new rows, and only state
+transitions are broadcast:
+
+* ``alarm.raise`` when an alarm opens,
+* ``alarm.update`` when a repeat raises its severity,
+* ``alarm.storm`` once when more than ``alarm_storm_threshold`` alarms with the same
+  code open within the window; further alarms of that code are stored but not
+  broadcast until the storm subsides.
+
+The index of open alarms is authoritative in memory. Changes made while writing a batch
+are staged and only become visible once the batch has been committed.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from typing import Any, Iterable
+
+from .config import get_settings
+from .models import AlarmEvent
+
+AlarmKey = tuple[str, "str | None"]
+
+SEVERITY_ORDER = ("info", "warning", "critical")
+
+
+@dataclass(frozen=True)
+class OpenAlarm:
+    id: int
+    code: str
+    message: str
+    severity: str
+    device_id: str | None
+    created_at: datetime
+    last_seen_at: datetime
+    occurrence_count: int
+
+    @property
+    def key(self) -> AlarmKey:
+        return (self.code, self.device_id)
+
+    @classmethod
+    def from_entity(cls, alarm: AlarmEvent) -> "OpenAlarm":
+        return cls(
+            id=alarm.id,
+            code=alarm.code,
+            message=alarm.message,
+            severity=alarm.severity,
+            device_id=alarm.device_id,
+            created_at=alarm.first_seen_at or alarm.created_at,
+            last_seen_at=alarm.last_seen_at or alarm.created_at,
+            occurrence_count=alarm.occurrence_count or 1,
+        )
+
+    def to_entity(self) -> AlarmEvent:
+        return AlarmEvent(
+            id=self.id,
+            code=self.code,
+            message=self.message,
+            severity=self.severity,
+            device_id=self.device_id,
+            created_at=self.created_at,
+            first_seen_at=self.created_at,
+            last_seen_at=self.last_seen_at,
+            occurrence_count=self.occurrence_count,
+        )
+
+
+def escalated(current: str, new: str) -> bool:
+    return SEVERITY_ORDER.index(new) > SEVERITY_ORDER.index(current)
+
+
+class OpenAlarmIndex:
+    """Open alarms keyed by ``(code, device_id)`` plus per-code storm tracking."""
+
+    def __init__(self) -> None:
+        self._open: dict[AlarmKey, OpenAlarm] = {}
+        self._staged: dict[AlarmKey, OpenAlarm] = {}
+        self._transitions: dict[int, str | None] = {}
+        self._opened: dict[str, deque[datetime]] = {}
+        self._storming: set[str] = set()
+        # Storm bookkeeping of the open transaction, applied by ``commit``.
+        self._staged_opened: dict[str, list[datetime]] = {}
+        self._staged_storming: dict[str, bool] = {}
+        self._prune_at = 1024
+        self.version = 0
+
+    @property
+    def window(self) -> timedelta:
+        return timedelta(seconds=get_settings().alarm_coalesce_window_seconds)
+
+    def replace(self, alarms: Iterable[OpenAlarm]) -> None:
+        self._open = {alarm.key: alarm for alarm in alarms}
+        self._staged.clear()
+        self._transitions.clear()
+        self._opened.clear()
+        self._storming.clear()
+        self._staged_opened.clear()
+        self._staged_storming.clear()
+        self.version += 1
+
+    def lookup(self, key: AlarmKey, now: datetime) -> OpenAlarm | None:
+        alarm = self._staged.get(key) or self._open.get(key)
+        if alarm is None or now - alarm.last_seen_at > self.window:
+            return None
+        return alarm
+
+    def open_alarms(self, now: datetime | None = None) -> list[OpenAlarm]:
+        cutoff = (now or datetime.utcnow()) - self.window
+        return sorted(
+            (alarm for alarm in self._open.values() if alarm.last_seen_at >= cutoff),
+            key=lambda alarm: alarm.last_seen_at,
+            reverse=True,
+        )
+
+    def record_repeat(self, alarm: OpenAlarm, data: dict, now: datetime) -> OpenAlarm:
+        severity = data.get("severity", alarm.severity)
+        transition = "alarm.update" if escalated(alarm.severity, severity) else None
+        updated = replace(
+            alarm,
+            message=data["message"],
+            severity=severity if transition else alarm.severity,
+            last_seen_at=now,
+            occurrence_count=alarm.occurrence_count + 1,
+        )
+        self._staged[updated.key] = updated
+        self._transitions[updated.id] = transition
+        return updated
+
+    def record_open(self, alarm: OpenAlarm) -> None:
+        self._staged[alarm.key] = alarm
+        self._transitions[alarm.id] = self._storm_transition(alarm.code, alarm.created_at)
+
+    def _storm_transition(self, code: str, now: datetime) -> str | None:
+        opened = self._opened.setdefault(code, deque())
+        cutoff = now - self.window
+        while opened and opened[0] < cutoff:
+            opened.popleft()
+        staged = self._staged_opened.setdefault(code, [])
+        staged.append(now)
+        storming = self._staged_storming.get(code, code in self._storming)
+        if len(opened) + len(staged) <= get_settings().alarm_storm_threshold:
+            self._staged_storming[code] = False
+            return "alarm.raise"
+        self._staged_storming[code] = True
+        return None if storming else "alarm.storm"
+
+    def transition(self, alarm: AlarmEvent) -> str | None:
+        """The event to broadcast for a written alarm, or ``None`` to stay silent."""
+
+        return self._transitions.pop(alarm.id, "alarm.raise")
+
+    def commit(self) -> None:
+        if self._staged:
+            self.version += 1
+        self._open.update(self._staged)
+        self._staged.clear()
+        for code, moments in self._staged_opened.items():
+            self._opened[code].extend(moments)
+        self._staged_opened.clear()
+        for code, storming in self._staged_storming.items():
+            if storming:
+                self._storming.add(code)
+            else:
+                self._storming.discard(code)
+        self._staged_storming.clear()
+        if len(self._open) > self._prune_at:
+            cutoff = datetime.utcnow() - self.window
+            self._open = {
+                key: alarm for key, alarm in self._open.items() if alarm.last_seen_at >= cutoff
+            }
+            self._prune_at = max(1024, 2 * len(self._open))
+
+    def rollback(self) -> None:
+        self._staged.clear()
+        self._transitions.clear()
+        self._staged_opened.clear()
+        self._staged_storming.clear()
+
+    def __len__(self) -> int:
+        return len(self._open)
+
+
+open_alarms = OpenAlarmIndex()
+
+
+def alarm_key(data: dict[str, Any]) -> AlarmKey:
+    return (data["code"], data.get("device_id"))
+
+
+__all__ = ["OpenAlarm", "OpenAlarmIndex", "alarm_key", "open_alarms"]
@@ -0,0 +1,276 @@
+"""Auditing of broadcast realtime events.
+
+``audit_mode`` selects where the audit trail goes:
+
+* ``off`` – nothing is recorded.
+* ``sampled`` – a random ``audit_sample_rate`` fraction of events is written to
+  ``realtime_dispatch_log`` in the ingestion transaction.
+* ``db`` – every event is written to ``realtime_dispatch_log`` (the default).
+* ``journal`` – every event is appended to a gzip-compressed NDJSON journal on disk.
+  Events are buffered in memory and a background task compresses, writes and fsyncs
+  them in batches every ``audit_fsync_interval_ms``, so broadcasts never wait on disk
+  or on a database commit. Segments rotate once they exceed ``audit_segment_bytes``.
+
+Journal segments can be read back with :func:`iter_journal` or from the command line::
+
+    python -m app.audit ./audit --from 2024-03-01T00:00:00 --to 2024-03-02T00:00:00
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+import random
+import sys
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Iterator, Sequence
+
+from .config import get_settings
+from .encoding import EncodedEvent, decode_event
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "dispatch-"
+SEGMENT_SUFFIX = ".ndjson.gz"
+_SEGMENT_TIME_FORMAT = "%Y%m%dT%H%M%S.%f"
+# Events buffered beyond this while the disk lags behind are dropped and counted.
+MAX_PENDING_EVENTS = 100_000
+
+
+def segment_name(opened_at: datetime) -> str:
+    return f"{SEGMENT_PREFIX}{opened_at.strftime(_SEGMENT_TIME_FORMAT)}{SEGMENT_SUFFIX}"
+
+
+def segment_start(path: Path) -> datetime:
+    stamp = path.name[len(SEGMENT_PREFIX) : -len(SEGMENT_SUFFIX)]
+    return datetime.strptime(stamp, _SEGMENT_TIME_FORMAT)
+
+
+def _compress(lines: Sequence[bytes]) -> bytes:
+    # Each batch is a complete gzip member; concatenated members form a valid gzip file.
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return compressor.compress(b"\n".join(lines) + b"\n") + compressor.flush()
+
+
+class AuditJournal:
+    """Append-only, segment-rotated journal of encoded events."""
+
+    def __init__(self, directory: str | os.PathLike[str], segment_bytes: int, interval: float) -> None:
+        self._directory = Path(directory)
+        self._segment_bytes = segment_bytes
+        self._interval = interval
+        self._pending: list[bytes] = []
+        self._wakeup = asyncio.Event()
+        self._stopped = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        self._fd: int | None = None
+        self._size = 0
+        self.dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def append(self, data: bytes) -> None:
+        if len(self._pending) >= MAX_PENDING_EVENTS:
+            self.dropped += 1
+            return
+        self._pending.append(data)
+        self._wakeup.set()
+
+    async def flush(self) -> None:
+        """Write every buffered event and fsync the current segment."""
+
+        if not self._pending:
+            return
+        lines, self._pending = self._pending, []
+        await asyncio.to_thread(self._write, lines)
+
+    async def _run(self) -> None:
+        while not self._stopped.is_set():
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await self._flush_logged()
+            try:
+                await asyncio.wait_for(self._stopped.wait(), self._interval)
+            except asyncio.TimeoutError:
+                pass
+        await self._flush_logged()
+
+    async def _flush_logged(self) -> None:
+        try:
+            await self.flush()
+        except OSError:  # pragma: no cover - keep journaling once the disk recovers
+            logger.exception("Failed to write audit journal")
+
+    def _write(self, lines: Sequence[bytes]) -> None:
+        if self._fd is None or self._size >= self._segment_bytes:
+            self._rotate()
+        chunk = _compress(lines)
+        os.write(self._fd, chunk)
+        os.fsync(self._fd)
+        self._size += len(chunk)
+
+    def _rotate(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+        path = self._directory / segment_name(datetime.utcnow())
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._size = os.fstat(self._fd).st_size
+
+
+class AuditLog:
+    """Routes broadcast events to the configured audit destination."""
+
+    def __init__(self) -> None:
+        self._journal: AuditJournal | None = None
+
+    @property
+    def journal(self) -> AuditJournal | None:
+        return self._journal
+
+    async def start(self) -> None:
+        settings = get_settings()
+        if settings.audit_mode != "journal":
+            return
+        self._journal = AuditJournal(
+            settings.audit_journal_dir,
+            settings.audit_segment_bytes,
+            settings.audit_fsync_interval_ms / 1000,
+        )
+        await self._journal.start()
+
+    async def stop(self) -> None:
+        if self._journal is not None:
+            await self._journal.stop()
+            self._journal = None
+
+    def db_rows(self, events: Sequence[tuple[str, dict]]) -> list[dict]:
+        """Dispatch log rows to insert alongside ``events`` in the current mode."""
+
+        settings = get_settings()
+        if settings.audit_mode == "db":
+            return [{"event_type": event, "payload": payload} for event, payload in events]
+        if settings.audit_mode == "sampled":
+            rate = settings.audit_sample_rate
+            return [
+                {"event_type": event, "payload": payload}
+                for event, payload in events
+                if random.random() < rate
+            ]
+        return []
+
+    def record(self, event: EncodedEvent) -> None:
+        if self._journal is not None:
+            self._journal.append(event.data)
+
+
+audit_log = AuditLog()
+
+registry.gauge(
+    "iot_audit_journal_pending",
+    "Events waiting to be written to the audit journal.",
+    lambda: len(audit_log.journal) if audit_log.journal is not None else 0,
+)
+
+
+def _read_segment(path: Path) -> Iterator[bytes]:
+    try:
+        with gzip.open(path, "rb") as handle:
+            for line in handle:
+                yield line.rstrip(b"\n")
+    except (EOFError, gzip.BadGzipFile, zlib.error):
+        # A crash can leave a partially written final batch; everything before it is intact.
+        logger.warning("Audit journal segment %s ends with a truncated batch", path)
+
+
+def iter_journal(
+    directory: str | os.PathLike[str],
+    start: datetime | None = None,
+    end: datetime | None = None,
+) -> Iterator[EncodedEvent]:
+    """Yield journaled events with ``start <= created_at < end`` in write order."""
+
+    segments = sorted(Path(directory).glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"))
+    for index, path in enumerate(segments):
+        # A segment holds events buffered before it was opened, so its start bounds the
+        # events of the segments after it, and it only holds events created before the
+        # next segment was opened.
+        if end is not None and index > 0 and segment_start(segments[index - 1]) >= end:
+            break
+        following = segments[index + 1] if index + 1 < len(segments) else None
+        if start is not None and following is not None and segment_start(following) < start:
+            continue
+        for line in _read_segment(path):
+            if not line:
+                continue
+            event = decode_event(line)
+            if start is not None and event.created_at < start:
+                continue
+            if end is not None and event.created_at >= end:
+                continue
+            yield event
+
+
+async def replay_journal(
+    directory: str | os.PathLike[str],
+    deliver: Callable[[EncodedEvent], Awaitable[None]],
+    start: datetime | None = None,
+    end: datetime | None = None,
+) -> int:
+    """Feed journaled events in a time range to ``deliver``, e.g. ``manager.deliver``."""
+
+    count = 0
+    for event in iter_journal(directory, start, end):
+        await deliver(event)
+        count += 1
+    return count
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Print audit journal events as NDJSON.")
+    parser.add_argument("directory")
+    parser.add_argument("--from", dest="start", type=datetime.fromisoformat)
+    parser.add_argument("--to", dest="end", type=datetime.fromisoformat)
+    args = parser.parse_args(argv)
+    out = sys.stdout.buffer
+    for event in iter_journal(args.directory, args.start, args.end):
+        out.write(event.data + b"\n")
+    out.flush()
+
+
+__all__ = [
+    "AuditJournal",
+    "AuditLog",
+    "audit_log",
+    "iter_journal",
+    "replay_journal",
+]
+
+
+if __name__ == "__main__":
+    main()
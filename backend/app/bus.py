@@ -0,0 +1,222 @@
+"""Broadcast backends that carry realtime events between worker processes.
+
+``RealtimeChannelManager`` hands every event to a backend, and the backend calls the
+manager's local fan-out for each event that should reach this process, together with a
+sequence number that is the same in every process (it becomes the SSE ``id``). The
+in-memory backend delivers straight back to the same process. The Unix socket backend
+lets several uvicorn workers on one host share events without external services: the
+worker holding an exclusive lock on ``<socket path>.lock`` serves as the hub, and every
+other worker connects to it. The hub stamps each event with the next sequence number and
+relays it to every worker, including the one that published it. When the hub goes away
+the remaining workers elect a new one, which skips :data:`HUB_HANDOVER_GAP` numbers so
+that workers see the gap and stop resuming SSE clients across the handover.
+"""
+
+from __future__ import annotations
+
+import abc
+import asyncio
+import fcntl
+import logging
+import os
+import struct
+from typing import Awaitable, Callable
+
+from .encoding import EncodedEvent, decode_event
+from .metrics import BUS_UNSHARED
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[EncodedEvent, int | None], Awaitable[None]]
+
+# Frame header: payload length and hub sequence number (0 until the hub stamps it).
+_HEADER = struct.Struct("!IQ")
+HUB_HANDOVER_GAP = 1 << 20
+# A peer whose unsent frames exceed this many bytes is disconnected and has to reconnect;
+# a worker whose frames to the hub exceed it stops sending until the hub catches up.
+MAX_PEER_BUFFER = 8 * 1024 * 1024
+RECONNECT_DELAY_SECONDS = 0.1
+
+
+class BroadcastBackend(abc.ABC):
+    """Transport between ``RealtimeChannelManager.broadcast`` and local fan-out."""
+
+    def __init__(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    async def start(self) -> None:
+        return None
+
+    async def stop(self) -> None:
+        return None
+
+    @abc.abstractmethod
+    async def publish(self, event: EncodedEvent) -> None:
+        """Hand ``event`` to every process sharing the backend, this one included."""
+
+
+class InMemoryBackend(BroadcastBackend):
+    """Single-process backend: events only reach clients of this process."""
+
+    def __init__(self, deliver: Deliver) -> None:
+        super().__init__(deliver)
+        self._sequence = 0
+
+    async def publish(self, event: EncodedEvent) -> None:
+        self._sequence += 1
+        await self._deliver(event, self._sequence)
+
+
+class UnixSocketBackend(BroadcastBackend):
+    """Share events between processes on one host through a Unix domain socket hub."""
+
+    def __init__(self, deliver: Deliver, path: str) -> None:
+        super().__init__(deliver)
+        self._path = path
+        self._lock_fd: int | None = None
+        self._server: asyncio.AbstractServer | None = None
+        self._peers: set[asyncio.StreamWriter] = set()
+        self._upstream: asyncio.StreamWriter | None = None
+        self._connected = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        # Last sequence number delivered here; a newly elected hub continues after it.
+        self._sequence = 0
+        self._unshared_streak = 0
+
+    @property
+    def is_hub(self) -> bool:
+        return self._server is not None
+
+    async def start(self, timeout: float = 5.0) -> None:
+        self._task = asyncio.create_task(self._maintain())
+        await asyncio.wait_for(self._connected.wait(), timeout)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._close_upstream()
+        await self._close_hub()
+
+    async def publish(self, event: EncodedEvent) -> None:
+        if self._server is not None:
+            await self._stamp_and_deliver(event.data, event)
+        elif self._upstream is None:
+            await self._deliver_unshared(event, "no_hub")
+        elif self._upstream.transport.get_write_buffer_size() > MAX_PEER_BUFFER:
+            await self._deliver_unshared(event, "hub_backlog")
+        else:
+            # Delivered here once the hub has stamped it and relayed it back.
+            self._upstream.write(_HEADER.pack(len(event.data), 0) + event.data)
+            self._unshared_streak = 0
+
+    async def _deliver_unshared(self, event: EncodedEvent, reason: str) -> None:
+        """Deliver ``event`` to this worker only; other workers miss it and it has no SSE id."""
+
+        if not self._unshared_streak:
+            logger.warning("Realtime events are not reaching other workers (%s)", reason)
+        self._unshared_streak += 1
+        BUS_UNSHARED.inc(labels=(reason,))
+        await self._deliver(event, None)
+
+    async def _stamp_and_deliver(self, data: bytes, event: EncodedEvent | None = None) -> None:
+        self._sequence += 1
+        self._relay(_HEADER.pack(len(data), self._sequence) + data)
+        await self._deliver(event or decode_event(data), self._sequence)
+
+    async def _maintain(self) -> None:
+        while True:
+            if self._acquire_hub_lock():
+                await self._serve()
+                return
+            try:
+                reader, writer = await asyncio.open_unix_connection(self._path)
+            except OSError:
+                await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+                continue
+            self._upstream = writer
+            self._connected.set()
+            try:
+                await self._consume(reader, writer)
+            finally:
+                self._close_upstream()
+            logger.info("Realtime hub at %s went away; re-electing", self._path)
+
+    def _acquire_hub_lock(self) -> bool:
+        fd = os.open(f"{self._path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _serve(self) -> None:
+        # Holding the lock means any existing socket file is stale.
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        self._server = await asyncio.start_unix_server(self._handle_peer, path=self._path)
+        self._sequence += HUB_HANDOVER_GAP
+        self._connected.set()
+        await self._server.serve_forever()
+
+    async def _handle_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._peers.add(writer)
+        try:
+            await self._consume(reader, writer)
+        finally:
+            self._peers.discard(writer)
+            writer.close()
+
+    async def _consume(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        while True:
+            try:
+                header = await reader.readexactly(_HEADER.size)
+                size, sequence = _HEADER.unpack(header)
+                data = await reader.readexactly(size)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            try:
+                if self._server is not None:
+                    await self._stamp_and_deliver(data)
+                else:
+                    self._sequence = sequence
+                    await self._deliver(decode_event(data), sequence)
+            except Exception:  # pragma: no cover - a bad frame must not kill the link
+                logger.exception("Failed to deliver relayed realtime event")
+
+    def _relay(self, frame: bytes) -> None:
+        for peer in tuple(self._peers):
+            if peer.transport.get_write_buffer_size() > MAX_PEER_BUFFER:
+                logger.warning("Dropping realtime peer that stopped reading")
+                self._peers.discard(peer)
+                peer.close()
+                continue
+            peer.write(frame)
+
+    def _close_upstream(self) -> None:
+        if self._upstream is not None:
+            self._upstream.close()
+            self._upstream = None
+
+    async def _close_hub(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for peer in tuple(self._peers):
+                peer.close()
+            self._peers.clear()
+            self._server = None
+            if os.path.exists(self._path):
+                os.unlink(self._path)
+        if self._lock_fd is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+
+__all__ = ["BroadcastBackend", "InMemoryBackend", "UnixSocketBackend"]
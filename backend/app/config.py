@@ -3,7 +3,7 @@
 from __future__ import annotations
 
 from functools import lru_cache
-from typing import Literal
+from typing import Any, Literal
 
 from pydantic import BaseSettings, Field
 
@@ -15,6 +15,54 @@ class Settings(BaseSettings):
         default="sqlite+aiosqlite:///./iot_board.db",
         description="SQLAlchemy compatible database URL.",
     )
+    db_pool_size: int = Field(
+        default=5,
+        description="Connections kept open by the database pool (server databases only).",
+    )
+    db_max_overflow: int = Field(
+        default=10,
+        description="Extra connections the pool may open beyond db_pool_size under load.",
+    )
+    db_pool_timeout_seconds: float = Field(
+        default=30.0,
+        description="How long a checkout waits for a free pooled connection before failing.",
+    )
+    db_pool_recycle_seconds: int = Field(
+        default=1800,
+        description="Pooled connections older than this are replaced; -1 disables recycling.",
+    )
+    db_pool_pre_ping: bool = Field(
+        default=False,
+        description="Test each connection with a round trip before it is checked out.",
+    )
+    db_prepared_statement_cache_size: int = Field(
+        default=100,
+        description="SQLAlchemy's per-connection prepared statement cache for asyncpg; 0 disables it.",
+    )
+    db_asyncpg_statement_cache_size: int = Field(
+        default=100,
+        description="asyncpg's own statement cache; set both caches to 0 behind pgbouncer.",
+    )
+    sqlite_tuning: bool = Field(
+        default=True,
+        description="Apply the WAL/pragma profile and split SQLite into one writer and a reader pool.",
+    )
+    sqlite_mmap_size: int = Field(
+        default=256 * 1024 * 1024,
+        description="Bytes of the SQLite database file memory-mapped per connection.",
+    )
+    sqlite_cache_size_kib: int = Field(
+        default=64 * 1024,
+        description="SQLite page cache size per connection, in KiB.",
+    )
+    sqlite_busy_timeout_ms: int = Field(
+        default=5000,
+        description="How long a SQLite connection waits for a lock held by another process.",
+    )
+    sqlite_reader_pool_size: int = Field(
+        default=4,
+        description="Number of read-only SQLite connections serving queries.",
+    )
     simulation_mode: bool = Field(
         default=True,
         description="Enable synthetic data generation for demos and tests.",
@@ -27,6 +75,134 @@ class Settings(BaseSettings):
         default="websocket",
         description="Preferred realtime push channel type.",
     )
+    realtime_queue_size: int = Field(
+        default=256,
+        description="Maximum number of undelivered events buffered per realtime client.",
+    )
+    realtime_overflow_policy: Literal["drop_oldest", "coalesce", "disconnect"] = Field(
+        default="drop_oldest",
+        description="What to do when a realtime client's buffer is full.",
+    )
+    realtime_replay_buffer_size: int = Field(
+        default=1024,
+        description="Number of recent SSE frames kept in memory for Last-Event-ID replay.",
+    )
+    realtime_delta_interval_ms: float = Field(
+        default=250.0,
+        description="How long delta-protocol WebSocket clients accumulate events per frame.",
+    )
+    realtime_keyframe_interval_seconds: float = Field(
+        default=30.0,
+        description="How often delta-protocol frames resend the full state of every entity.",
+    )
+    realtime_backend: Literal["memory", "unix"] = Field(
+        default="memory",
+        description="Broadcast backend; 'unix' shares events between workers on one host.",
+    )
+    realtime_unix_socket_path: str = Field(
+        default="/tmp/iot_board_realtime.sock",
+        description="Unix domain socket used by the 'unix' realtime backend.",
+    )
+    ingest_batch_size: int = Field(
+        default=500,
+        description="Maximum number of queued events persisted in a single write-behind transaction.",
+    )
+    ingest_flush_interval_ms: float = Field(
+        default=25.0,
+        description="Maximum time an event waits in the write-behind queue before a flush.",
+    )
+    ingest_queue_size: int = Field(
+        default=10_000,
+        description="Capacity of the write-behind queue; producers wait when it is full.",
+    )
+    metrics_enabled: bool = Field(
+        default=True,
+        description="Serve in-process metrics in the Prometheus text format at /metrics.",
+    )
+    admin_token: str | None = Field(
+        default=None,
+        description="Bearer token for the /api/admin endpoints; they are disabled when unset.",
+    )
+    profiling_enabled: bool = Field(
+        default=False,
+        description="Trace sampled HTTP requests and their SQL statements for /api/admin/traces.",
+    )
+    profiling_sample_rate: float = Field(
+        default=1.0,
+        ge=0.0,
+        le=1.0,
+        description="Fraction of HTTP requests traced when profiling is enabled.",
+    )
+    profiling_slow_traces: int = Field(
+        default=50,
+        description="Number of slowest request traces kept in memory.",
+    )
+    retention_interval_seconds: float = Field(
+        default=3600.0,
+        description="Interval between retention passes.",
+    )
+    retention_chunk_size: int = Field(
+        default=1000,
+        description="Rows deleted per retention transaction.",
+    )
+    retention_environment_hours: float = Field(
+        default=0.0,
+        description="Age after which raw environment readings are deleted; 0 keeps them forever.",
+    )
+    retention_minute_rollup_hours: float = Field(
+        default=0.0,
+        description="Age after which 1m environment rollups are deleted; 0 keeps them forever.",
+    )
+    retention_alarm_hours: float = Field(
+        default=0.0,
+        description="Age after which alarm events are deleted; 0 keeps them forever.",
+    )
+    retention_dispatch_log_hours: float = Field(
+        default=0.0,
+        description="Age after which realtime dispatch log rows are deleted; 0 keeps them forever.",
+    )
+    retention_sqlite_vacuum: bool = Field(
+        default=False,
+        description="Return freed pages to SQLite with incremental VACUUM; converts the file on startup.",
+    )
+    alarm_coalesce_window_seconds: float = Field(
+        default=300.0,
+        description="Repeats of an alarm within this long of its last occurrence fold into it.",
+    )
+    alarm_storm_threshold: int = Field(
+        default=50,
+        description="Alarms of one code opened within the window before broadcasts are suppressed.",
+    )
+    alarm_rules: list[dict[str, Any]] = Field(
+        default_factory=list,
+        description="Declarative threshold/rate/zscore rules evaluated on environment readings (JSON).",
+    )
+    alarm_rule_window: int = Field(
+        default=120,
+        description="Readings kept per location for rolling alarm rules.",
+    )
+    audit_mode: Literal["off", "sampled", "db", "journal"] = Field(
+        default="db",
+        description="Where broadcast events are audited: nowhere, a DB sample, the DB, or a file journal.",
+    )
+    audit_sample_rate: float = Field(
+        default=0.01,
+        ge=0.0,
+        le=1.0,
+        description="Fraction of events written to the dispatch log in 'sampled' audit mode.",
+    )
+    audit_journal_dir: str = Field(
+        default="./audit",
+        description="Directory holding the compressed segments of the 'journal' audit mode.",
+    )
+    audit_segment_bytes: int = Field(
+        default=64 * 1024 * 1024,
+        description="Size after which the audit journal rotates to a new segment.",
+    )
+    audit_fsync_interval_ms: float = Field(
+        default=200.0,
+        description="Journal events are compressed, written and fsynced together at this interval.",
+    )
 
     class Config:
         env_prefix = "IOT_BOARD_"
@@ -3,108 +3,557 @@
 from __future__ import annotations
 
 import asyncio
+import logging
 import random
+import time
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Awaitable, Callable
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Awaitable, Callable, Iterator, NamedTuple, Sequence
 
-from sqlalchemy import select
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from .alarms import OpenAlarm, alarm_key, open_alarms
+from .audit import audit_log
 from .config import get_settings
-from .db import get_async_session
+from .db import get_async_session, get_read_session, get_upsert_insert, pool_metrics
+from .encoding import (
+    EncodedEvent,
+    alarm_payload,
+    device_payload,
+    encode_event,
+    environment_payload,
+)
+from .metrics import (
+    DB_COMMIT,
+    ENCODE_LATENCY,
+    INGEST_BATCH_SIZE,
+    INGEST_ERRORS,
+    INGEST_LATENCY,
+    registry,
+)
 from .models import AlarmEvent, DeviceStatus, EnvironmentReading, RealTimeDispatchLog
+from .profiling import Trace, collect_spans, current_trace
 from .realtime import manager
-from .schemas import BroadcastEnvelope
+from .retention import retention_enabled, retention_worker
+from .rollups import update_rollups
+from .rules import rule_engine
+from .state import device_cache, latest_readings
+
+logger = logging.getLogger(__name__)
 
 
 async def upsert_device_status(
-    device_id: str, name: str, status: str, meta: dict | None = None
+    session: AsyncSession, device_id: str, name: str, status: str, meta: dict | None = None
 ) -> DeviceStatus:
-    meta = meta or {}
-    async with get_async_session() as session:
-        stmt = select(DeviceStatus).where(DeviceStatus.device_id == device_id)
-        result = await session.execute(stmt)
-        instance = result.scalar_one_or_none()
-        if instance is None:
-            instance = DeviceStatus(device_id=device_id, name=name, status=status, meta=meta)
-            session.add(instance)
-        else:
-            instance.status = status
-            instance.meta = meta
-        instance.updated_at = datetime.utcnow()
-        await session.commit()
-        await session.refresh(instance)
+    values = {"status": status, "meta": meta or {}, "updated_at": datetime.utcnow()}
+    stmt = (
+        update(DeviceStatus)
+        .where(DeviceStatus.device_id == device_id)
+        .values(**values)
+        .returning(DeviceStatus)
+    )
+    instance = (await session.scalars(stmt)).one_or_none()
+    if instance is None:
+        stmt = (
+            insert(DeviceStatus)
+            .values(device_id=device_id, name=name, **values)
+            .returning(DeviceStatus)
+        )
+        instance = (await session.scalars(stmt)).one()
     return instance
 
 
-async def create_environment_reading(**kwargs) -> EnvironmentReading:
-    async with get_async_session() as session:
-        reading = EnvironmentReading(**kwargs)
-        session.add(reading)
-        await session.commit()
-        await session.refresh(reading)
-    return reading
+async def create_environment_readings(
+    session: AsyncSession, rows: Sequence[dict]
+) -> list[EnvironmentReading]:
+    stmt = insert(EnvironmentReading).returning(EnvironmentReading, sort_by_parameter_order=True)
+    readings = list(await session.scalars(stmt, list(rows)))
+    await update_rollups(session, readings)
+    return readings
 
 
-async def create_alarm_event(**kwargs) -> AlarmEvent:
-    async with get_async_session() as session:
-        alarm = AlarmEvent(**kwargs)
-        session.add(alarm)
-        await session.commit()
-        await session.refresh(alarm)
-    return alarm
+async def create_alarm_events(session: AsyncSession, rows: Sequence[dict]) -> list[AlarmEvent]:
+    stmt = insert(AlarmEvent).returning(AlarmEvent, sort_by_parameter_order=True)
+    result = await session.scalars(stmt, list(rows))
+    return list(result)
+
+
+async def record_alarms(session: AsyncSession, rows: Sequence[dict]) -> list[AlarmEvent]:
+    """Open new alarms and fold repeats of open ones into their existing rows.
+
+    ``rows`` must not repeat an ``(code, device_id)`` pair.
+    """
+
+    now = datetime.utcnow()
+    results: list[AlarmEvent | None] = [None] * len(rows)
+    repeats: list[OpenAlarm] = []
+    new_rows: list[tuple[int, dict]] = []
+    for index, row in enumerate(rows):
+        current = open_alarms.lookup(alarm_key(row), now)
+        if current is None:
+            new_rows.append(
+                (index, {**row, "created_at": now, "first_seen_at": now, "last_seen_at": now})
+            )
+            continue
+        updated = open_alarms.record_repeat(current, row, now)
+        repeats.append(updated)
+        results[index] = updated.to_entity()
+    if repeats:
+        await session.execute(
+            update(AlarmEvent),
+            [
+                {
+                    "id": alarm.id,
+                    "message": alarm.message,
+                    "severity": alarm.severity,
+                    "last_seen_at": alarm.last_seen_at,
+                    "occurrence_count": alarm.occurrence_count,
+                }
+                for alarm in repeats
+            ],
+        )
+    if new_rows:
+        created = await create_alarm_events(session, [row for _, row in new_rows])
+        for (index, _), alarm in zip(new_rows, created):
+            open_alarms.record_open(OpenAlarm.from_entity(alarm))
+            results[index] = alarm
+    return results
+
+
+# Five bound parameters per row keeps a chunk well below SQLite's variable limit.
+UPSERT_CHUNK_SIZE = 500
+
+
+async def upsert_device_statuses(session: AsyncSession, rows: Sequence[dict]) -> list[DeviceStatus]:
+    """Insert or update many devices with ``INSERT ... ON CONFLICT (device_id) DO UPDATE``.
+
+    ``rows`` must not repeat a device id. Dialects without native upsert support fall
+    back to one :func:`upsert_device_status` call per row.
+    """
+
+    dialect_insert = get_upsert_insert(session)
+    if dialect_insert is None:
+        return [await upsert_device_status(session, **row) for row in rows]
+
+    updated_at = datetime.utcnow()
+    instances: dict[str, DeviceStatus] = {}
+    for offset in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        values = [
+            {
+                "device_id": row["device_id"],
+                "name": row["name"],
+                "status": row["status"],
+                "meta": row.get("meta") or {},
+                "updated_at": updated_at,
+            }
+            for row in rows[offset : offset + UPSERT_CHUNK_SIZE]
+        ]
+        stmt = dialect_insert(DeviceStatus).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[DeviceStatus.device_id],
+            set_={
+                "status": stmt.excluded.status,
+                "meta": stmt.excluded.meta,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        ).returning(DeviceStatus)
+        result = await session.scalars(stmt, execution_options={"populate_existing": True})
+        instances.update((instance.device_id, instance) for instance in result)
+    return [instances[row["device_id"]] for row in rows]
+
+
+class _Writer(NamedTuple):
+    event: str
+    write: Callable[[AsyncSession, Sequence[dict]], Awaitable[list[Any]]]
+    serialize: Callable[[Any], dict]
+    key: Callable[[dict], Any] | None = None
+    # Picks the event broadcast for a written entity; ``None`` suppresses the broadcast.
+    event_for: Callable[[Any], str | None] | None = None
+
+
+_WRITERS: dict[str, _Writer] = {
+    "environment": _Writer("environment.update", create_environment_readings, environment_payload),
+    "device": _Writer("device.update", upsert_device_statuses, device_payload, itemgetter("device_id")),
+    "alarm": _Writer(
+        "alarm.raise", record_alarms, alarm_payload, alarm_key, open_alarms.transition
+    ),
+}
+
 
+def _split_on_repeats(rows: list[dict], key: Callable[[dict], Any] | None) -> Iterator[list[dict]]:
+    """Split ``rows`` so that no chunk touches the same keyed row twice."""
 
-async def persist_and_broadcast(event: str, payload: dict) -> None:
-    envelope = BroadcastEnvelope(event=event, payload=payload)
+    if key is None:
+        yield rows
+        return
+    chunk: list[dict] = []
+    seen: set[Any] = set()
+    for row in rows:
+        if key(row) in seen:
+            yield chunk
+            chunk, seen = [], set()
+        chunk.append(row)
+        seen.add(key(row))
+    if chunk:
+        yield chunk
+
+
+async def _write_batch(
+    entries: Sequence[tuple[str, dict]]
+) -> tuple[list[Any], list[tuple[str, dict] | None]]:
+    """Write ``entries`` in one transaction.
+
+    Returns the entities and, aligned with them, the event to broadcast for each one or
+    ``None`` where the write is not a state change worth broadcasting.
+    """
+
+    started = time.perf_counter()
     async with get_async_session() as session:
-        session.add(RealTimeDispatchLog(event_type=event, payload=payload))
-        await session.commit()
-    await manager.broadcast(envelope)
-
-
-async def handle_environment_update(data: dict) -> None:
-    reading = await create_environment_reading(**data)
-    await persist_and_broadcast(
-        "environment.update",
-        {
-            "id": reading.id,
-            "location": reading.location,
-            "temperature": reading.temperature,
-            "humidity": reading.humidity,
-            "air_quality_index": reading.air_quality_index,
-            "created_at": reading.created_at.isoformat(),
-        },
-    )
+        entities: list[Any] = []
+        events: list[tuple[str, dict] | None] = []
+        try:
+            # Consecutive entries of the same kind share one executemany statement.
+            for kind, group in groupby(entries, key=itemgetter(0)):
+                writer = _WRITERS[kind]
+                for rows in _split_on_repeats([data for _, data in group], writer.key):
+                    written = await writer.write(session, rows)
+                    entities.extend(written)
+                    for entity in written:
+                        event = writer.event_for(entity) if writer.event_for else writer.event
+                        events.append(None if event is None else (event, writer.serialize(entity)))
+            audit_rows = audit_log.db_rows([event for event in events if event is not None])
+            if audit_rows:
+                await session.execute(insert(RealTimeDispatchLog), audit_rows)
+            await session.commit()
+        except BaseException:
+            open_alarms.rollback()
+            INGEST_ERRORS.inc()
+            raise
+    DB_COMMIT.observe(time.perf_counter() - started)
+    INGEST_BATCH_SIZE.observe(len(entries))
+    # The rows are committed: nothing below may raise, or callers would retry and write
+    # them a second time.
+    try:
+        open_alarms.commit()
+    except Exception:
+        logger.exception("Failed to update the open alarm index")
+    try:
+        _evaluate_rules(entities)
+    except Exception:
+        logger.exception("Alarm rule evaluation failed")
+    return entities, events
 
 
-async def handle_device_status(data: dict) -> None:
-    status = await upsert_device_status(**data)
-    await persist_and_broadcast(
-        "device.update",
-        {
-            "id": status.id,
-            "device_id": status.device_id,
-            "name": status.name,
-            "status": status.status,
-            "meta": status.meta,
-            "updated_at": status.updated_at.isoformat(),
-        },
-    )
+_rule_tasks: set[asyncio.Task[Any]] = set()
 
 
-async def handle_alarm(data: dict) -> None:
-    alarm = await create_alarm_event(**data)
-    await persist_and_broadcast(
-        "alarm.raise",
-        {
-            "id": alarm.id,
-            "code": alarm.code,
-            "message": alarm.message,
-            "severity": alarm.severity,
-            "device_id": alarm.device_id,
-            "created_at": alarm.created_at.isoformat(),
-        },
-    )
+def _evaluate_rules(entities: Sequence[Any]) -> None:
+    """Raise alarms for committed readings that break a configured rule.
+
+    Alarms are submitted from separate tasks: the ingestion consumer calls this while
+    flushing and must not wait on its own queue.
+    """
+
+    readings = [entity for entity in entities if isinstance(entity, EnvironmentReading)]
+    for alarm in rule_engine.evaluate(readings):
+        task = asyncio.create_task(handle_alarm(alarm))
+        _rule_tasks.add(task)
+        task.add_done_callback(_rule_tasks.discard)
+
+
+async def drain_rule_alarms() -> None:
+    """Wait for alarms raised by rules that are still being persisted."""
+
+    while _rule_tasks:
+        await asyncio.gather(*_rule_tasks, return_exceptions=True)
+
+
+def _apply_to_state(event: EncodedEvent) -> None:
+    """Keep the in-memory state views in step with events from every worker."""
+
+    if event.event == "device.update":
+        device_cache.apply(event.payload)
+    elif event.event == "environment.update":
+        latest_readings.apply(event.payload)
+
+
+manager.add_listener(_apply_to_state)
+
+
+def _snapshot_version() -> tuple:
+    # Open alarms also expire with time, so the version rolls over every second.
+    return (device_cache.etag, latest_readings.etag, open_alarms.version, int(time.monotonic()))
+
+
+def _snapshot() -> dict[str, list[dict]]:
+    return {
+        "devices": device_cache.list(),
+        "environment": latest_readings.list(),
+        "alarms": [alarm_payload(alarm.to_entity()) for alarm in open_alarms.open_alarms()],
+    }
+
+
+manager.set_snapshot_source(_snapshot_version, _snapshot)
+
+
+async def _publish(event: str, payload: dict) -> None:
+    started = time.perf_counter()
+    encoded = encode_event(event, payload)
+    ENCODE_LATENCY.observe(time.perf_counter() - started)
+    audit_log.record(encoded)
+    await manager.broadcast(encoded)
+
+
+async def _publish_committed(event: str, payload: dict) -> None:
+    """Broadcast an event for a committed write; failures are logged, never raised."""
+
+    try:
+        await _publish(event, payload)
+    except Exception:
+        logger.exception("Failed to broadcast %s", event)
+
+
+async def persist_batch(entries: Sequence[tuple[str, dict]]) -> list[Any]:
+    """Persist ``(kind, data)`` entries and their dispatch log rows in one transaction.
+
+    Broadcasts are sent after the commit, in the order the entries were given.
+    """
+
+    entities, events = await _write_batch(entries)
+    for event in events:
+        if event is not None:
+            await _publish_committed(*event)
+    return entities
+
+
+@dataclass
+class _QueuedEvent:
+    kind: str
+    data: dict
+    future: asyncio.Future[Any]
+    trace: Trace | None = field(default_factory=current_trace)
+    queued_at: float = field(default_factory=time.perf_counter)
+
+
+class IngestionQueue:
+    """Write-behind buffer that persists ingestion events in batched transactions.
+
+    Events are flushed once ``ingest_batch_size`` entries are buffered or the oldest
+    entry has waited ``ingest_flush_interval_ms``. A single consumer drains the queue so
+    events are committed and broadcast in submission order. Producers wait while the
+    queue holds ``ingest_queue_size`` entries. Once :meth:`stop` has begun the queue
+    reports itself as not running, so late events are written directly.
+    """
+
+    def __init__(self) -> None:
+        self._queue: asyncio.Queue[_QueuedEvent] | None = None
+        self._task: asyncio.Task[None] | None = None
+        self._batch_size = 1
+        self._flush_interval = 0.0
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return not self._stopping and self._task is not None and not self._task.done()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        settings = get_settings()
+        self._batch_size = max(1, settings.ingest_batch_size)
+        self._flush_interval = max(0.0, settings.ingest_flush_interval_ms / 1000)
+        self._queue = asyncio.Queue(maxsize=max(1, settings.ingest_queue_size))
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything still buffered and stop the consumer task.
+
+        Flushing can raise alarms from rules, which are persisted by separate tasks and
+        may in turn be queued; both are waited for until neither has work left.
+        """
+
+        if self._task is None or self._queue is None:
+            return
+        self._stopping = True
+        try:
+            await self._queue.join()
+            # ``join`` can return while items put during the last flush are still queued.
+            while _rule_tasks or not self._queue.empty():
+                await drain_rule_alarms()
+                await self._queue.join()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        finally:
+            self._stopping = False
+        self._task = None
+        self._queue = None
+
+    async def submit(self, kind: str, data: dict) -> Any:
+        """Queue an event and wait until it has been committed and broadcast."""
+
+        assert self._queue is not None, "ingestion queue is not running"
+        future: asyncio.Future[Any] = asyncio.get_running_loop().create_future()
+        await self._queue.put(_QueuedEvent(kind, data, future))
+        return await future
+
+    async def _collect(self, queue: asyncio.Queue[_QueuedEvent]) -> list[_QueuedEvent]:
+        loop = asyncio.get_running_loop()
+        batch = [await queue.get()]
+        deadline = loop.time() + self._flush_interval
+        while len(batch) < self._batch_size:
+            try:
+                batch.append(queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        queue = self._queue
+        assert queue is not None
+        while True:
+            batch = await self._collect(queue)
+            try:
+                await self._flush(batch)
+            except Exception as exc:
+                # Keep consuming; producers of this batch must not wait forever.
+                logger.exception("Ingestion batch failed")
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(exc)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _flush(self, batch: list[_QueuedEvent]) -> None:
+        flush_started = time.perf_counter()
+        try:
+            with collect_spans() as shared:
+                entities, events = await _write_batch([(item.kind, item.data) for item in batch])
+        except Exception as exc:
+            if len(batch) == 1:
+                if not batch[0].future.done():
+                    batch[0].future.set_exception(exc)
+                return
+            # Retry entries one by one so a single bad payload does not reject the batch.
+            for item in batch:
+                await self._flush([item])
+            return
+        written = time.perf_counter()
+        for item, entity, event in zip(batch, entities, events):
+            publish_started = time.perf_counter()
+            if event is not None:
+                await _publish_committed(*event)
+            if item.trace is not None and shared is not None:
+                _trace_flush(item, shared, flush_started, written, publish_started, len(batch))
+            if not item.future.done():
+                item.future.set_result(entity)
+
+
+def _trace_flush(
+    item: _QueuedEvent, shared: Trace, flushed: float, written: float, publishing: float, size: int
+) -> None:
+    """Attribute the stages of a write-behind flush to the request that queued ``item``."""
+
+    trace = item.trace
+    assert trace is not None
+    trace.add_span("ingest.queued", item.queued_at, flushed)
+    trace.add_span("ingest.write", flushed, written, batch_size=size)
+    for span in shared.spans:
+        trace.add_span(span.name, span.start, span.end, **span.detail)
+    trace.add_span("ingest.publish", publishing, time.perf_counter())
+
+
+ingestion_queue = IngestionQueue()
+
+
+def _pool_gauge(field: str) -> list[tuple[tuple[str, ...], float]]:
+    return [((role,), stats[field]) for role, stats in pool_metrics().items() if field in stats]
+
+
+registry.gauge(
+    "iot_ingest_queue_depth", "Events waiting in the write-behind queue.", lambda: ingestion_queue.depth
+)
+registry.gauge("iot_rule_alarms_pending", "Rule alarms not yet persisted.", lambda: len(_rule_tasks))
+registry.gauge("iot_open_alarms", "Alarms currently open in memory.", lambda: len(open_alarms))
+registry.gauge(
+    "iot_db_pool_checked_out",
+    "Connections checked out per pool.",
+    lambda: _pool_gauge("checked_out"),
+    ("pool",),
+)
+
+
+async def _ingest(kind: str, data: dict) -> Any:
+    started = time.perf_counter()
+    if ingestion_queue.running:
+        entity = await ingestion_queue.submit(kind, data)
+    else:
+        (entity,) = await persist_batch([(kind, data)])
+    INGEST_LATENCY.observe(time.perf_counter() - started, (kind,))
+    return entity
+
+
+async def ingest_bulk(kind: str, rows: Sequence[dict]) -> list[Any]:
+    """Persist and broadcast pre-validated rows of one kind in a single transaction."""
+
+    if not rows:
+        return []
+    started = time.perf_counter()
+    entities = await persist_batch([(kind, row) for row in rows])
+    INGEST_LATENCY.observe(time.perf_counter() - started, (f"{kind}_bulk",))
+    return entities
+
+
+async def handle_environment_update(data: dict) -> EnvironmentReading:
+    return await _ingest("environment", data)
+
+
+async def handle_device_status(data: dict) -> DeviceStatus:
+    return await _ingest("device", data)
+
+
+async def handle_alarm(data: dict) -> AlarmEvent:
+    return await _ingest("alarm", data)
+
+
+async def warm_state_caches() -> None:
+    """Load the in-memory state views from the database."""
+
+    async with get_read_session() as session:
+        result = await session.scalars(select(DeviceStatus).order_by(DeviceStatus.id))
+        device_cache.replace(device_payload(status) for status in result)
+        newest = (
+            select(func.max(EnvironmentReading.id))
+            .group_by(EnvironmentReading.location)
+            .scalar_subquery()
+        )
+        result = await session.scalars(
+            select(EnvironmentReading).where(EnvironmentReading.id.in_(newest))
+        )
+        latest_readings.replace(environment_payload(reading) for reading in result)
+        cutoff = datetime.utcnow() - open_alarms.window
+        result = await session.scalars(
+            select(AlarmEvent).where(AlarmEvent.last_seen_at >= cutoff).order_by(AlarmEvent.id)
+        )
+        open_alarms.replace(OpenAlarm.from_entity(alarm) for alarm in result)
 
 
 async def simulation_worker(stop_event: asyncio.Event) -> None:
@@ -156,6 +605,8 @@ async def start_background_tasks() -> Callable[[], Awaitable[None]]:
 
     if settings.simulation_mode:
         tasks.append(asyncio.create_task(simulation_worker(stop_event)))
+    if retention_enabled(settings):
+        tasks.append(asyncio.create_task(retention_worker(stop_event)))
 
     async def shutdown() -> None:
         stop_event.set()
@@ -171,6 +622,12 @@ async def start_background_tasks() -> Callable[[], Awaitable[None]]:
 
 
 __all__ = [
+    "IngestionQueue",
+    "ingestion_queue",
+    "persist_batch",
+    "ingest_bulk",
+    "warm_state_caches",
+    "drain_rule_alarms",
     "handle_environment_update",
     "handle_device_status",
     "handle_alarm",
@@ -2,9 +2,15 @@
 
 from __future__ import annotations
 
+import time
 from contextlib import asynccontextmanager
-from typing import AsyncIterator, Callable
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable
 
+from sqlalchemy import Connection, event, inspect, make_url, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import TimeoutError as SQLAlchemyTimeoutError
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
@@ -12,28 +18,167 @@ from sqlalchemy.ext.asyncio import (
     create_async_engine,
 )
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-from .config import get_settings
+from .config import Settings, get_settings
+from .metrics import DB_CHECKOUT, DB_CHECKOUT_TIMEOUTS
 
 
 class Base(DeclarativeBase):
     """Declarative base class for ORM models."""
 
 
+@dataclass
+class PoolStats:
+    """Checkout counters collected by :class:`InstrumentedPool`."""
+
+    checkouts: int = 0
+    timeouts: int = 0
+    checkout_seconds_total: float = 0.0
+    checkout_seconds_max: float = 0.0
+
+    def record(self, elapsed: float) -> None:
+        self.checkouts += 1
+        self.checkout_seconds_total += elapsed
+        if elapsed > self.checkout_seconds_max:
+            self.checkout_seconds_max = elapsed
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited for a connection."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self) -> Any:
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except SQLAlchemyTimeoutError:
+            self.stats.timeouts += 1
+            DB_CHECKOUT_TIMEOUTS.inc()
+            raise
+        elapsed = time.perf_counter() - started
+        self.stats.record(elapsed)
+        DB_CHECKOUT.observe(elapsed)
+        return connection
+
+
 _engine: AsyncEngine | None = None
 _session_factory: async_sessionmaker[AsyncSession] | None = None
+_read_engine: AsyncEngine | None = None
+_read_session_factory: async_sessionmaker[AsyncSession] | None = None
+
+
+def _tuned_sqlite(url: str) -> bool:
+    """Whether ``url`` names a SQLite file that can be shared by several connections."""
+
+    parsed = make_url(url)
+    database = parsed.database or ""
+    return (
+        parsed.get_backend_name() == "sqlite"
+        and database not in ("", ":memory:")
+        and "mode=memory" not in database
+    )
+
+
+def _sqlite_pragmas(settings: Settings, read_only: bool) -> list[str]:
+    pragmas = [
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA mmap_size={settings.sqlite_mmap_size}",
+        f"PRAGMA cache_size=-{settings.sqlite_cache_size_kib}",
+        f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+    else:
+        # WAL is persistent in the database file; readers never block the writer.
+        pragmas.insert(0, "PRAGMA journal_mode=WAL")
+    return pragmas
+
+
+def _create_sqlite_engine(settings: Settings, read_only: bool) -> AsyncEngine:
+    # The writer is a single pooled connection, so writes from every coroutine are
+    # serialized by the pool instead of contending for SQLite's database lock.
+    pool_size = settings.sqlite_reader_pool_size if read_only else 1
+    engine = create_async_engine(
+        settings.database_url,
+        echo=False,
+        poolclass=InstrumentedPool,
+        pool_size=pool_size,
+        max_overflow=0,
+        pool_timeout=settings.db_pool_timeout_seconds,
+    )
+    pragmas = _sqlite_pragmas(settings, read_only)
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _apply_pragmas(dbapi_connection: Any, _record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return engine
+
+
+def _server_engine_options(settings: Settings) -> dict[str, Any]:
+    """Pool and driver options for databases other than SQLite."""
+
+    url = make_url(settings.database_url)
+    if url.get_backend_name() == "sqlite":
+        return {}
+    options: dict[str, Any] = {
+        "poolclass": InstrumentedPool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout_seconds,
+        "pool_recycle": settings.db_pool_recycle_seconds,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+    if url.get_driver_name() == "asyncpg":
+        options["connect_args"] = {
+            "prepared_statement_cache_size": settings.db_prepared_statement_cache_size,
+            "statement_cache_size": settings.db_asyncpg_statement_cache_size,
+        }
+    return options
+
+
+def _use_sqlite_profile(settings: Settings) -> bool:
+    return settings.sqlite_tuning and _tuned_sqlite(settings.database_url)
 
 
 def get_engine() -> AsyncEngine:
-    """Return a lazily initialised async engine."""
+    """Return a lazily initialised async engine.
+
+    With the SQLite profile this is the single-connection writer engine.
+    """
 
     global _engine
     if _engine is None:
         settings = get_settings()
-        _engine = create_async_engine(settings.database_url, echo=False)
+        if _use_sqlite_profile(settings):
+            _engine = _create_sqlite_engine(settings, read_only=False)
+        else:
+            _engine = create_async_engine(
+                settings.database_url, echo=False, **_server_engine_options(settings)
+            )
     return _engine
 
 
+def get_read_engine() -> AsyncEngine:
+    """Return the engine for read-only queries; the writer engine unless SQLite is tuned."""
+
+    global _read_engine
+    if _read_engine is None:
+        settings = get_settings()
+        if not _use_sqlite_profile(settings):
+            return get_engine()
+        _read_engine = _create_sqlite_engine(settings, read_only=True)
+    return _read_engine
+
+
 def get_session_factory() -> async_sessionmaker[AsyncSession]:
     """Return the shared async session factory."""
 
@@ -43,6 +188,13 @@ def get_session_factory() -> async_sessionmaker[AsyncSession]:
     return _session_factory
 
 
+def get_read_session_factory() -> async_sessionmaker[AsyncSession]:
+    global _read_session_factory
+    if _read_session_factory is None:
+        _read_session_factory = async_sessionmaker(get_read_engine(), expire_on_commit=False)
+    return _read_session_factory
+
+
 @asynccontextmanager
 async def get_async_session() -> AsyncIterator[AsyncSession]:
     """Provide a transactional scope around a series of operations."""
@@ -52,6 +204,89 @@ async def get_async_session() -> AsyncIterator[AsyncSession]:
         yield session
 
 
+@asynccontextmanager
+async def get_read_session() -> AsyncIterator[AsyncSession]:
+    """Provide a session for queries that never write."""
+
+    factory = get_read_session_factory()
+    async with factory() as session:
+        yield session
+
+
+def _pool_metrics(engine: AsyncEngine) -> dict[str, Any]:
+    pool = engine.pool
+    metrics: dict[str, Any] = {"pool": type(pool).__name__}
+    if isinstance(pool, InstrumentedPool):
+        stats = pool.stats
+        metrics.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            checkouts=stats.checkouts,
+            timeouts=stats.timeouts,
+            checkout_seconds_total=stats.checkout_seconds_total,
+            checkout_seconds_max=stats.checkout_seconds_max,
+        )
+    return metrics
+
+
+def pool_metrics() -> dict[str, dict[str, Any]]:
+    """Checkout and wait statistics for the writer and, when separate, the reader pool."""
+
+    metrics = {"writer": _pool_metrics(get_engine())}
+    if get_read_engine() is not get_engine():
+        metrics["reader"] = _pool_metrics(get_read_engine())
+    return metrics
+
+
+def add_missing_columns(connection: Connection) -> list[str]:
+    """Add model columns and indexes missing from tables created by an older release.
+
+    ``create_all`` only creates missing tables. Columns added to a model later are
+    added here with ``ALTER TABLE ... ADD COLUMN``, so they must be nullable or have a
+    server default. A column whose ``info`` names a ``backfill_from`` column is filled
+    from it for existing rows. Returns the ``table.column`` names that were added.
+    """
+
+    inspector = inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    added: list[str] = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        missing = [column for column in table.columns if column.name not in existing]
+        for column in missing:
+            ddl = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}"))
+            source = column.info.get("backfill_from")
+            if source is not None:
+                connection.execute(
+                    table.update()
+                    .where(column.is_(None))
+                    .values({column.name: table.c[source]})
+                )
+            added.append(f"{table.name}.{column.name}")
+        if missing:
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection)
+    return added
+
+
+_UPSERT_INSERTS: dict[str, Callable[..., Any]] = {
+    "sqlite": sqlite_insert,
+    "postgresql": postgresql_insert,
+}
+
+
+def get_upsert_insert(session: AsyncSession) -> Callable[..., Any] | None:
+    """Return the dialect ``insert`` supporting ``ON CONFLICT``, or ``None`` if unavailable."""
+
+    return _UPSERT_INSERTS.get(session.get_bind().dialect.name)
+
+
 async def run_in_session(callback: Callable[[AsyncSession], AsyncIterator[None] | None]) -> None:
     """Helper to run an async callback within a session, committing afterwards."""
 
@@ -69,8 +304,16 @@ async def run_in_session(callback: Callable[[AsyncSession], AsyncIterator[None]
 
 __all__ = [
     "Base",
+    "add_missing_columns",
     "get_engine",
+    "get_read_engine",
     "get_session_factory",
+    "get_read_session_factory",
     "get_async_session",
+    "get_read_session",
+    "get_upsert_insert",
+    "InstrumentedPool",
+    "PoolStats",
+    "pool_metrics",
     "run_in_session",
 ]
@@ -0,0 +1,138 @@
+"""Serialization of realtime events into ready-to-send frames.
+
+Every broadcast is encoded exactly once; the resulting text and SSE frame are shared
+by all subscribers. ``orjson`` is used when it is installed, otherwise the standard
+library ``json`` module.
+"""
+
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any
+
+try:  # pragma: no cover - exercised implicitly depending on the environment
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+from .models import AlarmEvent, DeviceStatus, EnvironmentReading
+
+
+def dumps(data: Any) -> bytes:
+    """Serialize ``data`` to compact JSON bytes using the fastest available backend."""
+
+    if orjson is not None:
+        return orjson.dumps(data, default=str)
+    return json.dumps(data, default=str, separators=(",", ":")).encode()
+
+
+def loads(data: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Events that describe the latest state of an entity; a newer one supersedes an older one.
+_COALESCE_FIELDS = {
+    "environment.update": "location",
+    "device.update": "device_id",
+}
+
+
+@dataclass(frozen=True)
+class EncodedEvent:
+    """A realtime event together with its wire representations.
+
+    ``key`` identifies the entity a state event describes so that queued events for the
+    same entity can be coalesced; it is ``None`` for events that must all be delivered.
+    """
+
+    event: str
+    payload: dict[str, Any]
+    created_at: datetime
+    key: tuple[str, Any] | None
+    data: bytes = field(repr=False)
+    text: str = field(repr=False)
+    sse_frame: bytes = field(repr=False)
+
+
+def _build_event(
+    event: str, payload: dict[str, Any], created_at: datetime, data: bytes
+) -> EncodedEvent:
+    key_field = _COALESCE_FIELDS.get(event)
+    return EncodedEvent(
+        event=event,
+        payload=payload,
+        created_at=created_at,
+        key=(event, payload.get(key_field)) if key_field else None,
+        data=data,
+        text=data.decode(),
+        sse_frame=b"data: " + data + b"\n\n",
+    )
+
+
+def encode_event(
+    event: str, payload: dict[str, Any], created_at: datetime | None = None
+) -> EncodedEvent:
+    created_at = created_at or datetime.utcnow()
+    data = dumps({"event": event, "payload": payload, "created_at": created_at.isoformat()})
+    return _build_event(event, payload, created_at, data)
+
+
+def decode_event(data: bytes) -> EncodedEvent:
+    """Rebuild an :class:`EncodedEvent` from its JSON wire form, reusing ``data`` as is."""
+
+    message = loads(data)
+    return _build_event(
+        message["event"], message["payload"], datetime.fromisoformat(message["created_at"]), data
+    )
+
+
+def environment_payload(reading: EnvironmentReading) -> dict[str, Any]:
+    return {
+        "id": reading.id,
+        "location": reading.location,
+        "temperature": reading.temperature,
+        "humidity": reading.humidity,
+        "air_quality_index": reading.air_quality_index,
+        "created_at": reading.created_at.isoformat(),
+    }
+
+
+def device_payload(status: DeviceStatus) -> dict[str, Any]:
+    return {
+        "id": status.id,
+        "device_id": status.device_id,
+        "name": status.name,
+        "status": status.status,
+        "meta": status.meta,
+        "updated_at": status.updated_at.isoformat(),
+    }
+
+
+def alarm_payload(alarm: AlarmEvent) -> dict[str, Any]:
+    return {
+        "id": alarm.id,
+        "code": alarm.code,
+        "message": alarm.message,
+        "severity": alarm.severity,
+        "device_id": alarm.device_id,
+        "created_at": alarm.created_at.isoformat(),
+        "occurrence_count": alarm.occurrence_count or 1,
+        "first_seen_at": (alarm.first_seen_at or alarm.created_at).isoformat(),
+        "last_seen_at": (alarm.last_seen_at or alarm.created_at).isoformat(),
+    }
+
+
+__all__ = [
+    "EncodedEvent",
+    "encode_event",
+    "decode_event",
+    "dumps",
+    "loads",
+    "environment_payload",
+    "device_payload",
+    "alarm_payload",
+]
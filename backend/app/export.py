@@ -0,0 +1,229 @@
+"""Streaming export of historical tables.
+
+Rows are read in keyset-paged chunks of ``EXPORT_CHUNK_SIZE`` ordered by ``id``. Each
+chunk is fetched in its own short read session and encoded and yielded before the next
+one is queried, so memory stays flat regardless of how many rows are exported and a slow
+client never holds a reader connection while it consumes the stream. CSV and NDJSON are always available;
+Arrow IPC streams and Parquet require ``pyarrow``.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, AsyncIterator, Callable, Sequence
+
+try:  # pragma: no cover - exercised implicitly depending on the environment
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = None
+    pq = None
+
+from sqlalchemy import (
+    JSON,
+    Column,
+    DateTime,
+    Float,
+    Integer,
+    MetaData,
+    Numeric,
+    String,
+    Table,
+    Text,
+    inspect,
+    select,
+)
+
+from .db import get_read_engine, get_read_session
+from .encoding import dumps
+from .models import AlarmEvent, EnvironmentReading
+
+EXPORT_CHUNK_SIZE = 10_000
+
+# The agriculture schema is managed by alembic, not by the application models.
+_agriculture = MetaData()
+sensor_readings = Table(
+    "sensor_readings",
+    _agriculture,
+    Column("id", Integer, primary_key=True),
+    Column("device_id", Integer),
+    Column("sensor_type", String(100)),
+    Column("value", Numeric(10, 2)),
+    Column("unit", String(50)),
+    Column("recorded_at", DateTime(timezone=True)),
+    Column("notes", Text),
+)
+
+# Exportable table name -> (table, timestamp column used for range filters).
+EXPORT_TABLES: dict[str, tuple[Table, str]] = {
+    "environment_readings": (EnvironmentReading.__table__, "created_at"),
+    "alarm_events": (AlarmEvent.__table__, "created_at"),
+    "sensor_readings": (sensor_readings, "recorded_at"),
+}
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+COLUMNAR_FORMATS = ("arrow", "parquet")
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _encode_csv(columns: Sequence[str], rows: Sequence[Sequence[Any]], header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    writer.writerows(
+        [
+            dumps(value).decode() if isinstance(value, (dict, list)) else _plain(value)
+            for value in row
+        ]
+        for row in rows
+    )
+    return buffer.getvalue().encode()
+
+
+def _encode_ndjson(columns: Sequence[str], rows: Sequence[Sequence[Any]], header: bool) -> bytes:
+    return b"".join(dumps(dict(zip(columns, map(_plain, row)))) + b"\n" for row in rows)
+
+
+def _arrow_type(column: Column) -> Any:
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, (Float, Numeric)):
+        return pa.float64()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    return pa.string()
+
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _arrow_batch(table: Table, schema: Any, rows: Sequence[Sequence[Any]]) -> Any:
+    arrays = []
+    for index, column in enumerate(table.columns):
+        values = [row[index] for row in rows]
+        if isinstance(column.type, Numeric) and not isinstance(column.type, Float):
+            values = [None if value is None else float(value) for value in values]
+        elif isinstance(column.type, JSON):
+            values = [None if value is None else dumps(value).decode() for value in values]
+        elif isinstance(column.type, DateTime):
+            values = [None if value is None else _naive_utc(value) for value in values]
+        arrays.append(pa.array(values, type=schema.field(index).type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _Drain(io.RawIOBase):
+    """Write-only sink whose buffered bytes are handed out after every batch."""
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+async def _partitions(
+    table: Table, timestamp: str, start: datetime | None, end: datetime | None
+) -> AsyncIterator[Sequence[Sequence[Any]]]:
+    stmt = select(table).order_by(table.c.id).limit(EXPORT_CHUNK_SIZE)
+    if start is not None:
+        stmt = stmt.where(table.c[timestamp] >= start)
+    if end is not None:
+        stmt = stmt.where(table.c[timestamp] < end)
+    last_id: int | None = None
+    while True:
+        page = stmt if last_id is None else stmt.where(table.c.id > last_id)
+        async with get_read_session() as session:
+            rows = (await session.execute(page)).all()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < EXPORT_CHUNK_SIZE:
+            return
+        last_id = rows[-1].id
+
+
+async def table_exists(name: str) -> bool:
+    async with get_read_engine().connect() as conn:
+        return await conn.run_sync(lambda sync_conn: inspect(sync_conn).has_table(name))
+
+
+async def stream_export(
+    name: str,
+    fmt: str,
+    start: datetime | None = None,
+    end: datetime | None = None,
+) -> AsyncIterator[bytes]:
+    """Yield the encoded contents of export table ``name`` chunk by chunk."""
+
+    table, timestamp = EXPORT_TABLES[name]
+    columns = [column.name for column in table.columns]
+    partitions = _partitions(table, timestamp, start, end)
+    if fmt in COLUMNAR_FORMATS:
+        schema = pa.schema([(column.name, _arrow_type(column)) for column in table.columns])
+        sink = _Drain()
+        writer = (
+            pa.ipc.new_stream(sink, schema)
+            if fmt == "arrow"
+            else pq.ParquetWriter(sink, schema, compression="zstd")
+        )
+        async for rows in partitions:
+            batch = _arrow_batch(table, schema, rows)
+            if fmt == "arrow":
+                writer.write_batch(batch)
+            else:
+                writer.write_table(pa.Table.from_batches([batch]))
+            yield sink.take()
+        writer.close()
+        yield sink.take()
+        return
+
+    encode: Callable[[Sequence[str], Sequence[Sequence[Any]], bool], bytes] = (
+        _encode_csv if fmt == "csv" else _encode_ndjson
+    )
+    header = True
+    async for rows in partitions:
+        yield encode(columns, rows, header)
+        header = False
+    if header and fmt == "csv":
+        yield encode(columns, [], True)
+
+
+def columnar_available() -> bool:
+    return pa is not None
+
+
+__all__ = [
+    "COLUMNAR_FORMATS",
+    "EXPORT_MEDIA_TYPES",
+    "EXPORT_TABLES",
+    "columnar_available",
+    "stream_export",
+    "table_exists",
+]
@@ -7,36 +7,68 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from .audit import audit_log
 from .config import get_settings
-from .data_ingestion import start_background_tasks
-from .db import Base, get_engine
-from .routes import router
+from .data_ingestion import (
+    drain_rule_alarms,
+    ingestion_queue,
+    start_background_tasks,
+    warm_state_caches,
+)
+from .db import Base, add_missing_columns, get_engine, get_read_engine
+from .metrics import metrics_endpoint
+from .profiling import TracingMiddleware, instrument_engine
+from .realtime import manager
+from .retention import prepare_sqlite_auto_vacuum
+from .routes import NEXT_CURSOR_HEADER, router
+from .rules import parse_rules, rule_engine
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    settings = get_settings()
     engine = get_engine()
+    if settings.retention_sqlite_vacuum:
+        await prepare_sqlite_auto_vacuum()
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(add_missing_columns)
 
+    if settings.profiling_enabled:
+        instrument_engine(engine)
+        instrument_engine(get_read_engine())
+    await warm_state_caches()
+    rule_engine.configure(parse_rules(settings.alarm_rules), settings.alarm_rule_window)
+    await manager.start()
+    await audit_log.start()
+    await ingestion_queue.start()
     shutdown_callback = await start_background_tasks()
     try:
         yield
     finally:
         await shutdown_callback()
+        await ingestion_queue.stop()
+        await drain_rule_alarms()
+        await audit_log.stop()
+        await manager.stop()
 
 
 def create_app() -> FastAPI:
     settings = get_settings()
     app = FastAPI(title="IoT Board Backend", lifespan=lifespan)
     app.include_router(router, prefix="/api")
+    if settings.metrics_enabled:
+        app.add_api_route("/metrics", metrics_endpoint, include_in_schema=False)
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
     )
+    if settings.profiling_enabled:
+        app.add_middleware(TracingMiddleware)
     app.state.settings = settings
     return app
 
@@ -0,0 +1,251 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+Counters and histograms are plain Python objects updated on the hot paths: recording
+is a dictionary lookup, a ``bisect`` and a few additions, cheap enough to stay on in
+production. Gauges are callbacks evaluated only when ``/metrics`` is scraped. There is
+no background collector and no external dependency.
+"""
+
+from __future__ import annotations
+
+import math
+from bisect import bisect_left
+from typing import Callable, Iterable, Sequence, TypeVar
+
+from starlette.responses import Response
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets from 100µs to 10s.
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+Labels = tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonically increasing value, optionally split by label values."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, labels: Labels = ()) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, labels: Labels = ()) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}_total{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class _HistogramSeries:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int) -> None:
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """Distribution of observed values over fixed upper ``buckets``."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: dict[Labels, _HistogramSeries] = {}
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = _HistogramSeries(len(self.buckets))
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def count(self, labels: Labels = ()) -> int:
+        series = self._series.get(labels)
+        return series.count if series is not None else 0
+
+    def samples(self) -> Iterable[str]:
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            label_text = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_text} {_format_value(series.sum)}"
+            yield f"{self.name}_count{label_text} {series.count}"
+
+
+class Gauge:
+    """Value read from ``collect`` at scrape time as ``(label values, value)`` pairs."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        collect: Callable[[], Iterable[tuple[Labels, float]]],
+        labelnames: Sequence[str] = (),
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._collect = collect
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self._collect():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+MetricT = TypeVar("MetricT", Counter, Histogram, Gauge)
+
+
+class Registry:
+    """Named metrics rendered together by ``/metrics``."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Counter | Histogram | Gauge] = {}
+
+    def register(self, metric: MetricT) -> MetricT:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        collect: Callable[[], float | Iterable[tuple[Labels, float]]],
+        labelnames: Sequence[str] = (),
+    ) -> Gauge:
+        def samples() -> Iterable[tuple[Labels, float]]:
+            value = collect()
+            return [((), value)] if isinstance(value, (int, float)) else value
+
+        return self.register(Gauge(name, documentation, samples, labelnames))
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+INGEST_LATENCY = registry.histogram(
+    "iot_ingest_latency_seconds",
+    "Time from handing an event to ingestion until it is committed and broadcast.",
+    ("kind",),
+)
+INGEST_BATCH_SIZE = registry.histogram(
+    "iot_ingest_batch_size", "Entries written per ingestion transaction.", buckets=SIZE_BUCKETS
+)
+INGEST_ERRORS = registry.counter("iot_ingest_errors", "Ingestion transactions that failed.")
+DB_COMMIT = registry.histogram(
+    "iot_db_commit_seconds", "Duration of ingestion write transactions including the commit."
+)
+DB_CHECKOUT = registry.histogram(
+    "iot_db_checkout_seconds", "Time spent waiting for a pooled database connection."
+)
+DB_CHECKOUT_TIMEOUTS = registry.counter(
+    "iot_db_checkout_timeouts", "Connection checkouts that gave up after the pool timeout."
+)
+ENCODE_LATENCY = registry.histogram(
+    "iot_realtime_encode_seconds", "Time spent serializing one realtime event."
+)
+FANOUT_LATENCY = registry.histogram(
+    "iot_realtime_fanout_seconds", "Time spent enqueueing one event for every matching local client."
+)
+EVENTS_DELIVERED = registry.counter(
+    "iot_realtime_events", "Realtime events delivered to this process.", ("event",)
+)
+EVENTS_DROPPED = registry.counter(
+    "iot_realtime_dropped_events", "Events discarded because a client's outbox was full."
+)
+BUS_UNSHARED = registry.counter(
+    "iot_realtime_bus_unshared_events",
+    "Events only delivered to this worker because the realtime hub was unreachable or backed up.",
+    ("reason",),
+)
+
+
+async def metrics_endpoint() -> Response:
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+
+__all__ = [
+    "BUS_UNSHARED",
+    "CONTENT_TYPE",
+    "DB_CHECKOUT",
+    "DB_CHECKOUT_TIMEOUTS",
+    "DB_COMMIT",
+    "ENCODE_LATENCY",
+    "EVENTS_DELIVERED",
+    "EVENTS_DROPPED",
+    "FANOUT_LATENCY",
+    "INGEST_BATCH_SIZE",
+    "INGEST_ERRORS",
+    "INGEST_LATENCY",
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "Registry",
+    "metrics_endpoint",
+    "registry",
+]
@@ -5,7 +5,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Any
 
-from sqlalchemy import JSON, Float, ForeignKey, Integer, String
+from sqlalchemy import JSON, Float, ForeignKey, Index, Integer, String, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .db import Base
@@ -15,6 +15,10 @@ class EnvironmentReading(Base):
     """Stores environmental sensor values such as temperature and humidity."""
 
     __tablename__ = "environment_readings"
+    __table_args__ = (
+        Index("ix_environment_readings_created_at_id", "created_at", "id"),
+        Index("ix_environment_readings_location_created_at_id", "location", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     location: Mapped[str] = mapped_column(String(64), default="default")
@@ -24,6 +28,28 @@ class EnvironmentReading(Base):
     created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow, index=True)
 
 
+class EnvironmentRollup(Base):
+    """Pre-aggregated environment readings per location and time bucket."""
+
+    __tablename__ = "environment_rollups"
+    __table_args__ = (UniqueConstraint("location", "bucket", "bucket_start"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    location: Mapped[str] = mapped_column(String(64))
+    bucket: Mapped[str] = mapped_column(String(8))
+    bucket_start: Mapped[datetime] = mapped_column()
+    count: Mapped[int] = mapped_column(Integer)
+    temperature_min: Mapped[float] = mapped_column(Float)
+    temperature_max: Mapped[float] = mapped_column(Float)
+    temperature_sum: Mapped[float] = mapped_column(Float)
+    humidity_min: Mapped[float] = mapped_column(Float)
+    humidity_max: Mapped[float] = mapped_column(Float)
+    humidity_sum: Mapped[float] = mapped_column(Float)
+    air_quality_index_min: Mapped[float] = mapped_column(Float)
+    air_quality_index_max: Mapped[float] = mapped_column(Float)
+    air_quality_index_sum: Mapped[float] = mapped_column(Float)
+
+
 class DeviceStatus(Base):
     """Represents the current state of an IoT device."""
 
@@ -41,6 +67,11 @@ class AlarmEvent(Base):
     """High priority alerts that should be surfaced immediately."""
 
     __tablename__ = "alarm_events"
+    __table_args__ = (
+        Index("ix_alarm_events_created_at_id", "created_at", "id"),
+        Index("ix_alarm_events_device_id_created_at_id", "device_id", "created_at", "id"),
+        Index("ix_alarm_events_severity_created_at_id", "severity", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     code: Mapped[str] = mapped_column(String(32), index=True)
@@ -48,6 +79,14 @@ class AlarmEvent(Base):
     severity: Mapped[str] = mapped_column(String(16), default="info")
     created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow, index=True)
     device_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    occurrence_count: Mapped[int] = mapped_column(Integer, default=1, server_default="1")
+    # ``backfill_from`` fills the column for existing rows when it is added on startup.
+    first_seen_at: Mapped[datetime | None] = mapped_column(
+        nullable=True, info={"backfill_from": "created_at"}
+    )
+    last_seen_at: Mapped[datetime | None] = mapped_column(
+        nullable=True, index=True, info={"backfill_from": "created_at"}
+    )
 
 
 class RealTimeDispatchLog(Base):
@@ -63,6 +102,7 @@ class RealTimeDispatchLog(Base):
 
 __all__ = [
     "EnvironmentReading",
+    "EnvironmentRollup",
     "DeviceStatus",
     "AlarmEvent",
     "RealTimeDispatchLog",
@@ -0,0 +1,70 @@
+"""Keyset pagination over ``(created_at, id)`` for time-ordered tables.
+
+Pages are returned newest first. The cursor handed to clients is an opaque, URL-safe
+token encoding the sort key of the last row of a page; the next page continues strictly
+below it, so every page costs the same index range scan regardless of depth.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+from datetime import datetime
+from typing import Any, Sequence
+
+from sqlalchemy import Select, tuple_
+
+from .encoding import dumps, loads
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    token = dumps([created_at.isoformat(), row_id])
+    return base64.urlsafe_b64encode(token).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Return the sort key in ``cursor``; raises ``ValueError`` for a malformed token."""
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = loads(raw)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (binascii.Error, TypeError, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def paginate(
+    stmt: Select[Any],
+    model: Any,
+    cursor: str | None,
+    limit: int,
+    start: datetime | None = None,
+    end: datetime | None = None,
+) -> Select[Any]:
+    """Apply the time range, keyset position and newest-first ordering to ``stmt``.
+
+    One extra row is requested so that :func:`split_page` can tell whether another
+    page follows.
+    """
+
+    if start is not None:
+        stmt = stmt.where(model.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(model.created_at < end)
+    if cursor is not None:
+        created_at, row_id = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(model.created_at, model.id) < tuple_(created_at, row_id))
+    return stmt.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+
+
+def split_page(rows: Sequence[Any], limit: int) -> tuple[list[Any], str | None]:
+    """Trim the look-ahead row and return the page with the cursor for the next one."""
+
+    page = list(rows[:limit])
+    if len(rows) <= limit:
+        return page, None
+    last = page[-1]
+    return page, encode_cursor(last.created_at, last.id)
+
+
+__all__ = ["decode_cursor", "encode_cursor", "paginate", "split_page"]
@@ -0,0 +1,251 @@
+"""Opt-in request tracing and on-demand stack sampling for diagnosing latency.
+
+With ``profiling_enabled``, :class:`TracingMiddleware` traces a sample of HTTP requests.
+Each trace collects spans for the SQL statements executed on its behalf (via engine
+events) and for the stages an ingested event goes through on the write-behind queue.
+The slowest ``profiling_slow_traces`` traces are kept in memory for
+``GET /api/admin/traces``.
+
+:func:`sample_stacks` samples the stacks of every thread for a fixed duration and
+returns them in the collapsed format consumed by ``flamegraph.pl`` and speedscope.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Iterator
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .config import get_settings
+
+MAX_SPANS_PER_TRACE = 200
+MAX_STATEMENT_LENGTH = 200
+UNTRACED_PREFIXES = ("/api/events", "/api/admin", "/metrics")
+
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    end: float
+    detail: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class Trace:
+    """Timings collected for one request; times are ``perf_counter`` values."""
+
+    method: str
+    path: str
+    started_at: datetime = field(default_factory=datetime.utcnow)
+    start: float = field(default_factory=time.perf_counter)
+    end: float | None = None
+    status: int | None = None
+    spans: list[Span] = field(default_factory=list)
+    dropped_spans: int = 0
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def add_span(self, name: str, start: float, end: float, **detail: Any) -> None:
+        if len(self.spans) >= MAX_SPANS_PER_TRACE:
+            self.dropped_spans += 1
+            return
+        self.spans.append(Span(name, start, end, detail))
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": self.duration * 1000,
+            "spans": [
+                {
+                    "name": span.name,
+                    "offset_ms": (span.start - self.start) * 1000,
+                    "duration_ms": (span.end - span.start) * 1000,
+                    **span.detail,
+                }
+                for span in self.spans
+            ],
+            "dropped_spans": self.dropped_spans,
+        }
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("iot_board_trace", default=None)
+
+
+def current_trace() -> Trace | None:
+    return _current_trace.get()
+
+
+@contextmanager
+def collect_spans() -> Iterator[Trace | None]:
+    """Collect spans recorded inside the block into a detached trace.
+
+    Used where work done for several requests is shared, such as one write-behind
+    batch; the caller copies the spans into every request trace involved. Yields
+    ``None`` when profiling is off.
+    """
+
+    if not get_settings().profiling_enabled:
+        yield None
+        return
+    trace = Trace(method="", path="")
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+class SlowTraceBuffer:
+    """Keeps the ``size`` slowest finished traces."""
+
+    def __init__(self, size: int = 50) -> None:
+        self.size = size
+        self._heap: list[tuple[float, int, Trace]] = []
+        self._counter = itertools.count()
+        self.recorded = 0
+
+    def add(self, trace: Trace) -> None:
+        self.recorded += 1
+        item = (trace.duration, next(self._counter), trace)
+        if len(self._heap) < self.size:
+            heapq.heappush(self._heap, item)
+        elif item[0] > self._heap[0][0]:
+            heapq.heapreplace(self._heap, item)
+
+    def slowest(self) -> list[Trace]:
+        return [trace for _, _, trace in sorted(self._heap, key=lambda item: item[0], reverse=True)]
+
+    def clear(self) -> None:
+        self._heap.clear()
+        self.recorded = 0
+
+
+slow_traces = SlowTraceBuffer()
+
+
+class TracingMiddleware:
+    """ASGI middleware tracing a ``profiling_sample_rate`` share of HTTP requests."""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+        settings = get_settings()
+        self.sample_rate = settings.profiling_sample_rate
+        slow_traces.size = max(1, settings.profiling_slow_traces)
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["path"].startswith(UNTRACED_PREFIXES)
+            or random.random() >= self.sample_rate
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(method=scope["method"], path=scope["path"])
+        token = _current_trace.set(trace)
+
+        async def send_with_status(message: dict) -> None:
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            trace.end = time.perf_counter()
+            _current_trace.reset(token)
+            slow_traces.add(trace)
+
+
+_instrumented: weakref.WeakSet[Any] = weakref.WeakSet()
+
+
+def _before_cursor_execute(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+    if _current_trace.get() is not None:
+        conn.info.setdefault("iot_board_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+    trace = _current_trace.get()
+    starts = conn.info.get("iot_board_query_start")
+    if trace is None or not starts:
+        return
+    trace.add_span(
+        "sql", starts.pop(), time.perf_counter(), statement=statement[:MAX_STATEMENT_LENGTH]
+    )
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Record a span for every statement ``engine`` executes inside a trace."""
+
+    sync_engine = engine.sync_engine
+    if sync_engine in _instrumented:
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    _instrumented.add(sync_engine)
+
+
+def _frame_label(code: Any) -> str:
+    filename = code.co_filename
+    for root in sys.path:
+        if root and filename.startswith(root):
+            filename = os.path.relpath(filename, root)
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+def sample_stacks(duration: float, interval: float) -> str:
+    """Sample every other thread's stack for ``duration`` seconds; return collapsed stacks.
+
+    Blocks the calling thread, so run it off the event loop.
+    """
+
+    own = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    stacks: Counter[str] = Counter()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            labels.append(names.get(ident, f"thread-{ident}"))
+            stacks[";".join(reversed(labels))] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+__all__ = [
+    "SlowTraceBuffer",
+    "Trace",
+    "TracingMiddleware",
+    "collect_spans",
+    "current_trace",
+    "instrument_engine",
+    "sample_stacks",
+    "slow_traces",
+]
@@ -2,74 +2,606 @@
 
 from __future__ import annotations
 
+import abc
 import asyncio
 import json
-from typing import AsyncIterator, Dict, Iterable
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Generic,
+    Hashable,
+    Iterable,
+    Literal,
+    NamedTuple,
+    Protocol,
+    TypeVar,
+)
 
 from fastapi import WebSocket
-from fastapi.responses import EventSourceResponse
+from fastapi.responses import StreamingResponse
 
+from .bus import BroadcastBackend, InMemoryBackend, UnixSocketBackend
+from .config import get_settings
+from .encoding import EncodedEvent, dumps, encode_event
+from .metrics import EVENTS_DELIVERED, EVENTS_DROPPED, FANOUT_LATENCY, registry
 from .schemas import BroadcastEnvelope
 
+OverflowPolicy = Literal["drop_oldest", "coalesce", "disconnect"]
+WireProtocol = Literal["json", "delta"]
+
+
+class Frame(Protocol):
+    """Anything an :class:`Outbox` can buffer; ``key`` drives coalescing."""
+
+    @property
+    def key(self) -> tuple[str, Any] | None: ...
+
+
+FrameT = TypeVar("FrameT", bound=Frame)
+
+
+class SseFrame(NamedTuple):
+    """A sequenced SSE frame shared by every SSE subscriber."""
+
+    key: tuple[str, Any] | None
+    data: bytes
+
+
+class Outbox(Generic[FrameT]):
+    """Bounded buffer of frames waiting to be delivered to one subscriber.
+
+    When the buffer is full, ``drop_oldest`` discards the oldest event, ``coalesce``
+    replaces a queued state event for the same entity (falling back to dropping the
+    oldest event) and ``disconnect`` closes the outbox so the subscriber is evicted.
+    """
+
+    def __init__(self, maxsize: int, policy: OverflowPolicy) -> None:
+        self._items: deque[FrameT] = deque()
+        self._maxsize = max(1, maxsize)
+        self._policy = policy
+        self._ready = asyncio.Event()
+        self.closed = False
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put(self, event: FrameT) -> bool:
+        """Buffer ``event`` without blocking; return ``False`` once the outbox is closed."""
+
+        if self.closed:
+            return False
+        if len(self._items) >= self._maxsize:
+            if self._policy == "disconnect":
+                self.close()
+                return False
+            if not (self._policy == "coalesce" and self._discard_superseded(event)):
+                self._items.popleft()
+            self.dropped += 1
+            EVENTS_DROPPED.inc()
+        self._items.append(event)
+        self._ready.set()
+        return True
+
+    def _discard_superseded(self, event: FrameT) -> bool:
+        if event.key is None:
+            return False
+        for queued in self._items:
+            if queued.key == event.key:
+                self._items.remove(queued)
+                return True
+        return False
+
+    async def get(self) -> FrameT | None:
+        """Return the next event, or ``None`` once the outbox has been closed."""
+
+        while not self._items:
+            if self.closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        return self._items.popleft()
+
+    def drain(self) -> list[FrameT]:
+        """Remove and return every buffered event without waiting."""
+
+        items = list(self._items)
+        self._items.clear()
+        return items
+
+    def close(self) -> None:
+        self.closed = True
+        self._items.clear()
+        self._ready.set()
+
+
+SEVERITY_RANK = {"info": 0, "warning": 1, "critical": 2}
+
+
+def _split_values(values: Iterable[str] | str | None) -> frozenset[str] | None:
+    if values is None:
+        return None
+    if isinstance(values, str):
+        values = [values]
+    items = frozenset(item.strip() for value in values for item in value.split(",") if item.strip())
+    return items or None
+
+
+@dataclass(frozen=True)
+class Subscription:
+    """Server-side filter describing which events a realtime client receives.
+
+    ``events`` restricts event types. ``device_ids``, ``locations`` and ``min_severity``
+    only apply to events whose payload carries ``device_id``, ``location`` or
+    ``severity`` respectively; other events pass those filters untouched.
+    """
+
+    events: frozenset[str] | None = None
+    device_ids: frozenset[str] | None = None
+    locations: frozenset[str] | None = None
+    min_severity: str | None = None
+
+    @classmethod
+    def from_params(
+        cls,
+        events: Iterable[str] | str | None = None,
+        device_ids: Iterable[str] | str | None = None,
+        locations: Iterable[str] | str | None = None,
+        min_severity: str | None = None,
+    ) -> "Subscription":
+        if min_severity is not None and min_severity not in SEVERITY_RANK:
+            raise ValueError(f"Unknown severity {min_severity!r}")
+        return cls(
+            events=_split_values(events),
+            device_ids=_split_values(device_ids),
+            locations=_split_values(locations),
+            min_severity=min_severity,
+        )
+
+    def matches(self, event: EncodedEvent) -> bool:
+        return self.allows(event.payload)
+
+    def allows(self, payload: dict[str, Any]) -> bool:
+        if self.device_ids is not None and "device_id" in payload:
+            if payload["device_id"] not in self.device_ids:
+                return False
+        if self.locations is not None and "location" in payload:
+            if payload["location"] not in self.locations:
+                return False
+        if self.min_severity is not None and "severity" in payload:
+            rank = SEVERITY_RANK.get(payload["severity"], 0)
+            if rank < SEVERITY_RANK[self.min_severity]:
+                return False
+        return True
+
+    def describe(self) -> dict[str, Any]:
+        return {
+            "events": sorted(self.events) if self.events else None,
+            "device_ids": sorted(self.device_ids) if self.device_ids else None,
+            "locations": sorted(self.locations) if self.locations else None,
+            "min_severity": self.min_severity,
+        }
+
+
+ALL_EVENTS = Subscription()
+
+# Snapshot section -> the event type whose subscribers receive it.
+SNAPSHOT_SECTIONS = {
+    "devices": "device.update",
+    "environment": "environment.update",
+    "alarms": "alarm.raise",
+}
+
+
+class _Client(abc.ABC):
+    """A registered realtime subscriber with its outbox and subscription."""
+
+    def __init__(self, outbox: Outbox, subscription: Subscription) -> None:
+        self.outbox = outbox
+        self.subscription = subscription
+
+    @abc.abstractmethod
+    def deliver(self, event: EncodedEvent, frame: SseFrame) -> bool:
+        """Queue ``event`` in the client's wire format; ``False`` evicts the client."""
+
+
+class _WebSocketClient(_Client):
+    def __init__(self, websocket: WebSocket, outbox: Outbox[EncodedEvent], subscription: Subscription) -> None:
+        super().__init__(outbox, subscription)
+        self.websocket = websocket
+        self.writer: asyncio.Task[None] | None = None
+
+    def deliver(self, event: EncodedEvent, frame: SseFrame) -> bool:
+        return self.outbox.put(event)
+
+
+class _DeltaWebSocketClient(_WebSocketClient):
+    """WebSocket client speaking the ``delta`` protocol.
+
+    Events that arrive within ``interval`` seconds are sent as one ``batch`` frame.
+    State events (``environment.update``, ``device.update``) are collapsed to the newest
+    payload per entity and only the fields that changed since the last frame are sent,
+    keyed by location or device id under ``state``. Other events are listed in order
+    under ``events``. Every ``keyframe_interval`` seconds a frame carries the full
+    payload of every entity the client has seen, so a client can always resynchronise.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        outbox: Outbox[EncodedEvent],
+        subscription: Subscription,
+        interval: float,
+        keyframe_interval: float,
+    ) -> None:
+        super().__init__(websocket, outbox, subscription)
+        self.interval = interval
+        self.keyframe_interval = keyframe_interval
+        self._sent: dict[tuple[str, Any], dict[str, Any]] = {}
+        self._sequence = 0
+        self._next_keyframe = 0.0
+
+    def frame(self, events: Iterable[EncodedEvent]) -> str:
+        now = time.monotonic()
+        keyframe = now >= self._next_keyframe
+        if keyframe:
+            self._next_keyframe = now + self.keyframe_interval
+        others: list[dict[str, Any]] = []
+        latest: dict[tuple[str, Any], dict[str, Any]] = {}
+        for event in events:
+            if event.key is None:
+                others.append({"event": event.event, "payload": event.payload})
+            else:
+                latest[event.key] = event.payload
+        state: dict[str, dict[str, dict[str, Any]]] = {}
+        changed = {**self._sent, **latest} if keyframe else latest
+        for key, payload in changed.items():
+            previous = None if keyframe else self._sent.get(key)
+            fields = (
+                payload
+                if previous is None
+                else {name: value for name, value in payload.items() if previous.get(name) != value}
+            )
+            if fields:
+                state.setdefault(key[0], {})[str(key[1])] = fields
+        self._sent.update(latest)
+        self._sequence += 1
+        return dumps(
+            {
+                "event": "batch",
+                "seq": self._sequence,
+                "keyframe": keyframe,
+                "events": others,
+                "state": state,
+            }
+        ).decode()
+
+
+class _SseClient(_Client):
+    def deliver(self, event: EncodedEvent, frame: SseFrame) -> bool:
+        return self.outbox.put(frame)
+
+
 class RealtimeChannelManager:
-    """Keeps track of active realtime connections and pushes broadcast events."""
+    """Keeps track of active realtime connections and pushes broadcast events.
+
+    Every WebSocket and SSE client has its own bounded :class:`Outbox`, so a broadcast
+    only enqueues and never waits on a slow client. Clients are indexed by the event
+    types they subscribed to, so a broadcast only visits interested clients. SSE frames
+    carry the broadcast backend's sequence number as ``id``, which is the same in every
+    worker, and the most recent frames are kept in a replay buffer so that a client
+    reconnecting with ``Last-Event-ID`` catches up from memory.
+    """
 
     def __init__(self) -> None:
-        self._websockets: set[WebSocket] = set()
-        self._sse_queues: Dict[int, asyncio.Queue[str]] = {}
-        self._lock = asyncio.Lock()
+        self._websockets: dict[WebSocket, _WebSocketClient] = {}
+        self._sse_clients: set[_SseClient] = set()
+        # Event type -> subscribed clients; ``None`` holds clients without a type filter.
+        self._index: dict[str | None, set[_Client]] = {}
+        self._sequence = 0
+        self._replay: deque[tuple[int, EncodedEvent, SseFrame]] | None = None
+        # Lowest ``Last-Event-ID`` the replay buffer can resume from, before eviction;
+        # ``None`` after an event without a sequence number, until the next one.
+        self._resume_floor: int | None = 0
+        self._listeners: list[Callable[[EncodedEvent], None]] = []
+        self._snapshot_version: Callable[[], Hashable] | None = None
+        self._snapshot_build: Callable[[], dict[str, list[dict]]] | None = None
+        self._snapshot_cache: tuple[Hashable, EncodedEvent] | None = None
+        self._backend: BroadcastBackend = InMemoryBackend(self.deliver)
+
+    async def start(self) -> None:
+        """Connect the configured broadcast backend."""
+
+        settings = get_settings()
+        if settings.realtime_backend == "unix":
+            self._backend = UnixSocketBackend(self.deliver, settings.realtime_unix_socket_path)
+        else:
+            self._backend = InMemoryBackend(self.deliver)
+        await self._backend.start()
+
+    async def stop(self) -> None:
+        await self._backend.stop()
+        self._backend = InMemoryBackend(self.deliver)
+
+    def add_listener(self, listener: Callable[[EncodedEvent], None]) -> None:
+        """Call ``listener`` for every event delivered to this process, local or remote."""
+
+        self._listeners.append(listener)
+
+    def set_snapshot_source(
+        self, version: Callable[[], Hashable], build: Callable[[], dict[str, list[dict]]]
+    ) -> None:
+        """Send new clients a ``snapshot`` event built from in-memory state.
+
+        ``build`` returns the payloads of every :data:`SNAPSHOT_SECTIONS` section and
+        ``version`` changes whenever that result would. The unfiltered snapshot is encoded
+        once per version, so a reconnect storm costs neither database work nor repeated
+        serialization.
+        """
+
+        self._snapshot_version = version
+        self._snapshot_build = build
+        self._snapshot_cache = None
+
+    def snapshot(self, subscription: Subscription = ALL_EVENTS) -> EncodedEvent | None:
+        if self._snapshot_version is None or self._snapshot_build is None:
+            return None
+        if subscription == ALL_EVENTS:
+            version = self._snapshot_version()
+            if self._snapshot_cache is None or self._snapshot_cache[0] != version:
+                self._snapshot_cache = (version, encode_event("snapshot", self._snapshot_build()))
+            return self._snapshot_cache[1]
+        sections = {
+            name: [payload for payload in payloads if subscription.allows(payload)]
+            for name, payloads in self._snapshot_build().items()
+            if subscription.events is None or SNAPSHOT_SECTIONS.get(name) in subscription.events
+        }
+        return encode_event("snapshot", sections)
+
+    def _replay_buffer(self) -> deque[tuple[int, EncodedEvent, SseFrame]]:
+        if self._replay is None:
+            self._replay = deque(maxlen=max(0, get_settings().realtime_replay_buffer_size))
+        return self._replay
+
+    def _can_resume(self, last_event_id: int) -> bool:
+        """Whether every frame after ``last_event_id`` is still in the replay buffer."""
 
-    async def register_websocket(self, websocket: WebSocket) -> None:
+        buffer = self._replay_buffer()
+        if self._resume_floor is None or not buffer:
+            return False
+        return max(self._resume_floor, buffer[0][0] - 1) <= last_event_id <= buffer[-1][0]
+
+    def _new_outbox(self) -> Outbox:
+        settings = get_settings()
+        return Outbox(settings.realtime_queue_size, settings.realtime_overflow_policy)
+
+    def _add_to_index(self, client: _Client) -> None:
+        for key in client.subscription.events or (None,):
+            self._index.setdefault(key, set()).add(client)
+
+    def _remove_from_index(self, client: _Client) -> None:
+        for key in client.subscription.events or (None,):
+            clients = self._index.get(key)
+            if clients is not None:
+                clients.discard(client)
+                if not clients:
+                    del self._index[key]
+
+    def _subscribers(self, event: str) -> list[_Client]:
+        return [*self._index.get(None, ()), *self._index.get(event, ())]
+
+    def subscribe(self, client: _Client, subscription: Subscription) -> None:
+        self._remove_from_index(client)
+        client.subscription = subscription
+        self._add_to_index(client)
+
+    async def register_websocket(
+        self,
+        websocket: WebSocket,
+        subscription: Subscription = ALL_EVENTS,
+        protocol: WireProtocol = "json",
+        interval_ms: float | None = None,
+    ) -> None:
         await websocket.accept()
-        async with self._lock:
-            self._websockets.add(websocket)
+        if protocol == "delta":
+            settings = get_settings()
+            client: _WebSocketClient = _DeltaWebSocketClient(
+                websocket,
+                self._new_outbox(),
+                subscription,
+                interval=(interval_ms or settings.realtime_delta_interval_ms) / 1000,
+                keyframe_interval=settings.realtime_keyframe_interval_seconds,
+            )
+        else:
+            client = _WebSocketClient(websocket, self._new_outbox(), subscription)
+        self._websockets[websocket] = client
+        if (snapshot := self.snapshot(subscription)) is not None:
+            client.outbox.put(snapshot)
+        self._add_to_index(client)
+        client.writer = asyncio.create_task(self._write_websocket(client))
 
     async def unregister_websocket(self, websocket: WebSocket) -> None:
-        async with self._lock:
-            self._websockets.discard(websocket)
+        client = self._websockets.get(websocket)
+        if client is None:
+            return
+        self._discard(client)
+        client.outbox.close()
+        if client.writer is not None and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+            try:
+                await client.writer
+            except asyncio.CancelledError:
+                pass
 
-    async def register_sse(self) -> AsyncIterator[Iterable[str]]:
-        queue: asyncio.Queue[str] = asyncio.Queue()
-        ident = id(queue)
-        async with self._lock:
-            self._sse_queues[ident] = queue
+    async def handle_websocket_message(self, websocket: WebSocket, message: str) -> None:
+        """Apply a client control message such as ``{"action": "subscribe", ...}``."""
 
+        client = self._websockets.get(websocket)
+        if client is None:
+            return
         try:
-            while True:
-                payload = await queue.get()
-                yield payload
+            data = json.loads(message)
+            if not isinstance(data, dict) or data.get("action") != "subscribe":
+                raise ValueError("Unsupported message")
+            subscription = Subscription.from_params(
+                events=data.get("events"),
+                device_ids=data.get("device_ids"),
+                locations=data.get("locations"),
+                min_severity=data.get("min_severity"),
+            )
+        except (TypeError, ValueError) as exc:
+            client.outbox.put(encode_event("error", {"detail": str(exc)}))
+            return
+        self.subscribe(client, subscription)
+        client.outbox.put(encode_event("subscribed", subscription.describe()))
+
+    def _discard(self, client: _Client) -> None:
+        self._remove_from_index(client)
+        if isinstance(client, _WebSocketClient):
+            if self._websockets.get(client.websocket) is client:
+                del self._websockets[client.websocket]
+        else:
+            self._sse_clients.discard(client)
+
+    async def _write_websocket(self, client: _WebSocketClient) -> None:
+        websocket = client.websocket
+        try:
+            while (event := await client.outbox.get()) is not None:
+                if isinstance(client, _DeltaWebSocketClient):
+                    await asyncio.sleep(client.interval)
+                    await websocket.send_text(client.frame([event, *client.outbox.drain()]))
+                else:
+                    await websocket.send_text(event.text)
+            # The outbox overflowed under the "disconnect" policy; ask the client to retry.
+            await websocket.close(code=1013)
+        except Exception:
+            pass
         finally:
-            async with self._lock:
-                self._sse_queues.pop(ident, None)
+            self._discard(client)
 
-    async def broadcast(self, envelope: BroadcastEnvelope) -> None:
-        data = envelope.model_dump()
-        payload = json.dumps(data, default=str)
-        async with self._lock:
-            websockets = list(self._websockets)
-            queues = list(self._sse_queues.values())
+    async def register_sse(
+        self, last_event_id: int | None = None, subscription: Subscription = ALL_EVENTS
+    ) -> AsyncIterator[bytes]:
+        """Yield SSE frames for one client.
 
-        coroutines = [ws.send_text(payload) for ws in websockets]
-        if coroutines:
-            await asyncio.gather(*coroutines, return_exceptions=True)
+        A client resuming with a ``last_event_id`` the replay buffer can serve gets the
+        frames it missed; any other client starts with a ``snapshot`` frame.
+        """
 
-        for queue in queues:
-            await queue.put(f"data: {payload}\n\n")
+        client = _SseClient(self._new_outbox(), subscription)
+        self._sse_clients.add(client)
+        self._add_to_index(client)
+        replay: list[SseFrame] = []
+        if last_event_id is not None and self._can_resume(last_event_id):
+            replay = [
+                frame
+                for seq, event, frame in self._replay_buffer()
+                if seq > last_event_id
+                and (subscription.events is None or event.event in subscription.events)
+                and subscription.matches(event)
+            ]
+        elif (snapshot := self.snapshot(subscription)) is not None:
+            replay = [SseFrame(None, snapshot.sse_frame)]
+
+        try:
+            for frame in replay:
+                yield frame.data
+            while (frame := await client.outbox.get()) is not None:
+                yield frame.data
+        finally:
+            self._discard(client)
+
+    async def broadcast(self, event: EncodedEvent | BroadcastEnvelope) -> None:
+        """Publish an event to subscribers of every process sharing the backend.
+
+        The event is serialized once; all subscribers share the same text and SSE frame.
+        """
+
+        if isinstance(event, BroadcastEnvelope):
+            event = encode_event(event.event, event.payload, event.created_at)
+        await self._backend.publish(event)
+
+    async def deliver(self, event: EncodedEvent, sequence: int | None = None) -> None:
+        """Fan an event out to the matching clients of this process.
+
+        ``sequence`` is the backend's sequence number for the event. A gap in the
+        numbers, or an event without one, means this process may have missed events, so
+        SSE clients cannot resume from before it. Delivery only enqueues into each
+        client's outbox.
+        """
+
+        started = time.perf_counter()
+        for listener in self._listeners:
+            listener(event)
+        buffer = self._replay_buffer()
+        if sequence is None:
+            self._resume_floor = None
+            frame = SseFrame(event.key, event.sse_frame)
+        else:
+            if self._resume_floor is None or sequence != self._sequence + 1:
+                buffer.clear()
+                self._resume_floor = sequence
+            self._sequence = sequence
+            frame = SseFrame(event.key, b"id: %d\n" % sequence + event.sse_frame)
+            buffer.append((sequence, event, frame))
+        for client in self._subscribers(event.event):
+            if client.subscription.matches(event) and not client.deliver(event, frame):
+                self._discard(client)
+        FANOUT_LATENCY.observe(time.perf_counter() - started)
+        EVENTS_DELIVERED.inc(labels=(event.event,))
 
     async def emit(self, event: str, payload: dict) -> None:
-        envelope = BroadcastEnvelope(event=event, payload=payload)
-        await self.broadcast(envelope)
+        await self.broadcast(encode_event(event, payload))
 
 
 manager = RealtimeChannelManager()
 
+registry.gauge(
+    "iot_realtime_clients",
+    "Connected realtime clients.",
+    lambda: [(("websocket",), len(manager._websockets)), (("sse",), len(manager._sse_clients))],
+    ("transport",),
+)
+registry.gauge(
+    "iot_realtime_outbox_depth",
+    "Events queued for delivery across all realtime clients.",
+    lambda: sum(
+        len(client.outbox) for client in (*manager._websockets.values(), *manager._sse_clients)
+    ),
+)
+
+
+def parse_last_event_id(value: str | None) -> int | None:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
 
-async def sse_endpoint() -> EventSourceResponse:
+async def sse_endpoint(
+    last_event_id: str | None = None, subscription: Subscription = ALL_EVENTS
+) -> StreamingResponse:
     async def event_publisher():
-        async for payload in manager.register_sse():
-            yield payload
+        async for frame in manager.register_sse(parse_last_event_id(last_event_id), subscription):
+            yield frame
 
-    return EventSourceResponse(event_publisher())
+    return StreamingResponse(
+        event_publisher(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
-__all__ = ["RealtimeChannelManager", "manager", "sse_endpoint"]
+__all__ = [
+    "Outbox",
+    "SseFrame",
+    "Subscription",
+    "WireProtocol",
+    "RealtimeChannelManager",
+    "manager",
+    "sse_endpoint",
+]
@@ -0,0 +1,205 @@
+"""Time-based retention for the high-volume tables.
+
+Each policy deletes rows older than its TTL in small transactions of
+``retention_chunk_size`` rows, yielding to the event loop between chunks so ingestion
+is never blocked behind one long delete. Raw environment readings are safe to expire
+because their 1m/1h/1d rollups remain: before deleting any, the pass backfills rollups
+for readings stored before rollups were maintained. Expiring the 1m rollups in turn
+leaves the coarser buckets as the downsampled history. On SQLite the pass can finish with an
+incremental VACUUM so freed pages are returned to the filesystem; the one-off conversion to
+incremental auto_vacuum that this needs is done by :func:`prepare_sqlite_auto_vacuum` on
+startup, never by the periodic pass.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import ColumnElement, delete, select, text, true
+
+from .config import Settings, get_settings
+from .db import get_engine, get_session_factory
+from .models import AlarmEvent, EnvironmentReading, EnvironmentRollup, RealTimeDispatchLog
+from .rollups import backfill_rollups
+
+logger = logging.getLogger(__name__)
+
+# Pages released per ``PRAGMA incremental_vacuum`` step.
+VACUUM_PAGES_PER_STEP = 1024
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    name: str
+    model: Any
+    ttl_setting: str
+    timestamp: str = "created_at"
+    condition: Any = None
+
+    def ttl(self, settings: Settings) -> timedelta | None:
+        hours = getattr(settings, self.ttl_setting)
+        return timedelta(hours=hours) if hours > 0 else None
+
+    def expired(self, cutoff: datetime) -> ColumnElement[bool]:
+        clause = getattr(self.model, self.timestamp) < cutoff
+        return clause & (self.condition if self.condition is not None else true())
+
+
+POLICIES = (
+    RetentionPolicy("environment_readings", EnvironmentReading, "retention_environment_hours"),
+    RetentionPolicy(
+        "environment_rollups_1m",
+        EnvironmentRollup,
+        "retention_minute_rollup_hours",
+        timestamp="bucket_start",
+        condition=EnvironmentRollup.bucket == "1m",
+    ),
+    RetentionPolicy("alarm_events", AlarmEvent, "retention_alarm_hours"),
+    RetentionPolicy("realtime_dispatch_log", RealTimeDispatchLog, "retention_dispatch_log_hours"),
+)
+
+
+@dataclass
+class RetentionReport:
+    pruned: dict[str, int] = field(default_factory=dict)
+    rollups_backfilled: int = 0
+    bytes_reclaimed: int | None = None
+    duration_seconds: float = 0.0
+
+    @property
+    def total_pruned(self) -> int:
+        return sum(self.pruned.values())
+
+
+def retention_enabled(settings: Settings | None = None) -> bool:
+    settings = settings or get_settings()
+    return any(policy.ttl(settings) is not None for policy in POLICIES)
+
+
+async def prune_policy(policy: RetentionPolicy, cutoff: datetime, chunk_size: int) -> int:
+    """Delete rows matched by ``policy`` older than ``cutoff``, one chunk per transaction."""
+
+    factory = get_session_factory()
+    pruned = 0
+    while True:
+        async with factory() as session:
+            ids = (
+                select(policy.model.id)
+                .where(policy.expired(cutoff))
+                .order_by(policy.model.id)
+                .limit(chunk_size)
+            )
+            result = await session.execute(
+                delete(policy.model).where(policy.model.id.in_(ids.scalar_subquery()))
+            )
+            await session.commit()
+        pruned += result.rowcount
+        if result.rowcount < chunk_size:
+            return pruned
+        await asyncio.sleep(0)
+
+
+async def _sqlite_size() -> int | None:
+    engine = get_engine()
+    if engine.dialect.name != "sqlite":
+        return None
+    async with engine.connect() as conn:
+        page_count = (await conn.exec_driver_sql("PRAGMA page_count")).scalar_one()
+        page_size = (await conn.exec_driver_sql("PRAGMA page_size")).scalar_one()
+    return page_count * page_size
+
+
+async def prepare_sqlite_auto_vacuum() -> None:
+    """Switch a SQLite database to incremental auto_vacuum before the app starts serving.
+
+    A new database only needs the pragma. An existing one is converted by a full VACUUM,
+    which rewrites the file and holds the write lock meanwhile; on a large database this
+    can take minutes, so it runs once at startup, before ingestion begins.
+    """
+
+    engine = get_engine()
+    if engine.dialect.name != "sqlite":
+        return
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        if (await conn.exec_driver_sql("PRAGMA auto_vacuum")).scalar_one() != 2:
+            logger.info("Converting SQLite database to incremental auto_vacuum")
+            await conn.exec_driver_sql("VACUUM")
+
+
+async def _sqlite_incremental_vacuum() -> None:
+    engine = get_engine()
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        if (await conn.exec_driver_sql("PRAGMA auto_vacuum")).scalar_one() != 2:
+            logger.warning("SQLite auto_vacuum is not incremental; skipping the vacuum step")
+            return
+        while (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar_one():
+            await conn.execute(text(f"PRAGMA incremental_vacuum({VACUUM_PAGES_PER_STEP})"))
+            await asyncio.sleep(0)
+
+
+async def run_retention(now: datetime | None = None) -> RetentionReport:
+    """Apply every configured policy once and report what was removed."""
+
+    settings = get_settings()
+    now = now or datetime.utcnow()
+    started = time.perf_counter()
+    report = RetentionReport()
+    size_before = await _sqlite_size()
+    for policy in POLICIES:
+        ttl = policy.ttl(settings)
+        if ttl is None:
+            continue
+        if policy.model is EnvironmentReading:
+            report.rollups_backfilled = await backfill_rollups(settings.retention_chunk_size)
+        report.pruned[policy.name] = await prune_policy(
+            policy, now - ttl, settings.retention_chunk_size
+        )
+    if size_before is not None:
+        if settings.retention_sqlite_vacuum and report.total_pruned:
+            await _sqlite_incremental_vacuum()
+        report.bytes_reclaimed = size_before - (await _sqlite_size() or 0)
+    report.duration_seconds = time.perf_counter() - started
+    return report
+
+
+async def retention_worker(stop_event: asyncio.Event) -> None:
+    """Run retention passes every ``retention_interval_seconds`` until stopped."""
+
+    interval = get_settings().retention_interval_seconds
+    while not stop_event.is_set():
+        try:
+            report = await run_retention()
+        except Exception:  # pragma: no cover - the next pass retries
+            logger.exception("Retention pass failed")
+        else:
+            logger.info(
+                "Retention pruned %d rows %s, backfilled %d into rollups, reclaimed %s bytes in %.2fs",
+                report.total_pruned,
+                report.pruned,
+                report.rollups_backfilled,
+                report.bytes_reclaimed,
+                report.duration_seconds,
+            )
+        try:
+            await asyncio.wait_for(stop_event.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+__all__ = [
+    "POLICIES",
+    "RetentionPolicy",
+    "RetentionReport",
+    "prepare_sqlite_auto_vacuum",
+    "retention_enabled",
+    "retention_worker",
+    "run_retention",
+]
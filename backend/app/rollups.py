@@ -0,0 +1,260 @@
+"""Time-bucketed rollups of environment readings.
+
+Rollups are maintained incrementally by the ingestion path: every batch of readings is
+aggregated in memory and merged into ``environment_rollups`` with a single upsert in the
+same transaction, so long-range charts read a few hundred pre-aggregated rows instead of
+the raw readings. Readings stored before rollups existed are folded in by
+:func:`backfill_rollups`, which retention runs before it deletes raw readings.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable, Sequence
+
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .db import get_session_factory, get_upsert_insert
+from .models import EnvironmentReading, EnvironmentRollup
+
+ROLLUP_BUCKETS: dict[str, timedelta] = {
+    "1m": timedelta(minutes=1),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+}
+METRICS = ("temperature", "humidity", "air_quality_index")
+# Thirteen bound parameters per row keeps a chunk below SQLite's variable limit.
+ROLLUP_CHUNK_SIZE = 1000
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _naive_utc(moment: datetime) -> datetime:
+    """Return ``moment`` as the naive UTC datetime the tables store."""
+
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def bucket_start(moment: datetime, bucket: str) -> datetime:
+    size = ROLLUP_BUCKETS[bucket]
+    return _EPOCH + ((_naive_utc(moment) - _EPOCH) // size) * size
+
+
+def aggregate_readings(readings: Iterable[EnvironmentReading]) -> list[dict[str, Any]]:
+    """Fold readings into one rollup row per location, bucket size and bucket start."""
+
+    groups: dict[tuple[str, str, datetime], dict[str, Any]] = {}
+    for reading in readings:
+        for bucket in ROLLUP_BUCKETS:
+            key = (reading.location, bucket, bucket_start(reading.created_at, bucket))
+            row = groups.get(key)
+            if row is None:
+                row = groups[key] = {
+                    "location": key[0],
+                    "bucket": key[1],
+                    "bucket_start": key[2],
+                    "count": 0,
+                }
+                for metric in METRICS:
+                    value = getattr(reading, metric)
+                    row[f"{metric}_min"] = value
+                    row[f"{metric}_max"] = value
+                    row[f"{metric}_sum"] = 0.0
+            row["count"] += 1
+            for metric in METRICS:
+                value = getattr(reading, metric)
+                row[f"{metric}_sum"] += value
+                if value < row[f"{metric}_min"]:
+                    row[f"{metric}_min"] = value
+                if value > row[f"{metric}_max"]:
+                    row[f"{metric}_max"] = value
+    return list(groups.values())
+
+
+async def update_rollups(session: AsyncSession, readings: Sequence[EnvironmentReading]) -> None:
+    """Merge ``readings`` into the rollup table inside the caller's transaction."""
+
+    rows = aggregate_readings(readings)
+    if not rows:
+        return
+    dialect_insert = get_upsert_insert(session)
+    if dialect_insert is None:
+        await _merge_rollups(session, rows)
+        return
+
+    if session.get_bind().dialect.name == "postgresql":
+        least, greatest = func.least, func.greatest
+    else:
+        # SQLite's multi-argument min()/max() are scalar functions.
+        least, greatest = func.min, func.max
+    columns = EnvironmentRollup.__table__.c
+    for offset in range(0, len(rows), ROLLUP_CHUNK_SIZE):
+        stmt = dialect_insert(EnvironmentRollup).values(rows[offset : offset + ROLLUP_CHUNK_SIZE])
+        excluded = stmt.excluded
+        set_ = {"count": columns.count + excluded.count}
+        for metric in METRICS:
+            for suffix, combine in (
+                ("sum", lambda current, new: current + new),
+                ("min", least),
+                ("max", greatest),
+            ):
+                name = f"{metric}_{suffix}"
+                set_[name] = combine(columns[name], excluded[name])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["location", "bucket", "bucket_start"], set_=set_
+        )
+        await session.execute(stmt)
+
+
+async def _merge_rollups(session: AsyncSession, rows: list[dict[str, Any]]) -> None:
+    for row in rows:
+        stmt = select(EnvironmentRollup).where(
+            EnvironmentRollup.location == row["location"],
+            EnvironmentRollup.bucket == row["bucket"],
+            EnvironmentRollup.bucket_start == row["bucket_start"],
+        )
+        rollup = (await session.scalars(stmt)).one_or_none()
+        if rollup is None:
+            session.add(EnvironmentRollup(**row))
+            continue
+        rollup.count += row["count"]
+        for metric in METRICS:
+            setattr(rollup, f"{metric}_sum", getattr(rollup, f"{metric}_sum") + row[f"{metric}_sum"])
+            setattr(rollup, f"{metric}_min", min(getattr(rollup, f"{metric}_min"), row[f"{metric}_min"]))
+            setattr(rollup, f"{metric}_max", max(getattr(rollup, f"{metric}_max"), row[f"{metric}_max"]))
+    await session.flush()
+
+
+async def backfill_rollups(chunk_size: int = ROLLUP_CHUNK_SIZE) -> int:
+    """Fold readings that predate the rollups into them; return the readings folded in.
+
+    Every reading ingested since rollups exist is counted in its day bucket, and those
+    are the newest readings of a location. So the readings missing from the rollups are
+    all readings before the location's first day bucket plus the oldest readings of that
+    day beyond its count. They are merged newest first, one chunk per transaction, which
+    keeps that true if a pass is interrupted; once done the check finds nothing to do.
+    """
+
+    factory = get_session_factory()
+    async with factory() as session:
+        locations = list(await session.scalars(select(EnvironmentReading.location).distinct()))
+        first_days = dict(
+            (
+                await session.execute(
+                    select(EnvironmentRollup.location, func.min(EnvironmentRollup.bucket_start))
+                    .where(EnvironmentRollup.bucket == "1d")
+                    .group_by(EnvironmentRollup.location)
+                )
+            ).all()
+        )
+    backfilled = 0
+    for location in locations:
+        backfilled += await _backfill_location(location, first_days.get(location), chunk_size)
+    return backfilled
+
+
+async def _backfill_location(location: str, first_day: datetime | None, chunk_size: int) -> int:
+    factory = get_session_factory()
+    stmt = (
+        select(EnvironmentReading)
+        .where(EnvironmentReading.location == location)
+        .order_by(EnvironmentReading.created_at.desc(), EnvironmentReading.id.desc())
+    )
+    skip = 0
+    if first_day is not None:
+        day_end = first_day + ROLLUP_BUCKETS["1d"]
+        stmt = stmt.where(EnvironmentReading.created_at < day_end)
+        async with factory() as session:
+            rolled_up = await session.scalar(
+                select(EnvironmentRollup.count).where(
+                    EnvironmentRollup.location == location,
+                    EnvironmentRollup.bucket == "1d",
+                    EnvironmentRollup.bucket_start == first_day,
+                )
+            )
+            stored = await session.scalar(
+                select(func.count())
+                .select_from(EnvironmentReading)
+                .where(
+                    EnvironmentReading.location == location,
+                    EnvironmentReading.created_at >= first_day,
+                    EnvironmentReading.created_at < day_end,
+                )
+            )
+        # Retention may already have removed some of the day's readings.
+        skip = min(rolled_up or 0, stored or 0)
+
+    backfilled = 0
+    cursor: tuple[datetime, int] | None = None
+    while True:
+        chunk_stmt = stmt.limit(chunk_size)
+        if cursor is None:
+            chunk_stmt = chunk_stmt.offset(skip)
+        else:
+            chunk_stmt = chunk_stmt.where(
+                tuple_(EnvironmentReading.created_at, EnvironmentReading.id) < tuple_(*cursor)
+            )
+        async with factory() as session:
+            readings = list(await session.scalars(chunk_stmt))
+            if not readings:
+                return backfilled
+            cursor = (readings[-1].created_at, readings[-1].id)
+            await update_rollups(session, readings)
+            await session.commit()
+        backfilled += len(readings)
+        await asyncio.sleep(0)
+
+
+def rollup_payload(rollup: EnvironmentRollup) -> dict[str, Any]:
+    payload: dict[str, Any] = {
+        "location": rollup.location,
+        "bucket": rollup.bucket,
+        "bucket_start": rollup.bucket_start,
+        "count": rollup.count,
+    }
+    for metric in METRICS:
+        payload[f"{metric}_min"] = getattr(rollup, f"{metric}_min")
+        payload[f"{metric}_max"] = getattr(rollup, f"{metric}_max")
+        payload[f"{metric}_avg"] = getattr(rollup, f"{metric}_sum") / rollup.count
+    return payload
+
+
+async def query_rollups(
+    session: AsyncSession,
+    bucket: str,
+    location: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    limit: int = 1000,
+) -> list[dict[str, Any]]:
+    """Return rollups in ascending bucket order; without ``start`` the newest buckets win."""
+
+    stmt = select(EnvironmentRollup).where(EnvironmentRollup.bucket == bucket)
+    if location is not None:
+        stmt = stmt.where(EnvironmentRollup.location == location)
+    if start is not None:
+        stmt = stmt.where(EnvironmentRollup.bucket_start >= bucket_start(start, bucket))
+    if end is not None:
+        stmt = stmt.where(EnvironmentRollup.bucket_start < _naive_utc(end))
+    if start is None:
+        stmt = stmt.order_by(EnvironmentRollup.bucket_start.desc(), EnvironmentRollup.location)
+        rollups = list(await session.scalars(stmt.limit(limit)))
+        rollups.reverse()
+    else:
+        stmt = stmt.order_by(EnvironmentRollup.bucket_start, EnvironmentRollup.location)
+        rollups = list(await session.scalars(stmt.limit(limit)))
+    return [rollup_payload(rollup) for rollup in rollups]
+
+
+__all__ = [
+    "ROLLUP_BUCKETS",
+    "aggregate_readings",
+    "backfill_rollups",
+    "bucket_start",
+    "query_rollups",
+    "update_rollups",
+]
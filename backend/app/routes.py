@@ -2,93 +2,514 @@
 
 from __future__ import annotations
 
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from sqlalchemy import select
+import asyncio
+import codecs
+import json
+import logging
+import secrets
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, AsyncIterator, Literal
 
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import Select, select
+
+from .config import get_settings
 from .data_ingestion import (
     handle_alarm,
     handle_device_status,
     handle_environment_update,
+    ingest_bulk,
+)
+from .db import get_read_session, pool_metrics
+from .export import (
+    COLUMNAR_FORMATS,
+    EXPORT_MEDIA_TYPES,
+    columnar_available,
+    stream_export,
+    table_exists,
 )
-from .db import get_async_session
-from .models import AlarmEvent, DeviceStatus, EnvironmentReading
-from .realtime import manager, sse_endpoint
+from .models import AlarmEvent, EnvironmentReading
+from .pagination import paginate, split_page
+from .profiling import sample_stacks, slow_traces
+from .realtime import Subscription, WireProtocol, manager, sse_endpoint
+from .rollups import query_rollups
+from .state import device_cache, latest_readings
 from .schemas import (
     AlarmEventIn,
     AlarmEventOut,
+    BulkIngestResult,
+    BulkRowError,
     DeviceStatusIn,
     DeviceStatusOut,
+    EnvironmentAggregateOut,
     EnvironmentReadingIn,
     EnvironmentReadingOut,
 )
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+MAX_REPORTED_BULK_ERRORS = 100
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _decode_ndjson_line(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError as exc:
+        return exc
+
+
+_JSON_DECODER = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+class _MalformedArray(ValueError):
+    pass
+
+
+async def _iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """Yield the elements of a JSON array as soon as each one has been received.
+
+    Raises :class:`_MalformedArray` where the body stops being a well-formed array.
+    """
+
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    started = False
+    finished = False
+    after_comma = False
+    chunk_iter = chunks.__aiter__()
+    while True:
+        try:
+            chunk = await chunk_iter.__anext__()
+        except StopAsyncIteration:
+            buffer = buffer[position:] + decoder.decode(b"", final=True)
+            position = 0
+            final = True
+        else:
+            buffer = buffer[position:] + decoder.decode(chunk)
+            position = 0
+            final = False
+        while True:
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            if position == len(buffer):
+                break
+            if finished:
+                raise _MalformedArray("Unexpected data after the array")
+            if not started:
+                if buffer[position] != "[":
+                    raise _MalformedArray("Expected a JSON array")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                if after_comma:
+                    raise _MalformedArray("Trailing comma in array")
+                finished = True
+                position += 1
+                continue
+            try:
+                element, end = _JSON_DECODER.raw_decode(buffer, position)
+            except ValueError as exc:
+                if final:
+                    raise _MalformedArray(str(exc)) from exc
+                break
+            # A number or literal cut off by the chunk boundary decodes too early, so an
+            # element only counts once the delimiter after it has arrived.
+            delimiter = end
+            while delimiter < len(buffer) and buffer[delimiter] in _WHITESPACE:
+                delimiter += 1
+            if delimiter == len(buffer):
+                if final:
+                    raise _MalformedArray("Unterminated array")
+                break
+            if buffer[delimiter] not in ",]":
+                if delimiter == end and not final:
+                    break
+                raise _MalformedArray(f"Expected ',' or ']' at character {delimiter}")
+            after_comma = buffer[delimiter] == ","
+            position = delimiter + 1 if after_comma else delimiter
+            yield element
+        if final:
+            if not finished:
+                raise _MalformedArray("Unterminated array" if started else "Expected a JSON array")
+            return
+
+
+async def _iter_bulk_rows(request: Request) -> AsyncIterator[Any]:
+    """Yield decoded rows from a JSON array or NDJSON body while it is being received.
+
+    Lines of an NDJSON stream that are not valid JSON are yielded as the decoding error. A
+    JSON array that turns out to be malformed is rejected with 400 if no row has been
+    yielded yet; otherwise the error is yielded as the last row, since earlier rows may
+    already be stored.
+    """
+
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        pending = b""
+        async for chunk in request.stream():
+            pending += chunk
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield _decode_ndjson_line(line)
+        if pending.strip():
+            yield _decode_ndjson_line(pending)
+        return
+
+    yielded = False
+    try:
+        async for row in _iter_json_array(request.stream()):
+            yielded = True
+            yield row
+    except _MalformedArray as exc:
+        if not yielded:
+            raise HTTPException(
+                status_code=400, detail="Expected a JSON array or an NDJSON body"
+            ) from exc
+        yield ValueError(f"{exc}; the rest of the body was not read")
+
+
+def _parse_if_none_match(header: str | None) -> set[str]:
+    if not header:
+        return set()
+    return {tag.strip() for tag in header.split(",")}
+
+
+async def _bulk_ingest(request: Request, schema: type[BaseModel], kind: str) -> BulkIngestResult:
+    """Validate and store a bulk upload one ``ingest_batch_size`` chunk per transaction.
+
+    Rows are reported individually when they fail validation. When storing a chunk
+    fails, none of its rows are stored: they count as rejected, with one error at the
+    chunk's first index naming the index range, and the remaining chunks are still
+    attempted.
+    """
+
+    result = BulkIngestResult()
+    batch_size = max(1, get_settings().ingest_batch_size)
+    pending: list[dict] = []
+    pending_indexes: list[int] = []
+
+    def report(index: int, detail: Any) -> None:
+        if len(result.errors) < MAX_REPORTED_BULK_ERRORS:
+            result.errors.append(BulkRowError(index=index, detail=detail))
+
+    async def flush() -> None:
+        if not pending:
+            return
+        try:
+            result.accepted += len(await ingest_bulk(kind, pending))
+        except Exception:
+            logger.exception("Bulk %s ingestion failed for %d rows", kind, len(pending))
+            result.rejected += len(pending)
+            first, last = pending_indexes[0], pending_indexes[-1]
+            report(
+                first,
+                f"Database error: the {len(pending)} valid rows at indexes {first}-{last} were not stored",
+            )
+        pending.clear()
+        pending_indexes.clear()
+
+    index = -1
+    async for row in _iter_bulk_rows(request):
+        index += 1
+        if isinstance(row, ValueError):
+            detail: Any = f"Invalid JSON: {row}"
+        else:
+            try:
+                model = schema.model_validate(row)
+            except ValidationError as exc:
+                detail = exc.errors(include_url=False, include_context=False, include_input=False)
+            else:
+                pending.append(model.model_dump())
+                pending_indexes.append(index)
+                if len(pending) >= batch_size:
+                    await flush()
+                continue
+        result.rejected += 1
+        report(index, detail)
+    await flush()
+    return result
+
+
+def _subscription_from_query(
+    events: list[str] | None,
+    device_id: list[str] | None,
+    location: list[str] | None,
+    min_severity: str | None,
+) -> Subscription:
+    return Subscription.from_params(
+        events=events, device_ids=device_id, locations=location, min_severity=min_severity
+    )
 
 
 @router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket) -> None:
-    await manager.register_websocket(websocket)
+async def websocket_endpoint(
+    websocket: WebSocket,
+    events: list[str] | None = Query(None),
+    device_id: list[str] | None = Query(None),
+    location: list[str] | None = Query(None),
+    min_severity: str | None = None,
+    protocol: WireProtocol = "json",
+    interval_ms: float | None = Query(None, ge=10, le=10_000),
+) -> None:
+    try:
+        subscription = _subscription_from_query(events, device_id, location, min_severity)
+    except ValueError:
+        await websocket.close(code=1008)
+        return
+    await manager.register_websocket(websocket, subscription, protocol, interval_ms)
     try:
         while True:
-            await websocket.receive_text()
-    except WebSocketDisconnect:
+            message = await websocket.receive_text()
+            await manager.handle_websocket_message(websocket, message)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
         await manager.unregister_websocket(websocket)
 
 
 @router.get("/events")
-async def events_stream():
-    return await sse_endpoint()
+async def events_stream(
+    request: Request,
+    events: list[str] | None = Query(None),
+    device_id: list[str] | None = Query(None),
+    location: list[str] | None = Query(None),
+    min_severity: str | None = None,
+):
+    try:
+        subscription = _subscription_from_query(events, device_id, location, min_severity)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    return await sse_endpoint(
+        last_event_id=request.headers.get("last-event-id"), subscription=subscription
+    )
 
 
 @router.post("/environment", response_model=EnvironmentReadingOut)
 async def post_environment_reading(payload: EnvironmentReadingIn):
-    await handle_environment_update(payload.model_dump())
-    async with get_async_session() as session:
-        stmt = select(EnvironmentReading).order_by(EnvironmentReading.id.desc())
-        result = await session.execute(stmt)
-        return result.scalars().first()
+    return await handle_environment_update(payload.model_dump())
+
+
+@router.post("/environment/bulk", response_model=BulkIngestResult)
+async def post_environment_readings_bulk(request: Request):
+    return await _bulk_ingest(request, EnvironmentReadingIn, "environment")
+
+
+async def _list_page(
+    response: Response,
+    stmt: Select[Any],
+    model: Any,
+    cursor: str | None,
+    limit: int,
+    start: datetime | None,
+    end: datetime | None,
+) -> list[Any]:
+    """Run a keyset-paginated listing and expose the next cursor in ``X-Next-Cursor``.
+
+    Larger ``limit`` values are clamped to ``MAX_PAGE_SIZE``; clients page on with the cursor.
+    """
+
+    limit = min(limit, MAX_PAGE_SIZE)
+    try:
+        stmt = paginate(stmt, model, cursor, limit, start=start, end=end)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    async with get_read_session() as session:
+        rows = list(await session.scalars(stmt))
+    page, next_cursor = split_page(rows, limit)
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return page
 
 
 @router.get("/environment", response_model=list[EnvironmentReadingOut])
-async def list_environment_readings(limit: int = 20):
-    async with get_async_session() as session:
-        stmt = select(EnvironmentReading).order_by(EnvironmentReading.created_at.desc()).limit(limit)
-        result = await session.execute(stmt)
-        return list(result.scalars())
+async def list_environment_readings(
+    response: Response,
+    limit: int = Query(20, ge=1),
+    cursor: str | None = None,
+    location: str | None = None,
+    start: datetime | None = Query(None, alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+):
+    stmt = select(EnvironmentReading)
+    if location is not None:
+        stmt = stmt.where(EnvironmentReading.location == location)
+    return await _list_page(response, stmt, EnvironmentReading, cursor, limit, start, end)
+
+
+@lru_cache(maxsize=1)
+def _latest_readings_out(etag: str) -> list[dict]:
+    """The latest readings serialized like ``EnvironmentReadingOut``, once per ``etag``."""
+
+    return [
+        EnvironmentReadingOut.model_validate(payload).model_dump(mode="json", by_alias=True)
+        for payload in latest_readings.list()
+    ]
+
+
+@router.get("/environment/latest", response_model=list[EnvironmentReadingOut])
+async def latest_environment_readings(request: Request, location: list[str] | None = Query(None)):
+    etag = latest_readings.etag
+    if etag in _parse_if_none_match(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers={"ETag": etag})
+    readings = _latest_readings_out(etag)
+    if location is not None:
+        wanted = set(location)
+        readings = [reading for reading in readings if reading["location"] in wanted]
+    return JSONResponse(readings, headers={"ETag": etag})
+
+
+@router.get("/environment/aggregate", response_model=list[EnvironmentAggregateOut])
+async def aggregate_environment_readings(
+    bucket: Literal["1m", "1h", "1d"] = "1h",
+    location: str | None = None,
+    start: datetime | None = Query(None, alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+    limit: int = Query(1000, ge=1, le=10_000),
+):
+    async with get_read_session() as session:
+        return await query_rollups(
+            session, bucket, location=location, start=start, end=end, limit=limit
+        )
 
 
 @router.post("/devices", response_model=DeviceStatusOut)
 async def post_device_status(payload: DeviceStatusIn):
-    await handle_device_status(payload.model_dump())
-    async with get_async_session() as session:
-        stmt = select(DeviceStatus).where(DeviceStatus.device_id == payload.device_id)
-        result = await session.execute(stmt)
-        return result.scalar_one()
+    return await handle_device_status(payload.model_dump())
+
+
+@router.post("/devices/bulk", response_model=BulkIngestResult)
+async def post_device_statuses_bulk(request: Request):
+    return await _bulk_ingest(request, DeviceStatusIn, "device")
 
 
 @router.get("/devices", response_model=list[DeviceStatusOut])
-async def list_devices():
-    async with get_async_session() as session:
-        stmt = select(DeviceStatus)
-        result = await session.execute(stmt)
-        return list(result.scalars())
+async def list_devices(request: Request, status: str | None = None, prefix: str | None = None):
+    etag = device_cache.etag
+    if etag in _parse_if_none_match(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(device_cache.list(status=status, prefix=prefix), headers={"ETag": etag})
 
 
 @router.post("/alarms", response_model=AlarmEventOut)
 async def post_alarm(payload: AlarmEventIn):
-    await handle_alarm(payload.model_dump())
-    async with get_async_session() as session:
-        stmt = select(AlarmEvent).order_by(AlarmEvent.id.desc())
-        result = await session.execute(stmt)
-        return result.scalars().first()
+    return await handle_alarm(payload.model_dump())
+
+
+@router.post("/alarms/bulk", response_model=BulkIngestResult)
+async def post_alarms_bulk(request: Request):
+    return await _bulk_ingest(request, AlarmEventIn, "alarm")
 
 
 @router.get("/alarms", response_model=list[AlarmEventOut])
-async def list_alarms(limit: int = 20):
-    async with get_async_session() as session:
-        stmt = select(AlarmEvent).order_by(AlarmEvent.created_at.desc()).limit(limit)
-        result = await session.execute(stmt)
-        return list(result.scalars())
+async def list_alarms(
+    response: Response,
+    limit: int = Query(20, ge=1),
+    cursor: str | None = None,
+    device_id: str | None = None,
+    severity: str | None = None,
+    code: str | None = None,
+    start: datetime | None = Query(None, alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+):
+    stmt = select(AlarmEvent)
+    if device_id is not None:
+        stmt = stmt.where(AlarmEvent.device_id == device_id)
+    if severity is not None:
+        stmt = stmt.where(AlarmEvent.severity == severity)
+    if code is not None:
+        stmt = stmt.where(AlarmEvent.code == code)
+    return await _list_page(response, stmt, AlarmEvent, cursor, limit, start, end)
+
+
+@router.get("/export/{table}")
+async def export_table(
+    table: Literal["environment_readings", "alarm_events", "sensor_readings"],
+    format: Literal["csv", "ndjson", "arrow", "parquet"] = "csv",
+    start: datetime | None = Query(None, alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+):
+    if format in COLUMNAR_FORMATS and not columnar_available():
+        raise HTTPException(status_code=406, detail=f"{format} export requires pyarrow")
+    if not await table_exists(table):
+        raise HTTPException(status_code=404, detail=f"Table {table} does not exist")
+    extension = "arrows" if format == "arrow" else format
+    return StreamingResponse(
+        stream_export(table, format, start=start, end=end),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{extension}"'},
+    )
+
+
+@router.get("/db/pool")
+async def database_pool_metrics() -> dict[str, dict[str, Any]]:
+    return pool_metrics()
+
+
+def require_admin(authorization: str | None = Header(None)) -> None:
+    token = get_settings().admin_token
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, supplied = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(supplied, token):
+        raise HTTPException(
+            status_code=401, detail="Admin token required", headers={"WWW-Authenticate": "Bearer"}
+        )
+
+
+admin_router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+_profile_lock = asyncio.Lock()
+
+
+@admin_router.get("/traces")
+async def list_slow_traces() -> dict[str, Any]:
+    return {
+        "enabled": get_settings().profiling_enabled,
+        "recorded": slow_traces.recorded,
+        "traces": [trace.to_dict() for trace in slow_traces.slowest()],
+    }
+
+
+@admin_router.delete("/traces", status_code=204)
+async def clear_slow_traces() -> Response:
+    slow_traces.clear()
+    return Response(status_code=204)
+
+
+@admin_router.get("/profile", response_class=PlainTextResponse)
+async def profile_stacks(
+    seconds: float = Query(5.0, gt=0, le=60),
+    interval_ms: float = Query(5.0, ge=1, le=1000),
+) -> PlainTextResponse:
+    """Sample all thread stacks for ``seconds`` and return them as collapsed stacks."""
+
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already being collected")
+    async with _profile_lock:
+        stacks = await asyncio.to_thread(sample_stacks, seconds, interval_ms / 1000)
+    return PlainTextResponse(stacks)
+
+
+router.include_router(admin_router)
 
 
-__all__ = ["router"]
+__all__ = ["NEXT_CURSOR_HEADER", "router"]
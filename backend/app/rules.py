@@ -0,0 +1,221 @@
+"""Server-side alarm rules evaluated over batches of environment readings.
+
+Rules are declared in the ``alarm_rules`` setting as a JSON list, for example::
+
+    [
+      {"kind": "threshold", "code": "TEMP_HIGH", "metric": "temperature", "above": 35},
+      {"kind": "rate", "code": "HUMIDITY_JUMP", "metric": "humidity", "max_change_per_minute": 10},
+      {"kind": "zscore", "code": "AQI_ANOMALY", "metric": "air_quality_index", "threshold": 4}
+    ]
+
+Each location keeps its last ``alarm_rule_window`` readings in NumPy arrays. A
+batch is grouped by location and every rule is evaluated with array operations over the
+whole group, so the cost per batch does not depend on per-row database queries. A rule
+fires at most once per location and batch, and not again until ``cooldown_seconds`` of
+reading time have passed.
+
+Readings come from a location, not a device, so a rule alarm's ``device_id`` is the
+location with a ``location:`` prefix. That keeps it apart from alarms reported by a
+device that happens to share the name: they neither coalesce nor match each other's
+``device_id`` filters.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime
+from typing import Annotated, Any, Iterable, Literal, Sequence, Union
+
+import numpy as np
+from pydantic import BaseModel, Field, TypeAdapter
+
+from .models import EnvironmentReading
+
+Metric = Literal["temperature", "humidity", "air_quality_index"]
+METRICS: tuple[str, ...] = ("temperature", "humidity", "air_quality_index")
+
+_EPOCH = datetime(1970, 1, 1)
+LOCATION_SOURCE_PREFIX = "location:"
+
+
+class _Rule(BaseModel):
+    """Fields shared by all rules; ``violations`` flags the new values that break it."""
+
+    code: str
+    metric: Metric
+    severity: Literal["info", "warning", "critical"] = "warning"
+    locations: list[str] | None = None
+    cooldown_seconds: float = 300.0
+
+    def applies_to(self, location: str) -> bool:
+        return self.locations is None or location in self.locations
+
+
+class ThresholdRule(_Rule):
+    kind: Literal["threshold"]
+    above: float | None = None
+    below: float | None = None
+
+    def violations(
+        self, history: np.ndarray, times: np.ndarray, values: np.ndarray, stamps: np.ndarray, window: int
+    ) -> np.ndarray:
+        mask = np.zeros(len(values), dtype=bool)
+        if self.above is not None:
+            mask |= values > self.above
+        if self.below is not None:
+            mask |= values < self.below
+        return mask
+
+    def describe(self, value: float, location: str) -> str:
+        bound = "above" if self.above is not None and value > self.above else "below"
+        limit = self.above if bound == "above" else self.below
+        return f"{self.metric} {value:g} {bound} {limit:g} at {location}"
+
+
+class RateOfChangeRule(_Rule):
+    kind: Literal["rate"]
+    max_change_per_minute: float
+
+    def violations(
+        self, history: np.ndarray, times: np.ndarray, values: np.ndarray, stamps: np.ndarray, window: int
+    ) -> np.ndarray:
+        series = np.concatenate((history[-1:], values))
+        moments = np.concatenate((times[-1:], stamps))
+        elapsed = np.maximum(np.diff(moments), 1e-3) / 60
+        rates = np.abs(np.diff(series)) / elapsed
+        if len(history) == 0:
+            # The first reading of a location has nothing to compare against.
+            return np.concatenate(([False], rates > self.max_change_per_minute))
+        return rates > self.max_change_per_minute
+
+    def describe(self, value: float, location: str) -> str:
+        return f"{self.metric} changed faster than {self.max_change_per_minute:g}/min at {location}"
+
+
+class ZScoreRule(_Rule):
+    kind: Literal["zscore"]
+    threshold: float = 3.0
+    min_samples: int = 10
+
+    def violations(
+        self, history: np.ndarray, times: np.ndarray, values: np.ndarray, stamps: np.ndarray, window: int
+    ) -> np.ndarray:
+        # Score every new value against the window of readings that preceded it, using
+        # prefix sums so the whole batch is scored in O(window + batch).
+        series = np.concatenate((history, values))
+        sums = np.concatenate(([0.0], np.cumsum(series)))
+        squares = np.concatenate(([0.0], np.cumsum(series * series)))
+        positions = np.arange(len(history), len(series))
+        starts = np.maximum(positions - window, 0)
+        counts = positions - starts
+        safe = np.maximum(counts, 1)
+        means = (sums[positions] - sums[starts]) / safe
+        variances = (squares[positions] - squares[starts]) / safe - means * means
+        stds = np.sqrt(np.maximum(variances, 0.0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = np.abs(values - means) / stds
+        return (counts >= self.min_samples) & (stds > 0) & (scores > self.threshold)
+
+    def describe(self, value: float, location: str) -> str:
+        return f"{self.metric} {value:g} deviates more than {self.threshold:g} sigma at {location}"
+
+
+Rule = Annotated[Union[ThresholdRule, RateOfChangeRule, ZScoreRule], Field(discriminator="kind")]
+_RULES_ADAPTER = TypeAdapter(list[Rule])
+
+
+def parse_rules(raw: Sequence[dict[str, Any]]) -> list[Rule]:
+    return _RULES_ADAPTER.validate_python(list(raw))
+
+
+class _Window:
+    """The most recent readings of one location, oldest first, one row per metric."""
+
+    def __init__(self, size: int) -> None:
+        self._size = size
+        self.values = np.empty((len(METRICS), 0))
+        self.times = np.empty(0)
+
+    def extend(self, values: np.ndarray, times: np.ndarray) -> None:
+        self.values = np.concatenate((self.values, values), axis=1)[:, -self._size :]
+        self.times = np.concatenate((self.times, times))[-self._size :]
+
+
+class RuleEngine:
+    """Evaluates configured rules and returns alarm payloads for ``handle_alarm``."""
+
+    def __init__(self) -> None:
+        self._rules: list[Rule] = []
+        self._window_size = 120
+        self._windows: dict[str, _Window] = {}
+        self._last_fired: dict[tuple[str, str], float] = {}
+
+    @property
+    def rules(self) -> list[Rule]:
+        return list(self._rules)
+
+    def configure(self, rules: Iterable[Rule], window_size: int = 120) -> None:
+        """Install ``rules`` and forget all windows and cooldowns."""
+
+        self._rules = list(rules)
+        self._window_size = max(2, window_size)
+        self._windows.clear()
+        self._last_fired.clear()
+
+    def evaluate(self, readings: Sequence[EnvironmentReading]) -> list[dict[str, Any]]:
+        if not self._rules or not readings:
+            return []
+        grouped: dict[str, list[EnvironmentReading]] = defaultdict(list)
+        for reading in readings:
+            grouped[reading.location].append(reading)
+        alarms: list[dict[str, Any]] = []
+        for location, group in grouped.items():
+            values = np.array(
+                [[getattr(reading, metric) for metric in METRICS] for reading in group], dtype=float
+            ).T
+            stamps = np.array([(reading.created_at - _EPOCH).total_seconds() for reading in group])
+            window = self._windows.get(location)
+            if window is None:
+                window = self._windows[location] = _Window(self._window_size)
+            for rule in self._rules:
+                if not rule.applies_to(location):
+                    continue
+                row = METRICS.index(rule.metric)
+                mask = rule.violations(
+                    window.values[row], window.times, values[row], stamps, self._window_size
+                )
+                hits = np.flatnonzero(mask)
+                if hits.size:
+                    last = hits[-1]
+                    alarm = self._fire(rule, location, float(values[row][last]), float(stamps[last]))
+                    if alarm is not None:
+                        alarms.append(alarm)
+            window.extend(values, stamps)
+        return alarms
+
+    def _fire(self, rule: Rule, location: str, value: float, moment: float) -> dict[str, Any] | None:
+        key = (rule.code, location)
+        last = self._last_fired.get(key)
+        if last is not None and moment - last < rule.cooldown_seconds:
+            return None
+        self._last_fired[key] = moment
+        return {
+            "code": rule.code,
+            "message": rule.describe(value, location),
+            "severity": rule.severity,
+            "device_id": f"{LOCATION_SOURCE_PREFIX}{location}",
+        }
+
+
+rule_engine = RuleEngine()
+
+
+__all__ = [
+    "LOCATION_SOURCE_PREFIX",
+    "RateOfChangeRule",
+    "RuleEngine",
+    "ThresholdRule",
+    "ZScoreRule",
+    "parse_rules",
+    "rule_engine",
+]
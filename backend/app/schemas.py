@@ -23,6 +23,22 @@ class EnvironmentReadingOut(EnvironmentReadingIn):
     created_at: datetime
 
 
+class EnvironmentAggregateOut(BaseModel):
+    location: str
+    bucket: Literal["1m", "1h", "1d"]
+    bucket_start: datetime
+    count: int
+    temperature_min: float
+    temperature_max: float
+    temperature_avg: float
+    humidity_min: float
+    humidity_max: float
+    humidity_avg: float
+    air_quality_index_min: float
+    air_quality_index_max: float
+    air_quality_index_avg: float
+
+
 class DeviceStatusIn(BaseModel):
     device_id: str
     name: str
@@ -45,6 +61,22 @@ class AlarmEventIn(BaseModel):
 class AlarmEventOut(AlarmEventIn):
     id: int
     created_at: datetime
+    occurrence_count: int = 1
+    first_seen_at: datetime | None = None
+    last_seen_at: datetime | None = None
+
+
+class BulkRowError(BaseModel):
+    index: int
+    detail: Any
+
+
+class BulkIngestResult(BaseModel):
+    """Per-row outcome of a bulk ingestion request."""
+
+    accepted: int = 0
+    rejected: int = 0
+    errors: list[BulkRowError] = Field(default_factory=list)
 
 
 class BroadcastEnvelope(BaseModel):
@@ -58,9 +90,12 @@ class BroadcastEnvelope(BaseModel):
 __all__ = [
     "EnvironmentReadingIn",
     "EnvironmentReadingOut",
+    "EnvironmentAggregateOut",
     "DeviceStatusIn",
     "DeviceStatusOut",
     "AlarmEventIn",
     "AlarmEventOut",
+    "BulkRowError",
+    "BulkIngestResult",
     "BroadcastEnvelope",
 ]
@@ -0,0 +1,101 @@
+"""In-process views of the current system state served without database access."""
+
+from __future__ import annotations
+
+import secrets
+from typing import Iterable
+
+
+class DeviceStateCache:
+    """Authoritative map of ``device_id`` to the latest broadcast device payload.
+
+    The cache is warmed from the database at startup and written through by the
+    ingestion path after each commit. ``version`` increases on every change and is
+    combined with a per-process epoch to form the ETag served by ``GET /api/devices``.
+    """
+
+    def __init__(self) -> None:
+        self._devices: dict[str, dict] = {}
+        self._epoch = secrets.token_hex(4)
+        self.version = 0
+
+    @property
+    def etag(self) -> str:
+        return f'W/"{self._epoch}-{self.version}"'
+
+    def replace(self, payloads: Iterable[dict]) -> None:
+        """Discard the cached state and load ``payloads`` instead."""
+
+        self._devices = {payload["device_id"]: payload for payload in payloads}
+        self._epoch = secrets.token_hex(4)
+        self.version = 0
+
+    def apply(self, payload: dict) -> None:
+        self._devices[payload["device_id"]] = payload
+        self.version += 1
+
+    def get(self, device_id: str) -> dict | None:
+        return self._devices.get(device_id)
+
+    def list(self, status: str | None = None, prefix: str | None = None) -> list[dict]:
+        devices: Iterable[dict] = self._devices.values()
+        if status is not None:
+            devices = (device for device in devices if device["status"] == status)
+        if prefix:
+            devices = (device for device in devices if device["device_id"].startswith(prefix))
+        return list(devices)
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+
+class LatestReadingIndex:
+    """Map of ``location`` to the payload of its most recent environment reading.
+
+    Rebuilt from the database at startup and updated from ``environment.update`` events,
+    so ``GET /api/environment/latest`` costs O(locations) without touching the database.
+    Readings that arrive out of order never replace a newer one.
+    """
+
+    def __init__(self) -> None:
+        self._latest: dict[str, dict] = {}
+        self._epoch = secrets.token_hex(4)
+        self.version = 0
+
+    @property
+    def etag(self) -> str:
+        return f'W/"{self._epoch}-{self.version}"'
+
+    def replace(self, payloads: Iterable[dict]) -> None:
+        self._latest = {payload["location"]: payload for payload in payloads}
+        self._epoch = secrets.token_hex(4)
+        self.version = 0
+
+    def apply(self, payload: dict) -> None:
+        current = self._latest.get(payload["location"])
+        if current is not None and current["id"] > payload["id"]:
+            return
+        self._latest[payload["location"]] = payload
+        self.version += 1
+
+    def get(self, location: str) -> dict | None:
+        return self._latest.get(location)
+
+    def list(self, locations: Iterable[str] | None = None) -> list[dict]:
+        """Latest readings, most recent first, optionally limited to ``locations``."""
+
+        if locations is None:
+            readings = list(self._latest.values())
+        else:
+            readings = [self._latest[name] for name in set(locations) if name in self._latest]
+        return sorted(readings, key=lambda payload: payload["id"], reverse=True)
+
+    def __len__(self) -> int:
+        return len(self._latest)
+
+
+device_cache = DeviceStateCache()
+latest_readings = LatestReadingIndex()
+
+
+__all__ = ["DeviceStateCache", "LatestReadingIndex", "device_cache", "latest_readings"]
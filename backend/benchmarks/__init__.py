@@ -0,0 +1 @@
+"""Local micro-benchmarks and load generators for the IoT Board backend."""
@@ -0,0 +1,90 @@
+"""Compare the legacy per-subscriber broadcast serialization with the shared encoding.
+
+Run from the ``backend`` directory::
+
+    python -m benchmarks.bench_broadcast --subscribers 1000 --events 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+
+from app.encoding import encode_event
+from app.realtime import RealtimeChannelManager
+from app.schemas import BroadcastEnvelope
+
+PAYLOAD = {
+    "id": 1,
+    "device_id": "gateway-1",
+    "name": "Gateway",
+    "status": "online",
+    "meta": {"ip": "10.0.0.1", "firmware": "1.2.0"},
+    "updated_at": "2024-03-01T12:00:00",
+}
+
+
+class NullWebSocket:
+    async def accept(self) -> None:
+        return None
+
+    async def send_text(self, data: str) -> None:
+        return None
+
+
+async def legacy_broadcast(websockets: list[NullWebSocket], queues: list[asyncio.Queue]) -> None:
+    """The serialization path used before the shared encoding stage."""
+
+    envelope = BroadcastEnvelope(event="device.update", payload=dict(PAYLOAD))
+    payload = json.dumps(envelope.model_dump(), default=str)
+    await asyncio.gather(*(ws.send_text(payload) for ws in websockets), return_exceptions=True)
+    for queue in queues:
+        await queue.put(f"data: {payload}\n\n")
+
+
+async def run(subscribers: int, events: int) -> dict[str, float]:
+    websockets = [NullWebSocket() for _ in range(subscribers)]
+    queues: list[asyncio.Queue] = [asyncio.Queue() for _ in range(subscribers)]
+
+    start = time.perf_counter()
+    for _ in range(events):
+        await legacy_broadcast(websockets, queues)
+        for queue in queues:
+            queue.get_nowait()
+    legacy = time.perf_counter() - start
+
+    manager = RealtimeChannelManager()
+    for websocket in websockets:
+        await manager.register_websocket(websocket)
+    streams = [manager.register_sse() for _ in range(subscribers)]
+    for stream in streams:
+        # Prime each generator so its outbox is registered; it then waits for a frame.
+        asyncio.ensure_future(stream.__anext__())
+    await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    for _ in range(events):
+        await manager.broadcast(encode_event("device.update", dict(PAYLOAD)))
+    shared = time.perf_counter() - start
+
+    return {
+        "subscribers": subscribers,
+        "events": events,
+        "legacy_us_per_event": legacy / events * 1e6,
+        "shared_us_per_event": shared / events * 1e6,
+        "speedup": legacy / shared if shared else float("inf"),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=200)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.subscribers, args.events)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
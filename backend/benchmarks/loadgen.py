@@ -0,0 +1,367 @@
+"""Load generator for ingestion, queries and realtime fan-out.
+
+Simulates ``--devices`` devices that each post an environment reading ``--rate`` times
+per second (plus a device status update every ``--status-every`` readings) while
+``--ws`` WebSocket and ``--sse`` SSE subscribers listen. It reports ingest throughput,
+end-to-end latency from POST to subscriber delivery, query latency, database growth
+and server memory per realtime connection, and writes the results as JSON so runs can
+be compared between commits.
+
+By default a uvicorn server is started on a free port against a temporary SQLite
+database. ``--in-process`` serves the app from this process instead, and ``--url``
+targets an already running server (pass ``--server-pid`` and ``--db-path`` to also
+collect memory and database size). Run from the ``backend`` directory::
+
+    python -m benchmarks.loadgen --devices 200 --rate 2 --ws 100 --sse 20 \\
+        --duration 30 --output results.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+try:  # pragma: no cover - only needed for WebSocket subscribers
+    import websockets
+except ImportError:  # pragma: no cover
+    websockets = None
+
+QUERY_PATHS = (
+    "/api/environment?limit=100",
+    "/api/environment/aggregate?bucket=1m",
+    "/api/alarms?limit=100",
+    "/api/devices",
+)
+
+
+@dataclass
+class Stats:
+    sent_at: dict[int, float] = field(default_factory=dict)
+    received: list[tuple[int, float]] = field(default_factory=list)
+    bytes_received: int = 0
+    post_latencies: list[float] = field(default_factory=list)
+    post_errors: int = 0
+    query_latencies: dict[str, list[float]] = field(default_factory=dict)
+
+
+def percentiles(samples: list[float]) -> dict[str, float | None]:
+    if not samples:
+        return {"p50_ms": None, "p90_ms": None, "p99_ms": None, "max_ms": None}
+    ordered = sorted(samples)
+
+    def pick(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000
+
+    return {"p50_ms": pick(0.5), "p90_ms": pick(0.9), "p99_ms": pick(0.99), "max_ms": ordered[-1] * 1000}
+
+
+def rss_bytes(pid: int | None) -> int | None:
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def db_bytes(path: Path | None) -> int | None:
+    if path is None:
+        return None
+    return sum(
+        candidate.stat().st_size
+        for candidate in (path, Path(f"{path}-wal"), Path(f"{path}-shm"))
+        if candidate.exists()
+    )
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def _wait_ready(base_url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while True:
+            try:
+                if (await client.get("/api/devices")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Server at {base_url} did not become ready")
+            await asyncio.sleep(0.1)
+
+
+async def _device(
+    client: httpx.AsyncClient, index: int, args: argparse.Namespace, stats: Stats, stop_at: float
+) -> None:
+    location = f"bench-{index % max(args.locations, 1)}"
+    interval = 1 / args.rate
+    sent = 0
+    next_at = time.perf_counter() + interval * (index / max(args.devices, 1))
+    while next_at < stop_at:
+        await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+        next_at += interval
+        sent += 1
+        payload = {
+            "location": location,
+            "temperature": 20 + (sent % 50) / 10,
+            "humidity": 45.0,
+            "air_quality_index": 30.0,
+        }
+        started = time.perf_counter()
+        try:
+            response = await client.post("/api/environment", json=payload)
+            response.raise_for_status()
+        except httpx.HTTPError:
+            stats.post_errors += 1
+            continue
+        stats.post_latencies.append(time.perf_counter() - started)
+        stats.sent_at[response.json()["id"]] = started
+        if args.status_every and sent % args.status_every == 0:
+            await client.post(
+                "/api/devices",
+                json={"device_id": f"device-{index}", "name": f"Device {index}", "status": "online"},
+            )
+
+
+def _record(stats: Stats, raw: str | bytes) -> None:
+    received_at = time.perf_counter()
+    stats.bytes_received += len(raw)
+    message = json.loads(raw)
+    if message.get("event") == "environment.update":
+        stats.received.append((message["payload"]["id"], received_at))
+    elif message.get("event") == "batch":
+        # Delta frames always carry the id of the newest reading per location.
+        for fields in message["state"].get("environment.update", {}).values():
+            if "id" in fields:
+                stats.received.append((fields["id"], received_at))
+
+
+async def _ws_subscriber(url: str, stats: Stats, ready: asyncio.Event) -> None:
+    async with websockets.connect(url, max_queue=None) as connection:
+        ready.set()
+        async for raw in connection:
+            _record(stats, raw)
+
+
+async def _sse_subscriber(client: httpx.AsyncClient, stats: Stats, ready: asyncio.Event) -> None:
+    async with client.stream("GET", "/api/events?events=environment.update") as response:
+        ready.set()
+        async for line in response.aiter_lines():
+            if line.startswith("data: "):
+                _record(stats, line[6:])
+
+
+async def _queries(client: httpx.AsyncClient, rounds: int, stats: Stats) -> None:
+    for path in QUERY_PATHS:
+        samples = stats.query_latencies.setdefault(path, [])
+        for _ in range(rounds):
+            started = time.perf_counter()
+            (await client.get(path)).raise_for_status()
+            samples.append(time.perf_counter() - started)
+
+
+async def run_load(
+    base_url: str, args: argparse.Namespace, server_pid: int | None, db_path: Path | None
+) -> dict[str, Any]:
+    stats = Stats()
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    ws_url = base_url.replace("http", "ws", 1) + (
+        f"/api/ws?events=environment.update&protocol={args.ws_protocol}"
+    )
+    db_before = db_bytes(db_path)
+    rss_idle = rss_bytes(server_pid)
+
+    async with AsyncExitStack() as stack:
+        client = await stack.enter_async_context(
+            httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0)
+        )
+        sse_client = await stack.enter_async_context(
+            httpx.AsyncClient(
+                base_url=base_url,
+                limits=httpx.Limits(max_connections=args.sse + 1),
+                timeout=httpx.Timeout(30.0, read=None),
+            )
+        )
+        if args.ws and websockets is None:
+            raise SystemExit("WebSocket subscribers need the 'websockets' package")
+        readiness = [asyncio.Event() for _ in range(args.ws + args.sse)]
+        subscribers = [
+            asyncio.create_task(_ws_subscriber(ws_url, stats, readiness[index]))
+            for index in range(args.ws)
+        ] + [
+            asyncio.create_task(_sse_subscriber(sse_client, stats, readiness[args.ws + index]))
+            for index in range(args.sse)
+        ]
+        await asyncio.wait_for(asyncio.gather(*(event.wait() for event in readiness)), 60)
+        await asyncio.sleep(0.5)
+        rss_connected = rss_bytes(server_pid)
+
+        started = time.perf_counter()
+        stop_at = started + args.duration
+        await asyncio.gather(*(_device(client, index, args, stats, stop_at) for index in range(args.devices)))
+        elapsed = time.perf_counter() - started
+        # Give subscribers a moment to drain what is still in flight.
+        await asyncio.sleep(1.0)
+        rss_loaded = rss_bytes(server_pid)
+        await _queries(client, args.query_rounds, stats)
+
+        for task in subscribers:
+            task.cancel()
+        await asyncio.gather(*subscribers, return_exceptions=True)
+
+    latencies = [
+        received_at - stats.sent_at[event_id]
+        for event_id, received_at in stats.received
+        if event_id in stats.sent_at
+    ]
+    subscribers_total = args.ws + args.sse
+    accepted = len(stats.post_latencies)
+    db_after = db_bytes(db_path)
+    return {
+        "ingest": {
+            "accepted": accepted,
+            "errors": stats.post_errors,
+            "readings_per_second": accepted / elapsed if elapsed else None,
+            "post_latency": percentiles(stats.post_latencies),
+        },
+        "fanout": {
+            "subscribers": subscribers_total,
+            "deliveries": len(latencies),
+            "expected_deliveries": accepted * subscribers_total,
+            "bytes_received": stats.bytes_received,
+            "bytes_per_delivery": stats.bytes_received / len(latencies) if latencies else None,
+            "end_to_end_latency": percentiles(latencies),
+        },
+        "queries": {path: percentiles(samples) for path, samples in stats.query_latencies.items()},
+        "database": {
+            "bytes_before": db_before,
+            "bytes_after": db_after,
+            "bytes_per_reading": (db_after - db_before) / accepted
+            if db_before is not None and db_after is not None and accepted
+            else None,
+        },
+        "memory": {
+            "rss_idle": rss_idle,
+            "rss_connected": rss_connected,
+            "rss_loaded": rss_loaded,
+            "bytes_per_connection": (rss_connected - rss_idle) / subscribers_total
+            if rss_idle is not None and rss_connected is not None and subscribers_total
+            else None,
+        },
+    }
+
+
+def _server_env(db_path: Path) -> dict[str, str]:
+    return {
+        "IOT_BOARD_DATABASE_URL": f"sqlite+aiosqlite:///{db_path}",
+        "IOT_BOARD_SIMULATION_MODE": "false",
+    }
+
+
+async def _run_in_process(args: argparse.Namespace, db_path: Path) -> dict[str, Any]:
+    import uvicorn
+
+    os.environ.update(_server_env(db_path))
+    from app.main import create_app
+
+    port = _free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(create_app(), host="127.0.0.1", port=port, log_level="warning", ws_max_queue=1024)
+    )
+    serving = asyncio.create_task(server.serve())
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        await _wait_ready(base_url)
+        return await run_load(base_url, args, os.getpid(), db_path)
+    finally:
+        server.should_exit = True
+        await serving
+
+
+async def _run_subprocess(args: argparse.Namespace, db_path: Path) -> dict[str, Any]:
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, **_server_env(db_path)},
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        await _wait_ready(base_url)
+        return await run_load(base_url, args, process.pid, db_path)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--locations", type=int, default=20, help="Distinct locations shared by devices.")
+    parser.add_argument("--rate", type=float, default=1.0, help="Readings per device per second.")
+    parser.add_argument("--status-every", type=int, default=10, help="Device status every N readings; 0 disables.")
+    parser.add_argument("--ws", type=int, default=50, help="WebSocket subscribers.")
+    parser.add_argument("--sse", type=int, default=10, help="SSE subscribers.")
+    parser.add_argument("--ws-protocol", choices=["json", "delta"], default="json")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load.")
+    parser.add_argument("--connections", type=int, default=64, help="HTTP connections used by devices.")
+    parser.add_argument("--query-rounds", type=int, default=20)
+    parser.add_argument("--url", help="Target an already running server instead of starting one.")
+    parser.add_argument("--server-pid", type=int, help="PID of the --url server, for memory figures.")
+    parser.add_argument("--db-path", type=Path, help="SQLite file of the --url server, for size figures.")
+    parser.add_argument("--in-process", action="store_true", help="Serve the app from this process.")
+    parser.add_argument("--output", type=Path, help="Write the JSON results here as well as to stdout.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = Path(directory) / "loadgen.db"
+        if args.url:
+            results = asyncio.run(run_load(args.url.rstrip("/"), args, args.server_pid, args.db_path))
+        elif args.in_process:
+            results = asyncio.run(_run_in_process(args, db_path))
+        else:
+            results = asyncio.run(_run_subprocess(args, db_path))
+
+    report = {
+        "revision": _git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
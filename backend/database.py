@@ -11,7 +11,19 @@ from sqlalchemy.orm import Session, sessionmaker
 from .config import get_database_settings
 
 settings = get_database_settings()
-engine = create_engine(settings.url, echo=settings.echo, future=settings.future)
+# SQLite URLs keep SQLAlchemy's default pool, which does not take sizing options.
+pool_options = (
+    {}
+    if settings.url.startswith("sqlite")
+    else {
+        "pool_size": settings.pool_size,
+        "max_overflow": settings.max_overflow,
+        "pool_timeout": settings.pool_timeout,
+        "pool_recycle": settings.pool_recycle,
+        "pool_pre_ping": settings.pool_pre_ping,
+    }
+)
+engine = create_engine(settings.url, echo=settings.echo, future=settings.future, **pool_options)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 
 
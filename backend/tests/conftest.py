@@ -9,9 +9,11 @@ from fastapi.testclient import TestClient
 from sqlalchemy import select
 
 from app import db as db_module
+from app.alarms import open_alarms
 from app.config import get_settings
 from app.db import Base, get_async_session, get_engine
 from app.main import create_app
+from app.state import latest_readings
 
 
 @pytest.fixture(autouse=True)
@@ -29,9 +31,13 @@ def configure_test_database(tmp_path, monkeypatch) -> Iterator[None]:
     get_settings.cache_clear()
     db_module._engine = None
     db_module._session_factory = None
+    db_module._read_engine = None
+    db_module._read_session_factory = None
     yield
     db_module._engine = None
     db_module._session_factory = None
+    db_module._read_engine = None
+    db_module._read_session_factory = None
 
 
 async def _create_schema() -> None:
@@ -50,6 +56,8 @@ async def _drop_schema() -> None:
 @pytest.fixture()
 def prepare_database(configure_test_database) -> Iterator[None]:
     asyncio.run(_create_schema())
+    open_alarms.replace([])
+    latest_readings.replace([])
     yield
     asyncio.run(_drop_schema())
 
@@ -66,7 +74,7 @@ def client(app) -> Iterator[TestClient]:
 
 
 @pytest.fixture()
-def list_entities() -> Callable[[type], list[object]]:
+def list_entities(prepare_database) -> Callable[[type], list[object]]:
     async def _list(model: type) -> list[object]:
         async with get_async_session() as session:
             result = await session.execute(select(model))
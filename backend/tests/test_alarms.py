@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import asyncio
+
+from app import data_ingestion
+from app.encoding import EncodedEvent
+from app.models import AlarmEvent
+from app.realtime import manager
+
+
+def _capture(monkeypatch) -> list[EncodedEvent]:
+    captured: list[EncodedEvent] = []
+
+    async def fake_broadcast(event: EncodedEvent) -> None:
+        captured.append(event)
+
+    monkeypatch.setattr(manager, "broadcast", fake_broadcast)
+    return captured
+
+
+def _alarm(code: str = "DEVICE_OFFLINE", device_id: str = "pump-1", severity: str = "warning") -> dict:
+    return {"code": code, "message": "lost connectivity", "severity": severity, "device_id": device_id}
+
+
+def test_repeats_fold_into_one_open_alarm(list_entities, monkeypatch):
+    captured = _capture(monkeypatch)
+
+    async def runner() -> list[AlarmEvent]:
+        results = [await data_ingestion.handle_alarm(_alarm()) for _ in range(3)]
+        results += await data_ingestion.ingest_bulk("alarm", [_alarm(), _alarm(), _alarm(device_id="pump-2")])
+        results.append(await data_ingestion.handle_alarm(_alarm(severity="critical")))
+        return results
+
+    results = asyncio.run(runner())
+
+    assert len({alarm.id for alarm in results if alarm.device_id == "pump-1"}) == 1
+    assert results[-1].occurrence_count == 6
+    assert [(event.event, event.payload["device_id"]) for event in captured] == [
+        ("alarm.raise", "pump-1"),
+        ("alarm.raise", "pump-2"),
+        ("alarm.update", "pump-1"),
+    ]
+    assert captured[-1].payload["severity"] == "critical"
+
+    rows = {alarm.device_id: alarm for alarm in list_entities(AlarmEvent)}
+    assert len(rows) == 2
+    assert rows["pump-1"].occurrence_count == 6
+    assert rows["pump-1"].last_seen_at > rows["pump-1"].first_seen_at
+
+
+def test_expired_window_opens_a_new_alarm(list_entities, monkeypatch):
+    monkeypatch.setenv("IOT_BOARD_ALARM_COALESCE_WINDOW_SECONDS", "0")
+    data_ingestion.get_settings.cache_clear()
+    captured = _capture(monkeypatch)
+
+    async def runner() -> None:
+        await data_ingestion.handle_alarm(_alarm())
+        await data_ingestion.handle_alarm(_alarm())
+
+    asyncio.run(runner())
+
+    assert len(list_entities(AlarmEvent)) == 2
+    assert [event.event for event in captured] == ["alarm.raise", "alarm.raise"]
+
+
+def test_alarm_storm_is_broadcast_once(list_entities, monkeypatch):
+    monkeypatch.setenv("IOT_BOARD_ALARM_STORM_THRESHOLD", "2")
+    data_ingestion.get_settings.cache_clear()
+    captured = _capture(monkeypatch)
+
+    rows = [_alarm(device_id=f"pump-{index}") for index in range(6)]
+    asyncio.run(data_ingestion.ingest_bulk("alarm", rows))
+
+    assert len(list_entities(AlarmEvent)) == 6
+    assert [event.event for event in captured] == ["alarm.raise", "alarm.raise", "alarm.storm"]
+
+
+def test_failed_batch_does_not_count_towards_a_storm(list_entities, monkeypatch):
+    monkeypatch.setenv("IOT_BOARD_ALARM_STORM_THRESHOLD", "2")
+    monkeypatch.setenv("IOT_BOARD_INGEST_BATCH_SIZE", "3")
+    monkeypatch.setenv("IOT_BOARD_INGEST_FLUSH_INTERVAL_MS", "1000")
+    data_ingestion.get_settings.cache_clear()
+    captured = _capture(monkeypatch)
+    bad_reading = {"location": "lab", "temperature": None, "humidity": 40.0, "air_quality_index": 30.0}
+
+    async def runner() -> list:
+        queue = data_ingestion.IngestionQueue()
+        await queue.start()
+        # The reading violates NOT NULL after both alarms were staged, so each entry is retried.
+        results = await asyncio.gather(
+            queue.submit("alarm", _alarm(device_id="pump-1")),
+            queue.submit("alarm", _alarm(device_id="pump-2")),
+            queue.submit("environment", bad_reading),
+            return_exceptions=True,
+        )
+        await queue.stop()
+        return results
+
+    results = asyncio.run(runner())
+
+    assert isinstance(results[2], Exception)
+    assert len(list_entities(AlarmEvent)) == 2
+    assert [event.event for event in captured] == ["alarm.raise", "alarm.raise"]
+
+
+def test_open_alarms_are_restored_at_startup(client, monkeypatch):
+    first = client.post("/api/alarms", json=_alarm()).json()
+
+    asyncio.run(data_ingestion.warm_state_caches())
+    repeat = client.post("/api/alarms", json=_alarm()).json()
+
+    assert repeat["id"] == first["id"]
+    assert repeat["occurrence_count"] == 2
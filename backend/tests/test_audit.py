@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+from datetime import datetime
+
+from app import data_ingestion
+from app.audit import AuditJournal, audit_log, iter_journal
+from app.encoding import encode_event
+from app.models import EnvironmentReading, RealTimeDispatchLog
+
+PAYLOAD = {"location": "lab", "temperature": 21.5, "humidity": 55.2, "air_quality_index": 42.0}
+
+
+def test_journal_mode_skips_dispatch_log_and_replays_events(list_entities, monkeypatch, tmp_path):
+    monkeypatch.setenv("IOT_BOARD_AUDIT_MODE", "journal")
+    monkeypatch.setenv("IOT_BOARD_AUDIT_JOURNAL_DIR", str(tmp_path))
+    monkeypatch.setenv("IOT_BOARD_AUDIT_FSYNC_INTERVAL_MS", "1")
+    data_ingestion.get_settings.cache_clear()
+    started = datetime.utcnow()
+
+    async def runner() -> None:
+        await audit_log.start()
+        try:
+            for index in range(3):
+                await data_ingestion.handle_environment_update({**PAYLOAD, "location": f"zone-{index}"})
+        finally:
+            await audit_log.stop()
+
+    asyncio.run(runner())
+
+    assert len(list_entities(EnvironmentReading)) == 3
+    assert list_entities(RealTimeDispatchLog) == []
+    events = list(iter_journal(tmp_path, start=started))
+    assert [event.payload["location"] for event in events] == ["zone-0", "zone-1", "zone-2"]
+    assert list(iter_journal(tmp_path, end=started)) == []
+
+
+def test_off_mode_writes_no_audit_rows(list_entities, monkeypatch):
+    monkeypatch.setenv("IOT_BOARD_AUDIT_MODE", "off")
+    data_ingestion.get_settings.cache_clear()
+
+    asyncio.run(data_ingestion.handle_environment_update(PAYLOAD))
+
+    assert len(list_entities(EnvironmentReading)) == 1
+    assert list_entities(RealTimeDispatchLog) == []
+
+
+def test_journal_rotates_segments_and_tolerates_truncated_tail(tmp_path):
+    events = []
+
+    async def runner() -> None:
+        journal = AuditJournal(tmp_path, segment_bytes=1, interval=0)
+        await journal.start()
+        for index in range(6):
+            events.append(encode_event("alarm.raise", {"id": index}))
+            journal.append(events[-1].data)
+            await journal.flush()
+        await journal.stop()
+
+    asyncio.run(runner())
+
+    segments = sorted(tmp_path.iterdir())
+    assert len(segments) == 6
+    with open(segments[-1], "ab") as handle:
+        handle.write(gzip.compress(b'{"event":"alarm.raise"}\n')[:10])
+
+    replayed = [event.payload["id"] for event in iter_journal(tmp_path)]
+    assert replayed == list(range(6))
+    ranged = iter_journal(tmp_path, start=events[2].created_at, end=events[4].created_at)
+    assert [event.payload["id"] for event in ranged] == [2, 3]
@@ -2,16 +2,20 @@ from __future__ import annotations
 
 import asyncio
 
+from sqlalchemy import event
+
 from app import data_ingestion
-from app.models import DeviceStatus, EnvironmentReading, RealTimeDispatchLog
+from app.db import get_engine
+from app.models import AlarmEvent, DeviceStatus, EnvironmentReading, RealTimeDispatchLog
 from app.realtime import manager
-from app.schemas import BroadcastEnvelope
+from app.encoding import EncodedEvent
+from app.rules import parse_rules, rule_engine
 
 
 def test_handle_environment_update_persists_and_broadcasts(list_entities, monkeypatch):
-    captured: list[BroadcastEnvelope] = []
+    captured: list[EncodedEvent] = []
 
-    async def fake_broadcast(envelope: BroadcastEnvelope) -> None:
+    async def fake_broadcast(envelope: EncodedEvent) -> None:
         captured.append(envelope)
 
     monkeypatch.setattr(manager, "broadcast", fake_broadcast)
@@ -36,9 +40,9 @@ def test_handle_environment_update_persists_and_broadcasts(list_entities, monkey
 
 
 def test_handle_device_status_upserts_and_broadcasts(list_entities, monkeypatch):
-    captured: list[BroadcastEnvelope] = []
+    captured: list[EncodedEvent] = []
 
-    async def fake_broadcast(envelope: BroadcastEnvelope) -> None:
+    async def fake_broadcast(envelope: EncodedEvent) -> None:
         captured.append(envelope)
 
     monkeypatch.setattr(manager, "broadcast", fake_broadcast)
@@ -70,6 +74,170 @@ def test_handle_device_status_upserts_and_broadcasts(list_entities, monkeypatch)
     assert captured[-1].event == "device.update"
 
 
+def test_device_batch_upserts_with_single_statement(list_entities, monkeypatch):
+    async def fake_broadcast(envelope: EncodedEvent) -> None:
+        return None
+
+    monkeypatch.setattr(manager, "broadcast", fake_broadcast)
+    statements: list[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "device_statuses" in statement:
+            statements.append(statement)
+
+    engine = get_engine().sync_engine
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        asyncio.run(
+            data_ingestion.ingest_bulk(
+                "device",
+                [
+                    {"device_id": f"node-{index}", "name": "Node", "status": "online"}
+                    for index in range(50)
+                ],
+            )
+        )
+        asyncio.run(
+            data_ingestion.ingest_bulk(
+                "device",
+                [
+                    {"device_id": "node-1", "name": "Node", "status": "offline"},
+                    {"device_id": "node-99", "name": "Node", "status": "online"},
+                ],
+            )
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert len(statements) == 2
+    assert all("ON CONFLICT" in statement for statement in statements)
+    devices = {device.device_id: device for device in list_entities(DeviceStatus)}
+    assert len(devices) == 51
+    assert devices["node-1"].status == "offline"
+
+
+def test_ingestion_queue_batches_in_submission_order(list_entities, monkeypatch):
+    monkeypatch.setenv("IOT_BOARD_INGEST_BATCH_SIZE", "50")
+    monkeypatch.setenv("IOT_BOARD_INGEST_FLUSH_INTERVAL_MS", "100")
+    data_ingestion.get_settings.cache_clear()
+
+    captured: list[EncodedEvent] = []
+    batch_sizes: list[int] = []
+
+    async def fake_broadcast(envelope: EncodedEvent) -> None:
+        captured.append(envelope)
+
+    original_write_batch = data_ingestion._write_batch
+
+    async def tracking_write_batch(entries):
+        batch_sizes.append(len(entries))
+        return await original_write_batch(entries)
+
+    monkeypatch.setattr(manager, "broadcast", fake_broadcast)
+    monkeypatch.setattr(data_ingestion, "_write_batch", tracking_write_batch)
+
+    async def runner() -> None:
+        queue = data_ingestion.IngestionQueue()
+        await queue.start()
+        await asyncio.gather(
+            *(
+                queue.submit(
+                    "environment",
+                    {
+                        "location": f"zone-{index}",
+                        "temperature": 20.0,
+                        "humidity": 50.0,
+                        "air_quality_index": 30.0,
+                    },
+                )
+                for index in range(120)
+            )
+        )
+        await queue.stop()
+
+    asyncio.run(runner())
+
+    assert batch_sizes == [50, 50, 20]
+    assert [envelope.payload["location"] for envelope in captured] == [
+        f"zone-{index}" for index in range(120)
+    ]
+    assert len(list_entities(EnvironmentReading)) == 120
+    assert len(list_entities(RealTimeDispatchLog)) == 120
+
+
+def _reading(index: int) -> dict:
+    return {"location": f"zone-{index}", "temperature": 20.0, "humidity": 50.0, "air_quality_index": 30.0}
+
+
+def test_failure_after_commit_does_not_rewrite_the_batch(list_entities, monkeypatch):
+    def broken_evaluate(readings):
+        raise RuntimeError("rule engine failure")
+
+    monkeypatch.setattr(data_ingestion.rule_engine, "evaluate", broken_evaluate)
+
+    async def runner() -> list:
+        queue = data_ingestion.IngestionQueue()
+        await queue.start()
+        results = await asyncio.gather(*(queue.submit("environment", _reading(index)) for index in range(2)))
+        await queue.stop()
+        return results
+
+    results = asyncio.run(runner())
+
+    assert [reading.location for reading in results] == ["zone-0", "zone-1"]
+    assert len(list_entities(EnvironmentReading)) == 2
+
+
+def test_broadcast_failure_does_not_stop_the_ingestion_queue(list_entities, monkeypatch):
+    calls = 0
+
+    async def flaky_broadcast(envelope: EncodedEvent) -> None:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("bus unavailable")
+
+    monkeypatch.setattr(manager, "broadcast", flaky_broadcast)
+
+    async def runner() -> tuple:
+        queue = data_ingestion.IngestionQueue()
+        await queue.start()
+        first = await asyncio.wait_for(queue.submit("environment", _reading(0)), 5)
+        second = await asyncio.wait_for(queue.submit("environment", _reading(1)), 5)
+        running = queue.running
+        await asyncio.wait_for(queue.stop(), 5)
+        return first, second, running
+
+    first, second, running = asyncio.run(runner())
+
+    assert (first.location, second.location) == ("zone-0", "zone-1")
+    assert running
+    assert calls == 2
+    assert len(list_entities(EnvironmentReading)) == 2
+
+
+def test_stop_persists_alarms_raised_by_the_last_flush(list_entities):
+    rule_engine.configure(
+        parse_rules([{"kind": "threshold", "code": "AQI_HIGH", "metric": "air_quality_index", "above": 100}])
+    )
+
+    async def runner() -> None:
+        queue = data_ingestion.ingestion_queue
+        await queue.start()
+        reading = asyncio.create_task(queue.submit("environment", {**_reading(0), "air_quality_index": 150.0}))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(queue.stop(), 5)
+        assert reading.done()
+        assert not data_ingestion._rule_tasks
+
+    try:
+        asyncio.run(runner())
+    finally:
+        rule_engine.configure([])
+
+    assert [alarm.code for alarm in list_entities(AlarmEvent)] == ["AQI_HIGH"]
+
+
 def test_start_background_tasks_respects_simulation_mode(monkeypatch):
     monkeypatch.setenv("IOT_BOARD_SIMULATION_MODE", "false")
     data_ingestion.get_settings.cache_clear()
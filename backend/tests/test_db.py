@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import asyncio
+
+from fastapi.testclient import TestClient
+from sqlalchemy import insert, inspect
+
+from app.db import get_async_session, get_engine, get_read_engine
+from app.main import create_app
+from app.models import EnvironmentReading
+
+
+def test_sqlite_profile_splits_writer_and_readers(prepare_database):
+    async def pragmas(engine) -> dict[str, object]:
+        async with engine.connect() as conn:
+            return {
+                name: (await conn.exec_driver_sql(f"PRAGMA {name}")).scalar_one()
+                for name in ("journal_mode", "synchronous", "busy_timeout", "query_only")
+            }
+
+    writer = asyncio.run(pragmas(get_engine()))
+    reader = asyncio.run(pragmas(get_read_engine()))
+
+    assert writer == {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 5000, "query_only": 0}
+    assert reader["query_only"] == 1
+    assert get_engine().pool.size() == 1
+
+
+def test_concurrent_writers_are_serialized(list_entities):
+    async def write(index: int) -> None:
+        async with get_async_session() as session:
+            await session.execute(
+                insert(EnvironmentReading),
+                [{"location": f"zone-{index}", "temperature": 1.0, "humidity": 1.0, "air_quality_index": 1.0}],
+            )
+            await asyncio.sleep(0)
+            await session.commit()
+
+    async def runner() -> None:
+        await asyncio.gather(*(write(index) for index in range(50)))
+
+    asyncio.run(runner())
+
+    assert len(list_entities(EnvironmentReading)) == 50
+
+
+def test_pool_metrics_report_writer_checkouts(client):
+    client.post(
+        "/api/environment",
+        json={"location": "hq", "temperature": 20.0, "humidity": 40.0, "air_quality_index": 10.0},
+    )
+
+    metrics = client.get("/api/db/pool").json()
+
+    assert metrics["writer"]["size"] == 1
+    assert metrics["writer"]["checkouts"] >= 1
+    assert metrics["writer"]["timeouts"] == 0
+    assert metrics["reader"]["size"] == 4
+
+
+def test_startup_adds_columns_missing_from_existing_tables(configure_test_database):
+    async def create_old_alarm_table() -> None:
+        async with get_engine().begin() as conn:
+            await conn.exec_driver_sql(
+                "CREATE TABLE alarm_events (id INTEGER PRIMARY KEY, code VARCHAR(32) NOT NULL, "
+                "message VARCHAR(255) NOT NULL, severity VARCHAR(16) NOT NULL, "
+                "created_at DATETIME NOT NULL, device_id VARCHAR(64))"
+            )
+            await conn.exec_driver_sql(
+                "INSERT INTO alarm_events (code, message, severity, created_at) "
+                "VALUES ('TEMP_HIGH', 'hot', 'warning', '2024-01-01 00:00:00')"
+            )
+
+    async def inspect_alarms() -> tuple[set[str], list[tuple]]:
+        async with get_engine().connect() as conn:
+            indexes = await conn.run_sync(
+                lambda sync: {index["name"] for index in inspect(sync).get_indexes("alarm_events")}
+            )
+            rows = await conn.exec_driver_sql(
+                "SELECT occurrence_count, first_seen_at, last_seen_at FROM alarm_events"
+            )
+            return indexes, rows.all()
+
+    asyncio.run(create_old_alarm_table())
+    with TestClient(create_app()) as client:
+        response = client.get("/api/alarms")
+    indexes, rows = asyncio.run(inspect_alarms())
+
+    assert response.status_code == 200
+    assert response.json()[0]["code"] == "TEMP_HIGH"
+    assert rows == [(1, "2024-01-01 00:00:00", "2024-01-01 00:00:00")]
+    assert "ix_alarm_events_last_seen_at" in indexes
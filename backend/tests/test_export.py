@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+
+READINGS = [
+    {"location": f"zone-{index}", "temperature": 20.0 + index, "humidity": 40.0, "air_quality_index": 10.0}
+    for index in range(5)
+]
+
+
+def test_export_streams_csv_and_ndjson(client, monkeypatch):
+    from app import export
+
+    monkeypatch.setattr(export, "EXPORT_CHUNK_SIZE", 2)
+    client.post("/api/environment/bulk", json=READINGS)
+
+    response = client.get("/api/export/environment_readings", params={"format": "csv"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["location"] for row in rows] == [reading["location"] for reading in READINGS]
+
+    ndjson = client.get("/api/export/environment_readings", params={"format": "ndjson"})
+    records = [json.loads(line) for line in ndjson.text.splitlines()]
+    assert [record["temperature"] for record in records] == [reading["temperature"] for reading in READINGS]
+
+    empty = client.get("/api/export/alarm_events", params={"to": "2000-01-01T00:00:00"})
+    assert empty.text.strip() == "id,code,message,severity,created_at,device_id,occurrence_count,first_seen_at,last_seen_at"
+
+
+def test_export_rejects_missing_agriculture_table(client):
+    assert client.get("/api/export/sensor_readings").status_code == 404
+
+
+def test_export_streams_arrow_ipc(client):
+    pa = pytest.importorskip("pyarrow")
+    client.post("/api/environment/bulk", json=READINGS)
+
+    response = client.get("/api/export/environment_readings", params={"format": "arrow"})
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.column("location").to_pylist() == [reading["location"] for reading in READINGS]
+
+    parquet = client.get("/api/export/environment_readings", params={"format": "parquet"})
+    pq = pytest.importorskip("pyarrow.parquet")
+    assert pq.read_table(io.BytesIO(parquet.content)).num_rows == len(READINGS)
+
+
+def test_export_releases_the_reader_between_chunks(client, monkeypatch):
+    from app import export
+    from app.db import get_read_engine
+
+    monkeypatch.setattr(export, "EXPORT_CHUNK_SIZE", 2)
+    client.post("/api/environment/bulk", json=READINGS)
+
+    async def consume() -> tuple[list[bytes], list[int]]:
+        chunks, checked_out = [], []
+        async for chunk in export.stream_export("environment_readings", "ndjson"):
+            chunks.append(chunk)
+            checked_out.append(get_read_engine().pool.checkedout())
+        return chunks, checked_out
+
+    chunks, checked_out = asyncio.run(consume())
+    assert [len(chunk.splitlines()) for chunk in chunks] == [2, 2, 1]
+    assert checked_out == [0, 0, 0]
+
+
+def test_arrow_export_converts_aware_timestamps_to_utc():
+    pa = pytest.importorskip("pyarrow")
+    from app import export
+
+    table = export.sensor_readings
+    schema = pa.schema([(column.name, export._arrow_type(column)) for column in table.columns])
+    recorded_at = datetime(2024, 5, 1, 12, 0, tzinfo=timezone(timedelta(hours=2)))
+    batch = export._arrow_batch(table, schema, [(1, 7, "soil", Decimal("1.50"), "%", recorded_at, None)])
+    assert batch.column(5).to_pylist() == [datetime(2024, 5, 1, 10, 0)]
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from app.metrics import INGEST_LATENCY, Registry
+
+
+def test_registry_renders_text_exposition_format():
+    registry = Registry()
+    requests = registry.counter("demo_requests", "Handled requests.", ("path",))
+    latency = registry.histogram("demo_latency_seconds", "Request latency.", buckets=(0.1, 1.0))
+    registry.gauge("demo_queue_depth", "Queued items.", lambda: 3)
+
+    requests.inc(labels=('/a"b',))
+    requests.inc(2, labels=('/a"b',))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        latency.observe(value)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE demo_requests counter" in lines
+    assert 'demo_requests_total{path="/a\\"b"} 3' in lines
+    assert "# TYPE demo_latency_seconds histogram" in lines
+    assert [line for line in lines if line.startswith("demo_latency_seconds_bucket")] == [
+        'demo_latency_seconds_bucket{le="0.1"} 2',
+        'demo_latency_seconds_bucket{le="1"} 3',
+        'demo_latency_seconds_bucket{le="+Inf"} 4',
+    ]
+    assert "demo_latency_seconds_sum 5.65" in lines
+    assert "demo_latency_seconds_count 4" in lines
+    assert "demo_queue_depth 3" in lines
+
+
+def test_metrics_endpoint_reports_hot_path_measurements(client):
+    before = INGEST_LATENCY.count(("environment",))
+    client.post(
+        "/api/environment",
+        json={"location": "hq", "temperature": 20, "humidity": 40, "air_quality_index": 30},
+    )
+    with client.websocket_connect("/api/ws"):
+        response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert INGEST_LATENCY.count(("environment",)) == before + 1
+    body = response.text
+    for name in (
+        "iot_db_commit_seconds_count",
+        "iot_db_checkout_seconds_count",
+        "iot_realtime_encode_seconds_count",
+        "iot_realtime_fanout_seconds_count",
+        'iot_realtime_events_total{event="environment.update"}',
+        "iot_ingest_queue_depth 0",
+        'iot_realtime_clients{transport="websocket"} 1',
+    ):
+        assert name in body
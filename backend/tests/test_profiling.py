@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from app.config import get_settings
+from app.main import create_app
+from app.profiling import SlowTraceBuffer, Trace, sample_stacks, slow_traces
+
+ADMIN = {"Authorization": "Bearer s3cret"}
+
+
+def test_admin_endpoints_require_the_configured_token(client, monkeypatch):
+    assert client.get("/api/admin/traces").status_code == 404
+
+    monkeypatch.setenv("IOT_BOARD_ADMIN_TOKEN", "s3cret")
+    get_settings.cache_clear()
+    assert client.get("/api/admin/traces").status_code == 401
+    assert client.get("/api/admin/traces", headers={"Authorization": "Bearer nope"}).status_code == 401
+    response = client.get("/api/admin/traces", headers=ADMIN)
+    assert response.status_code == 200
+    assert response.json()["enabled"] is False
+
+    profile = client.get("/api/admin/profile", params={"seconds": 0.05}, headers=ADMIN)
+    assert profile.status_code == 200
+    assert profile.headers["content-type"].startswith("text/plain")
+    assert any(line.startswith("MainThread;") for line in profile.text.splitlines())
+
+
+def test_slow_requests_are_traced_with_sql_and_ingest_spans(prepare_database, monkeypatch):
+    monkeypatch.setenv("IOT_BOARD_ADMIN_TOKEN", "s3cret")
+    monkeypatch.setenv("IOT_BOARD_PROFILING_ENABLED", "true")
+    get_settings.cache_clear()
+    slow_traces.clear()
+
+    with TestClient(create_app()) as client:
+        client.post(
+            "/api/environment",
+            json={"location": "hq", "temperature": 20, "humidity": 40, "air_quality_index": 30},
+        )
+        client.get("/api/environment")
+        traces = client.get("/api/admin/traces", headers=ADMIN).json()
+        assert client.delete("/api/admin/traces", headers=ADMIN).status_code == 204
+        assert client.get("/api/admin/traces", headers=ADMIN).json()["traces"] == []
+
+    assert traces["enabled"] is True
+    by_path = {(trace["method"], trace["path"]): trace for trace in traces["traces"]}
+    post = by_path[("POST", "/api/environment")]
+    assert post["status"] == 200
+    names = [span["name"] for span in post["spans"]]
+    assert names[:2] == ["ingest.queued", "ingest.write"] and names[-1] == "ingest.publish"
+    assert any(span["name"] == "sql" and "INSERT" in span["statement"] for span in post["spans"])
+    listing = by_path[("GET", "/api/environment")]
+    assert [span["name"] for span in listing["spans"]] == ["sql"]
+
+
+def test_slow_trace_buffer_keeps_the_slowest():
+    buffer = SlowTraceBuffer(size=2)
+    for duration in (0.3, 0.1, 0.5, 0.2):
+        trace = Trace(method="GET", path=f"/{duration}", start=0.0, end=duration)
+        buffer.add(trace)
+
+    assert [trace.path for trace in buffer.slowest()] == ["/0.5", "/0.3"]
+    assert buffer.recorded == 4
+
+
+def test_sample_stacks_returns_collapsed_stacks():
+    stop = threading.Event()
+
+    def spin_in_profiled_function() -> None:
+        while not stop.is_set():
+            time.sleep(0.001)
+
+    worker = threading.Thread(target=spin_in_profiled_function, name="busy-worker")
+    worker.start()
+    try:
+        output = sample_stacks(0.05, 0.005)
+    finally:
+        stop.set()
+        worker.join()
+
+    lines = output.splitlines()
+    assert lines
+    busy = [line for line in lines if line.startswith("busy-worker;")]
+    assert busy and all("spin_in_profiled_function" in line for line in busy)
+    stack, count = busy[0].rsplit(" ", 1)
+    assert int(count) >= 1 and ";" in stack
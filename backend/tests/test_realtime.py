@@ -0,0 +1,422 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from app import bus
+from app.bus import UnixSocketBackend
+from app.encoding import encode_event
+from app.metrics import BUS_UNSHARED
+from app.realtime import RealtimeChannelManager, Subscription
+
+
+class FakeWebSocket:
+    def __init__(self) -> None:
+        self.sent: list[str] = []
+
+    async def accept(self) -> None:
+        return None
+
+    async def send_text(self, data: str) -> None:
+        self.sent.append(data)
+
+
+def test_broadcast_shares_a_single_encoding():
+    manager = RealtimeChannelManager()
+    sockets = [FakeWebSocket() for _ in range(3)]
+    frames: list[bytes] = []
+
+    async def runner() -> None:
+        for websocket in sockets:
+            await manager.register_websocket(websocket)
+        stream = manager.register_sse()
+        reader = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        event = encode_event("device.update", {"device_id": "gw-1", "status": "online"})
+        await manager.broadcast(event)
+        frames.append(await reader)
+        await stream.aclose()
+
+    asyncio.run(runner())
+
+    texts = [websocket.sent[0] for websocket in sockets]
+    assert all(text is texts[0] for text in texts)
+    assert frames[0].startswith(b"id: 1\ndata: {") and frames[0].endswith(b"\n\n")
+    assert b'"device_id":"gw-1"' in frames[0]
+
+
+class StalledWebSocket(FakeWebSocket):
+    def __init__(self) -> None:
+        super().__init__()
+        self.release = asyncio.Event()
+        self.closed_with: int | None = None
+
+    async def send_text(self, data: str) -> None:
+        await self.release.wait()
+        self.sent.append(data)
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed_with = code
+
+
+class BrokenWebSocket(FakeWebSocket):
+    async def send_text(self, data: str) -> None:
+        raise RuntimeError("connection reset")
+
+
+def _configure_realtime(monkeypatch, policy: str, size: int) -> None:
+    monkeypatch.setenv("IOT_BOARD_REALTIME_OVERFLOW_POLICY", policy)
+    monkeypatch.setenv("IOT_BOARD_REALTIME_QUEUE_SIZE", str(size))
+
+
+def test_slow_websocket_does_not_block_broadcast(monkeypatch):
+    _configure_realtime(monkeypatch, "drop_oldest", 2)
+    manager = RealtimeChannelManager()
+    slow, fast = StalledWebSocket(), FakeWebSocket()
+
+    async def runner() -> None:
+        await manager.register_websocket(slow)
+        await manager.register_websocket(fast)
+        for index in range(5):
+            await asyncio.wait_for(
+                manager.broadcast(encode_event("alarm.raise", {"id": index})), timeout=0.1
+            )
+            await asyncio.sleep(0)
+        slow.release.set()
+        await asyncio.sleep(0.01)
+        await manager.unregister_websocket(slow)
+        await manager.unregister_websocket(fast)
+
+    asyncio.run(runner())
+
+    assert len(fast.sent) == 5
+    # The first event was already being written; of the rest only the newest two survive.
+    assert [text.count('"id":') for text in slow.sent] == [1, 1, 1]
+    assert '"id":4' in slow.sent[-1] and '"id":3' in slow.sent[-2]
+
+
+def test_coalesce_policy_keeps_latest_state_per_entity(monkeypatch):
+    _configure_realtime(monkeypatch, "coalesce", 2)
+    manager = RealtimeChannelManager()
+    slow = StalledWebSocket()
+
+    async def runner() -> None:
+        await manager.register_websocket(slow)
+        await manager.broadcast(encode_event("alarm.raise", {"id": 0}))
+        await asyncio.sleep(0)
+        for status in ["online", "offline", "error"]:
+            await manager.broadcast(
+                encode_event("device.update", {"device_id": "gw-1", "status": status})
+            )
+        await manager.broadcast(encode_event("device.update", {"device_id": "gw-2", "status": "online"}))
+        slow.release.set()
+        await asyncio.sleep(0.01)
+        await manager.unregister_websocket(slow)
+
+    asyncio.run(runner())
+
+    assert len(slow.sent) == 3
+    assert '"status":"error"' in slow.sent[1]
+    assert '"device_id":"gw-2"' in slow.sent[2]
+
+
+def test_overflowing_and_failing_websockets_are_evicted(monkeypatch):
+    _configure_realtime(monkeypatch, "disconnect", 1)
+    manager = RealtimeChannelManager()
+    slow, broken = StalledWebSocket(), BrokenWebSocket()
+
+    async def runner() -> None:
+        await manager.register_websocket(slow)
+        await manager.register_websocket(broken)
+        for index in range(3):
+            await manager.broadcast(encode_event("alarm.raise", {"id": index}))
+            await asyncio.sleep(0)
+        assert manager._websockets == {}
+        slow.release.set()
+        await asyncio.sleep(0.01)
+
+    asyncio.run(runner())
+
+    assert slow.closed_with == 1013
+
+
+def test_delta_protocol_batches_changed_fields_with_keyframes(monkeypatch):
+    monkeypatch.setenv("IOT_BOARD_REALTIME_KEYFRAME_INTERVAL_SECONDS", "0.05")
+    manager = RealtimeChannelManager()
+    websocket = FakeWebSocket()
+    reading = {"id": 1, "location": "hq", "temperature": 20.0, "humidity": 40.0}
+
+    async def runner() -> None:
+        await manager.register_websocket(websocket, protocol="delta", interval_ms=10)
+        await manager.broadcast(encode_event("environment.update", reading))
+        await manager.broadcast(encode_event("environment.update", {**reading, "id": 2}))
+        await manager.broadcast(encode_event("alarm.raise", {"id": 7, "code": "HOT"}))
+        await asyncio.sleep(0.03)
+        await manager.broadcast(encode_event("environment.update", {**reading, "id": 3, "temperature": 21.5}))
+        await asyncio.sleep(0.06)
+        await manager.broadcast(encode_event("environment.update", {**reading, "id": 4, "temperature": 21.5}))
+        await asyncio.sleep(0.03)
+        await manager.unregister_websocket(websocket)
+
+    asyncio.run(runner())
+
+    frames = [json.loads(text) for text in websocket.sent]
+    assert [frame["event"] for frame in frames] == ["batch"] * 3
+    assert [frame["keyframe"] for frame in frames] == [True, False, True]
+    assert frames[0]["state"] == {"environment.update": {"hq": {**reading, "id": 2}}}
+    assert frames[0]["events"] == [{"event": "alarm.raise", "payload": {"id": 7, "code": "HOT"}}]
+    assert frames[1]["state"] == {"environment.update": {"hq": {"id": 3, "temperature": 21.5}}}
+    assert frames[2]["state"]["environment.update"]["hq"]["humidity"] == 40.0
+
+
+def test_sse_frames_are_sequenced_and_replayed(monkeypatch):
+    monkeypatch.setenv("IOT_BOARD_REALTIME_REPLAY_BUFFER_SIZE", "3")
+    manager = RealtimeChannelManager()
+    received: list[bytes] = []
+
+    async def runner() -> None:
+        for index in range(5):
+            await manager.broadcast(encode_event("alarm.raise", {"id": index}))
+        stream = manager.register_sse(last_event_id=3)
+        received.append(await stream.__anext__())
+        received.append(await stream.__anext__())
+        await manager.broadcast(encode_event("alarm.raise", {"id": 5}))
+        received.append(await stream.__anext__())
+        await stream.aclose()
+
+    asyncio.run(runner())
+
+    assert [frame.split(b"\n", 1)[0] for frame in received] == [b"id: 4", b"id: 5", b"id: 6"]
+    assert b'"id":5' in received[2]
+
+
+def test_sse_outbox_is_bounded(monkeypatch):
+    _configure_realtime(monkeypatch, "drop_oldest", 2)
+    manager = RealtimeChannelManager()
+    received: list[bytes] = []
+
+    async def runner() -> None:
+        stream = manager.register_sse()
+        first = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        for index in range(6):
+            await manager.broadcast(encode_event("alarm.raise", {"id": index}))
+        received.append(await first)
+        received.append(await stream.__anext__())
+        pending = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.01)
+        assert not pending.done()
+        pending.cancel()
+
+    asyncio.run(runner())
+
+    assert [frame.split(b"\n", 1)[0] for frame in received] == [b"id: 5", b"id: 6"]
+
+
+def test_broadcast_only_reaches_matching_subscribers():
+    manager = RealtimeChannelManager()
+    everything, alarms, gateway = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+
+    async def runner() -> None:
+        await manager.register_websocket(everything)
+        await manager.register_websocket(
+            alarms, Subscription.from_params(events="alarm.raise", min_severity="warning")
+        )
+        await manager.register_websocket(gateway, Subscription.from_params(device_ids=["gw-1"]))
+        await manager.broadcast(encode_event("environment.update", {"location": "hq"}))
+        await manager.broadcast(
+            encode_event("alarm.raise", {"code": "A", "severity": "info", "device_id": "gw-1"})
+        )
+        await manager.broadcast(
+            encode_event("alarm.raise", {"code": "B", "severity": "critical", "device_id": "gw-2"})
+        )
+        await asyncio.sleep(0)
+        for websocket in (everything, alarms, gateway):
+            await manager.unregister_websocket(websocket)
+
+    asyncio.run(runner())
+
+    assert len(everything.sent) == 3
+    assert len(alarms.sent) == 1 and '"code":"B"' in alarms.sent[0]
+    assert len(gateway.sent) == 2 and '"code":"A"' in gateway.sent[1]
+
+
+def test_websocket_subscribe_message_filters_events(client):
+    with client.websocket_connect("/api/ws") as websocket:
+        assert websocket.receive_json()["event"] == "snapshot"
+        websocket.send_text(json.dumps({"action": "subscribe", "events": ["alarm.raise"]}))
+        ack = websocket.receive_json()
+        assert ack["event"] == "subscribed"
+        assert ack["payload"]["events"] == ["alarm.raise"]
+
+        client.post(
+            "/api/environment",
+            json={"location": "hq", "temperature": 20, "humidity": 40, "air_quality_index": 30},
+        )
+        client.post("/api/alarms", json={"code": "HOT", "message": "Too hot", "severity": "critical"})
+
+        message = websocket.receive_json()
+        assert message["event"] == "alarm.raise"
+        assert message["payload"]["code"] == "HOT"
+
+
+def test_websocket_starts_with_a_snapshot_of_current_state(client):
+    client.post("/api/devices", json={"device_id": "gw-1", "name": "Gateway", "status": "online"})
+    client.post(
+        "/api/environment",
+        json={"location": "hq", "temperature": 20, "humidity": 40, "air_quality_index": 30},
+    )
+    client.post(
+        "/api/alarms",
+        json={"code": "HOT", "message": "Too hot", "severity": "critical", "device_id": "gw-1"},
+    )
+
+    with client.websocket_connect("/api/ws") as websocket:
+        snapshot = websocket.receive_json()
+    assert snapshot["event"] == "snapshot"
+    assert [device["device_id"] for device in snapshot["payload"]["devices"]] == ["gw-1"]
+    assert [reading["location"] for reading in snapshot["payload"]["environment"]] == ["hq"]
+    assert [alarm["code"] for alarm in snapshot["payload"]["alarms"]] == ["HOT"]
+
+    with client.websocket_connect("/api/ws?events=alarm.raise&device_id=gw-2") as websocket:
+        filtered = websocket.receive_json()
+    assert filtered["payload"] == {"alarms": []}
+
+
+def test_sse_snapshot_is_skipped_when_replay_catches_up():
+    manager = RealtimeChannelManager()
+    state = {"devices": [{"device_id": "gw-1", "status": "online"}]}
+    manager.set_snapshot_source(lambda: 1, lambda: state)
+    received: list[bytes] = []
+
+    async def runner() -> None:
+        fresh = manager.register_sse()
+        received.append(await fresh.__anext__())
+        await fresh.aclose()
+        await manager.broadcast(encode_event("alarm.raise", {"id": 1}))
+        resumed = manager.register_sse(last_event_id=0)
+        received.append(await resumed.__anext__())
+        await resumed.aclose()
+        stale = manager.register_sse(last_event_id=99)
+        received.append(await stale.__anext__())
+        await stale.aclose()
+
+    asyncio.run(runner())
+
+    assert received[0].startswith(b"data: ") and b'"event":"snapshot"' in received[0]
+    assert received[1].startswith(b"id: 1\n") and b'"alarm.raise"' in received[1]
+    assert b'"event":"snapshot"' in received[2]
+
+
+def test_sse_resume_needs_an_unbroken_sequence():
+    manager = RealtimeChannelManager()
+    manager.set_snapshot_source(lambda: 1, lambda: {"alarms": []})
+    received: list[bytes] = []
+
+    async def first_frame(last_event_id: int) -> None:
+        stream = manager.register_sse(last_event_id=last_event_id)
+        received.append(await stream.__anext__())
+        await stream.aclose()
+
+    async def runner() -> None:
+        for sequence in (7, 8, 9):
+            await manager.deliver(encode_event("alarm.raise", {"id": sequence}), sequence)
+        await first_frame(8)
+        await first_frame(6)
+        # Events 10-11 were missed, e.g. across a hub handover.
+        await manager.deliver(encode_event("alarm.raise", {"id": 12}), 12)
+        await first_frame(9)
+        await manager.deliver(encode_event("alarm.raise", {"id": 13}), 13)
+        await first_frame(12)
+        await manager.deliver(encode_event("alarm.raise", {"id": 0}))
+        await first_frame(13)
+
+    asyncio.run(runner())
+
+    assert received[0].startswith(b"id: 9\n")
+    assert [b'"event":"snapshot"' in frame for frame in received] == [False, True, True, False, True]
+    assert received[3].startswith(b"id: 13\n")
+
+
+def test_sse_rejects_unknown_severity(client):
+    response = client.get("/api/events", params={"min_severity": "apocalyptic"})
+    assert response.status_code == 422
+
+
+def test_unix_socket_backend_shares_events_between_processes(tmp_path):
+    path = str(tmp_path / "rt.sock")
+    received: dict[str, list[str]] = {"a": [], "b": [], "c": []}
+    sequences: dict[str, list[int | None]] = {"a": [], "b": [], "c": []}
+
+    def collector(name: str):
+        async def deliver(event, sequence) -> None:
+            received[name].append(event.payload["origin"])
+            sequences[name].append(sequence)
+
+        return deliver
+
+    async def runner() -> None:
+        hub = UnixSocketBackend(collector("a"), path)
+        await hub.start()
+        second = UnixSocketBackend(collector("b"), path)
+        third = UnixSocketBackend(collector("c"), path)
+        await second.start()
+        await third.start()
+        assert hub.is_hub and not second.is_hub and not third.is_hub
+
+        await second.publish(encode_event("alarm.raise", {"origin": "b"}))
+        await asyncio.sleep(0.05)
+        await hub.publish(encode_event("alarm.raise", {"origin": "a"}))
+        await asyncio.sleep(0.05)
+
+        # Losing the hub promotes one of the remaining workers.
+        await hub.stop()
+        await asyncio.sleep(0.3)
+        assert second.is_hub or third.is_hub
+        await third.publish(encode_event("alarm.raise", {"origin": "c"}))
+        await asyncio.sleep(0.05)
+        await second.stop()
+        await third.stop()
+
+    asyncio.run(runner())
+
+    assert received["a"] == ["b", "a"]
+    assert received["b"] == ["b", "a", "c"]
+    assert received["c"] == ["b", "a", "c"]
+    # Every worker sees the hub's numbering; the new hub skips ahead after the handover.
+    assert sequences["a"] == sequences["b"][:2] == sequences["c"][:2]
+    assert sequences["b"] == sequences["c"]
+    assert sequences["b"][1] == sequences["b"][0] + 1
+    assert sequences["b"][2] > sequences["b"][1] + 1
+
+
+def test_unix_socket_backend_keeps_events_local_when_the_hub_backs_up(tmp_path, monkeypatch):
+    path = str(tmp_path / "rt.sock")
+    received: dict[str, list[tuple[int, int | None]]] = {"hub": [], "peer": []}
+
+    def collector(name: str):
+        async def deliver(event, sequence) -> None:
+            received[name].append((event.payload["id"], sequence))
+
+        return deliver
+
+    async def runner() -> None:
+        hub = UnixSocketBackend(collector("hub"), path)
+        await hub.start()
+        peer = UnixSocketBackend(collector("peer"), path)
+        await peer.start()
+        await peer.publish(encode_event("alarm.raise", {"id": 1}))
+        await asyncio.sleep(0.05)
+        monkeypatch.setattr(bus, "MAX_PEER_BUFFER", -1)
+        await peer.publish(encode_event("alarm.raise", {"id": 2}))
+        await asyncio.sleep(0.05)
+        await peer.stop()
+        await hub.stop()
+
+    before = BUS_UNSHARED.value(("hub_backlog",))
+    asyncio.run(runner())
+
+    assert [item for item, _ in received["hub"]] == [1]
+    assert received["peer"][0][1] is not None
+    assert received["peer"][1] == (2, None)
+    assert BUS_UNSHARED.value(("hub_backlog",)) == before + 1
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta
+
+from app import retention
+from app.db import get_async_session
+from app.models import EnvironmentReading, EnvironmentRollup, RealTimeDispatchLog
+from app.rollups import update_rollups
+
+
+def _reading(created_at: datetime) -> EnvironmentReading:
+    return EnvironmentReading(
+        location="lab", temperature=20.0, humidity=40.0, air_quality_index=10.0, created_at=created_at
+    )
+
+
+def test_run_retention_prunes_expired_rows_in_chunks(list_entities, monkeypatch):
+    monkeypatch.setenv("IOT_BOARD_RETENTION_ENVIRONMENT_HOURS", "24")
+    monkeypatch.setenv("IOT_BOARD_RETENTION_DISPATCH_LOG_HOURS", "1")
+    monkeypatch.setenv("IOT_BOARD_RETENTION_CHUNK_SIZE", "3")
+    monkeypatch.setenv("IOT_BOARD_RETENTION_SQLITE_VACUUM", "true")
+    retention.get_settings.cache_clear()
+
+    now = datetime.utcnow()
+    old = now - timedelta(days=2)
+
+    async def seed() -> None:
+        async with get_async_session() as session:
+            session.add_all(_reading(old) for _ in range(7))
+            session.add(_reading(now))
+            session.add_all(
+                RealTimeDispatchLog(event_type="environment.update", payload={}, created_at=created_at)
+                for created_at in (old, now - timedelta(minutes=5))
+            )
+            await session.commit()
+
+    async def auto_vacuum() -> int:
+        async with retention.get_engine().connect() as conn:
+            return (await conn.exec_driver_sql("PRAGMA auto_vacuum")).scalar_one()
+
+    asyncio.run(seed())
+    asyncio.run(retention.prepare_sqlite_auto_vacuum())
+    assert asyncio.run(auto_vacuum()) == 2
+    report = asyncio.run(retention.run_retention(now=now))
+
+    assert report.pruned == {"environment_readings": 7, "realtime_dispatch_log": 1}
+    assert report.bytes_reclaimed is not None
+    assert [reading.created_at for reading in list_entities(EnvironmentReading)] == [now]
+    assert len(list_entities(RealTimeDispatchLog)) == 1
+
+
+def test_run_retention_backfills_rollups_before_deleting_readings(list_entities, monkeypatch):
+    monkeypatch.setenv("IOT_BOARD_RETENTION_ENVIRONMENT_HOURS", "24")
+    monkeypatch.setenv("IOT_BOARD_RETENTION_CHUNK_SIZE", "2")
+    retention.get_settings.cache_clear()
+
+    now = datetime(2024, 3, 10, 12, 0)
+    history = [now - timedelta(days=3, minutes=minutes) for minutes in range(5)]
+    same_day = [now - timedelta(hours=2), now - timedelta(hours=1)]
+
+    async def seed() -> None:
+        async with get_async_session() as session:
+            # Stored before rollups were maintained: the history and an earlier reading today.
+            session.add_all(_reading(created_at) for created_at in history + same_day[:1])
+            await session.flush()
+            ingested = _reading(same_day[1])
+            session.add(ingested)
+            await session.flush()
+            await update_rollups(session, [ingested])
+            await session.commit()
+
+    asyncio.run(seed())
+    report = asyncio.run(retention.run_retention(now=now))
+    again = asyncio.run(retention.run_retention(now=now))
+
+    assert report.rollups_backfilled == 6
+    assert report.pruned == {"environment_readings": 5}
+    assert again.rollups_backfilled == 0
+    days = {
+        rollup.bucket_start: rollup.count
+        for rollup in list_entities(EnvironmentRollup)
+        if rollup.bucket == "1d"
+    }
+    assert days == {datetime(2024, 3, 7): 5, datetime(2024, 3, 10): 2}
+
+
+def test_retention_is_disabled_without_ttls():
+    assert not retention.retention_enabled()
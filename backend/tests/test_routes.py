@@ -1,6 +1,15 @@
 from __future__ import annotations
 
+import json
+
+from fastapi.testclient import TestClient
+
+from sqlalchemy.exc import OperationalError
+
+from app import routes
+from app.config import get_settings
 from app.models import AlarmEvent, DeviceStatus, EnvironmentReading
+from app.state import latest_readings
 
 
 def test_environment_endpoints(client, list_entities):
@@ -80,3 +89,276 @@ def test_alarm_creation(client, list_entities):
 
     stored = list_entities(AlarmEvent)
     assert len(stored) == 1
+
+
+def test_bulk_environment_accepts_json_array(client, list_entities):
+    rows = [
+        {"location": "hq", "temperature": 21.0, "humidity": 40.0, "air_quality_index": 30.0},
+        {"location": "lab", "temperature": "hot", "humidity": 41.0, "air_quality_index": 31.0},
+        {"location": "lab", "temperature": 22.5, "humidity": 42.0, "aqi": 32.0},
+    ]
+
+    response = client.post("/api/environment/bulk", json=rows)
+    assert response.status_code == 200
+    result = response.json()
+    assert result["accepted"] == 2
+    assert result["rejected"] == 1
+    assert [error["index"] for error in result["errors"]] == [1]
+
+    readings = list_entities(EnvironmentReading)
+    assert sorted(reading.location for reading in readings) == ["hq", "lab"]
+
+
+def test_bulk_ingest_reports_chunks_that_fail_to_store(client, list_entities, monkeypatch):
+    monkeypatch.setenv("IOT_BOARD_INGEST_BATCH_SIZE", "2")
+    get_settings.cache_clear()
+    calls = 0
+
+    async def flaky_ingest_bulk(kind, rows):
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            raise OperationalError("INSERT", {}, Exception("disk I/O error"))
+        return await ingest_bulk(kind, rows)
+
+    ingest_bulk = routes.ingest_bulk
+    monkeypatch.setattr(routes, "ingest_bulk", flaky_ingest_bulk)
+    rows = [
+        {"location": f"zone-{index}", "temperature": 21.0, "humidity": 40.0, "air_quality_index": 30.0}
+        for index in range(7)
+    ]
+    rows[3]["temperature"] = "hot"
+
+    response = client.post("/api/environment/bulk", json=rows)
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["accepted"], result["rejected"]) == (4, 3)
+    assert sorted(error["index"] for error in result["errors"]) == [2, 3]
+    assert any("indexes 2-4" in error["detail"] for error in result["errors"])
+    stored = sorted(reading.location for reading in list_entities(EnvironmentReading))
+    assert stored == ["zone-0", "zone-1", "zone-5", "zone-6"]
+
+
+def test_bulk_json_array_is_ingested_while_streaming(client, list_entities):
+    rows = [
+        {"location": f"zone-{index}", "temperature": 21.5, "humidity": 40.0, "aqi": 30.0}
+        for index in range(3)
+    ]
+    body = json.dumps(rows).encode()
+
+    def chunks():
+        for offset in range(0, len(body), 7):
+            yield body[offset : offset + 7]
+
+    response = client.post(
+        "/api/environment/bulk", content=chunks(), headers={"Content-Type": "application/json"}
+    )
+    assert response.json() == {"accepted": 3, "rejected": 0, "errors": []}
+
+    # Rows before the point where the array breaks are kept and the break is reported.
+    broken = client.post(
+        "/api/environment/bulk",
+        content=json.dumps(rows[:2]).encode()[:-1] + b", {oops",
+        headers={"Content-Type": "application/json"},
+    )
+    result = broken.json()
+    assert (result["accepted"], result["rejected"]) == (2, 1)
+    assert result["errors"][0]["index"] == 2
+    assert "rest of the body was not read" in result["errors"][0]["detail"]
+    assert len(list_entities(EnvironmentReading)) == 5
+
+
+def test_bulk_devices_accepts_ndjson_stream(client, list_entities):
+    lines = [
+        '{"device_id": "gw-1", "name": "Gateway", "status": "online"}',
+        "not json",
+        '{"device_id": "gw-2", "name": "Probe", "status": "offline"}',
+        '{"device_id": "gw-1", "name": "Gateway", "status": "maintenance"}',
+    ]
+
+    response = client.post(
+        "/api/devices/bulk",
+        content="\n".join(lines) + "\n",
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    result = response.json()
+    assert result["accepted"] == 3
+    assert result["rejected"] == 1
+    assert result["errors"][0]["index"] == 1
+
+    devices = {device.device_id: device for device in list_entities(DeviceStatus)}
+    assert set(devices) == {"gw-1", "gw-2"}
+    assert devices["gw-1"].status == "maintenance"
+
+
+def test_bulk_alarms_rejects_non_array_body(client):
+    response = client.post("/api/alarms/bulk", json={"code": "X"})
+    assert response.status_code == 400
+
+
+def test_post_routes_respond_with_persisted_rows(client, list_entities):
+    first = client.post(
+        "/api/alarms",
+        json={"code": "A1", "message": "first", "severity": "info"},
+    ).json()
+    second = client.post(
+        "/api/alarms",
+        json={"code": "A2", "message": "second", "severity": "warning"},
+    ).json()
+
+    stored = {alarm.id: alarm for alarm in list_entities(AlarmEvent)}
+    assert stored[first["id"]].code == "A1"
+    assert stored[second["id"]].code == "A2"
+    assert first["created_at"] and second["created_at"]
+
+
+def test_device_listing_is_served_from_cache_with_etag(client):
+    for device_id, status in [("gw-1", "online"), ("gw-2", "offline"), ("probe-1", "online")]:
+        client.post(
+            "/api/devices",
+            json={"device_id": device_id, "name": device_id, "status": status},
+        )
+
+    listing = client.get("/api/devices")
+    assert [entry["device_id"] for entry in listing.json()] == ["gw-1", "gw-2", "probe-1"]
+    etag = listing.headers["etag"]
+
+    online = client.get("/api/devices", params={"status": "online", "prefix": "gw"})
+    assert [entry["device_id"] for entry in online.json()] == ["gw-1"]
+
+    cached = client.get("/api/devices", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+
+    client.post("/api/devices", json={"device_id": "gw-2", "name": "gw-2", "status": "online"})
+    refreshed = client.get("/api/devices", headers={"If-None-Match": etag})
+    assert refreshed.status_code == 200
+    assert refreshed.headers["etag"] != etag
+
+
+def test_latest_environment_readings_track_each_location(app):
+    readings = [
+        {"location": "hq", "temperature": 20.0, "humidity": 40.0, "air_quality_index": 30.0},
+        {"location": "lab", "temperature": 18.0, "humidity": 45.0, "air_quality_index": 20.0},
+        {"location": "hq", "temperature": 24.0, "humidity": 50.0, "air_quality_index": 10.0},
+    ]
+    with TestClient(app) as client:
+        for reading in readings:
+            client.post("/api/environment", json=reading)
+
+        latest = client.get("/api/environment/latest")
+        assert [(entry["location"], entry["temperature"]) for entry in latest.json()] == [
+            ("hq", 24.0),
+            ("lab", 18.0),
+        ]
+        # Same field names as the model-serialized ``GET /api/environment``.
+        listed = client.get("/api/environment", params={"limit": 1}).json()
+        assert set(latest.json()[0]) == set(listed[0]) == {
+            "id", "location", "temperature", "humidity", "aqi", "created_at"
+        }
+        assert latest.json()[0] == listed[0]
+        etag = latest.headers["etag"]
+        assert client.get("/api/environment/latest", headers={"If-None-Match": etag}).status_code == 304
+
+        only_lab = client.get("/api/environment/latest", params={"location": ["lab", "nowhere"]})
+        assert [entry["location"] for entry in only_lab.json()] == ["lab"]
+
+    latest_readings.replace([])
+    # A restart rebuilds the index from the database.
+    with TestClient(app) as client:
+        rebuilt = client.get("/api/environment/latest").json()
+    assert [(entry["location"], entry["temperature"]) for entry in rebuilt] == [("hq", 24.0), ("lab", 18.0)]
+
+
+def test_environment_aggregate_reports_rollups_per_bucket(client):
+    readings = [
+        {"location": "hq", "temperature": 20.0, "humidity": 40.0, "air_quality_index": 30.0},
+        {"location": "hq", "temperature": 24.0, "humidity": 50.0, "air_quality_index": 10.0},
+        {"location": "lab", "temperature": 18.0, "humidity": 45.0, "air_quality_index": 20.0},
+    ]
+    assert client.post("/api/environment/bulk", json=readings[:2]).status_code == 200
+    assert client.post("/api/environment", json=readings[2]).status_code == 200
+
+    response = client.get("/api/environment/aggregate", params={"location": "hq", "bucket": "1d"})
+    assert response.status_code == 200
+    [bucket] = response.json()
+    assert bucket["count"] == 2
+    assert bucket["temperature_min"] == 20.0
+    assert bucket["temperature_max"] == 24.0
+    assert bucket["temperature_avg"] == 22.0
+    assert bucket["air_quality_index_min"] == 10.0
+
+    hourly = client.get("/api/environment/aggregate", params={"bucket": "1h"}).json()
+    assert {item["location"] for item in hourly} == {"hq", "lab"}
+
+    later = client.get(
+        "/api/environment/aggregate", params={"bucket": "1m", "from": "2999-01-01T00:00:00"}
+    )
+    assert later.json() == []
+    assert client.get("/api/environment/aggregate", params={"bucket": "5m"}).status_code == 422
+
+    # Timezone-aware bounds are compared in UTC.
+    aware = client.get(
+        "/api/environment/aggregate",
+        params={"bucket": "1d", "from": "2020-01-01T00:00:00Z", "to": "2999-01-01T02:00:00+02:00"},
+    )
+    assert aware.status_code == 200
+    assert {item["location"] for item in aware.json()} == {"hq", "lab"}
+    future = client.get(
+        "/api/environment/aggregate", params={"bucket": "1h", "from": "2999-01-01T00:00:00Z"}
+    )
+    assert future.status_code == 200 and future.json() == []
+
+
+def test_alarm_listing_pages_with_cursor_and_filters(client):
+    alarms = [
+        {"code": f"A{index}", "message": "check", "severity": "critical" if index % 2 else "info",
+         "device_id": "pump-1"}
+        for index in range(5)
+    ]
+    assert client.post("/api/alarms/bulk", json=alarms).json()["accepted"] == 5
+
+    first = client.get("/api/alarms", params={"limit": 2})
+    assert [item["code"] for item in first.json()] == ["A4", "A3"]
+    cursor = first.headers["X-Next-Cursor"]
+
+    second = client.get("/api/alarms", params={"limit": 2, "cursor": cursor})
+    assert [item["code"] for item in second.json()] == ["A2", "A1"]
+    third = client.get("/api/alarms", params={"limit": 2, "cursor": second.headers["X-Next-Cursor"]})
+    assert [item["code"] for item in third.json()] == ["A0"]
+    assert "X-Next-Cursor" not in third.headers
+
+    critical = client.get("/api/alarms", params={"severity": "critical"}).json()
+    assert [item["code"] for item in critical] == ["A3", "A1"]
+    assert client.get("/api/alarms", params={"device_id": "other"}).json() == []
+    assert client.get("/api/alarms", params={"to": "2000-01-01T00:00:00"}).json() == []
+    assert client.get("/api/alarms", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_alarm_listing_clamps_large_limits(client, monkeypatch):
+    monkeypatch.setattr(routes, "MAX_PAGE_SIZE", 2)
+    alarms = [{"code": f"A{index}", "message": "check", "severity": "info"} for index in range(3)]
+    client.post("/api/alarms/bulk", json=alarms)
+
+    response = client.get("/api/alarms", params={"limit": 5000}, headers={"Origin": "http://ui.test"})
+    assert response.status_code == 200
+    assert [item["code"] for item in response.json()] == ["A2", "A1"]
+    assert "X-Next-Cursor" in response.headers
+    exposed = response.headers["access-control-expose-headers"]
+    assert "X-Next-Cursor" in exposed and "ETag" in exposed
+
+
+def test_environment_listing_filters_by_location(client):
+    for location in ("hq", "lab", "hq"):
+        client.post(
+            "/api/environment",
+            json={"location": location, "temperature": 20.0, "humidity": 40.0, "air_quality_index": 10.0},
+        )
+
+    listing = client.get("/api/environment", params={"location": "hq", "limit": 1})
+    assert [item["location"] for item in listing.json()] == ["hq"]
+    rest = client.get(
+        "/api/environment",
+        params={"location": "hq", "cursor": listing.headers["X-Next-Cursor"]},
+    ).json()
+    assert len(rest) == 1 and rest[0]["id"] < listing.json()[0]["id"]
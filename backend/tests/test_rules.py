@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import data_ingestion
+from app.models import AlarmEvent, EnvironmentReading
+from app.rules import RuleEngine, parse_rules, rule_engine
+
+START = datetime(2024, 3, 1, 12, 0, 0)
+
+
+def _readings(location: str, temperatures: list[float], step_seconds: float = 10.0) -> list[EnvironmentReading]:
+    return [
+        EnvironmentReading(
+            location=location,
+            temperature=value,
+            humidity=40.0,
+            air_quality_index=20.0,
+            created_at=START + timedelta(seconds=index * step_seconds),
+        )
+        for index, value in enumerate(temperatures)
+    ]
+
+
+def _engine(*rules: dict) -> RuleEngine:
+    engine = RuleEngine()
+    engine.configure(parse_rules(rules), window_size=20)
+    return engine
+
+
+def test_threshold_rule_fires_once_per_cooldown():
+    engine = _engine(
+        {"kind": "threshold", "code": "TEMP_HIGH", "metric": "temperature", "above": 30, "cooldown_seconds": 60}
+    )
+
+    batch = _readings("lab", [25, 31, 32, 24])
+    alarms = engine.evaluate(batch)
+    assert [(alarm["code"], alarm["device_id"]) for alarm in alarms] == [("TEMP_HIGH", "location:lab")]
+    assert alarms[0]["message"] == "temperature 32 above 30 at lab"
+
+    later = _readings("lab", [33])
+    later[0].created_at = START + timedelta(seconds=45)
+    assert engine.evaluate(later) == []
+    later[0].created_at = START + timedelta(seconds=200)
+    assert len(engine.evaluate(later)) == 1
+    assert engine.evaluate(_readings("hq", [35]))[0]["device_id"] == "location:hq"
+
+
+def test_rate_and_zscore_rules_use_the_rolling_window():
+    engine = _engine(
+        {"kind": "rate", "code": "TEMP_JUMP", "metric": "temperature", "max_change_per_minute": 6},
+        {"kind": "zscore", "code": "TEMP_ANOMALY", "metric": "temperature", "threshold": 4, "min_samples": 10},
+    )
+
+    steady = [20.0 + 0.1 * (index % 3) for index in range(15)]
+    assert engine.evaluate(_readings("lab", steady)) == []
+
+    spike = _readings("lab", [20.1, 27.0])
+    for reading in spike:
+        reading.created_at += timedelta(seconds=150)
+    codes = sorted(alarm["code"] for alarm in engine.evaluate(spike))
+    assert codes == ["TEMP_ANOMALY", "TEMP_JUMP"]
+
+
+def test_invalid_rules_are_rejected():
+    with pytest.raises(ValueError):
+        parse_rules([{"kind": "threshold", "code": "X", "metric": "pressure", "above": 1}])
+
+
+def test_ingested_readings_raise_alarms_through_handle_alarm(list_entities):
+    rule_engine.configure(
+        parse_rules([{"kind": "threshold", "code": "AQI_HIGH", "metric": "air_quality_index", "above": 100}])
+    )
+
+    async def runner() -> None:
+        await data_ingestion.handle_environment_update(
+            {"location": "lab", "temperature": 21.0, "humidity": 40.0, "air_quality_index": 150.0}
+        )
+        await data_ingestion.drain_rule_alarms()
+
+    try:
+        asyncio.run(runner())
+    finally:
+        rule_engine.configure([])
+
+    [alarm] = list_entities(AlarmEvent)
+    assert (alarm.code, alarm.device_id, alarm.severity) == ("AQI_HIGH", "location:lab", "warning")
+
+
+def test_rule_alarms_do_not_merge_with_device_alarms_of_the_same_code(list_entities):
+    rule_engine.configure(
+        parse_rules([{"kind": "threshold", "code": "AQI_HIGH", "metric": "air_quality_index", "above": 100}])
+    )
+
+    async def runner() -> None:
+        await data_ingestion.handle_alarm(
+            {"code": "AQI_HIGH", "message": "sensor reports poor air", "severity": "warning", "device_id": "lab"}
+        )
+        await data_ingestion.handle_environment_update(
+            {"location": "lab", "temperature": 21.0, "humidity": 40.0, "air_quality_index": 150.0}
+        )
+        await data_ingestion.drain_rule_alarms()
+
+    try:
+        asyncio.run(runner())
+    finally:
+        rule_engine.configure([])
+
+    alarms = list_entities(AlarmEvent)
+    assert sorted(alarm.device_id for alarm in alarms) == ["lab", "location:lab"]
+    assert all(alarm.occurrence_count == 1 for alarm in alarms)
@@ -14,10 +14,16 @@ export default function AlarmPanel({ initialAlarms = [] }: Props) {
   }, [initialAlarms]);
 
   useEffect(() => {
-    const unsubscribe = realtimeService.on("alarm.raise", (payload) => {
-      setAlarms((prev) => [payload as AlarmEvent, ...prev].slice(0, 20));
-    });
-    return () => unsubscribe();
+    const upsert = (payload: unknown) => {
+      const alarm = payload as AlarmEvent;
+      setAlarms((prev) => [alarm, ...prev.filter((item) => item.id !== alarm.id)].slice(0, 20));
+    };
+    const unsubscribeRaise = realtimeService.on("alarm.raise", upsert);
+    const unsubscribeUpdate = realtimeService.on("alarm.update", upsert);
+    return () => {
+      unsubscribeRaise();
+      unsubscribeUpdate();
+    };
   }, []);
 
   return (
@@ -29,7 +35,10 @@ export default function AlarmPanel({ initialAlarms = [] }: Props) {
         {alarms.length === 0 && <div>No alarms</div>}
         {alarms.map((alarm) => (
           <div key={alarm.id} className={`alarm alarm--${alarm.severity}`}>
-            <div className="alarm__title">{alarm.code}</div>
+            <div className="alarm__title">
+              {alarm.code}
+              {(alarm.occurrence_count ?? 1) > 1 && ` ×${alarm.occurrence_count}`}
+            </div>
             <div className="alarm__message">{alarm.message}</div>
             <div className="alarm__time">{new Date(alarm.created_at).toLocaleTimeString()}</div>
           </div>
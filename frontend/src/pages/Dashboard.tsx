@@ -3,7 +3,7 @@ import AlarmPanel from "../components/AlarmPanel";
 import DeviceStatusBoard from "../components/DeviceStatusBoard";
 import EnvironmentMonitor from "../components/EnvironmentMonitor";
 import realtimeService from "../services/realtime";
-import { AlarmEvent, DeviceStatus, EnvironmentReading } from "../types/realtime";
+import { AlarmEvent, DeviceStatus, EnvironmentReading, RealtimeSnapshot } from "../types/realtime";
 
 async function fetchJson<T>(url: string): Promise<T> {
   const response = await fetch(url);
@@ -13,6 +13,17 @@ async function fetchJson<T>(url: string): Promise<T> {
   return response.json();
 }
 
+const ALARM_HISTORY_LIMIT = 20;
+
+// Snapshots only carry open alarms, so they are merged into the history rather than replacing it.
+function mergeAlarms(current: AlarmEvent[], incoming: AlarmEvent[]): AlarmEvent[] {
+  const byId = new Map(current.map((alarm) => [alarm.id, alarm]));
+  incoming.forEach((alarm) => byId.set(alarm.id, alarm));
+  return [...byId.values()]
+    .sort((a, b) => b.created_at.localeCompare(a.created_at) || b.id - a.id)
+    .slice(0, ALARM_HISTORY_LIMIT);
+}
+
 export default function DashboardPage() {
   const [environment, setEnvironment] = useState<EnvironmentReading[]>([]);
   const [devices, setDevices] = useState<DeviceStatus[]>([]);
@@ -21,18 +32,30 @@ export default function DashboardPage() {
 
   useEffect(() => {
     Promise.all([
-      fetchJson<EnvironmentReading[]>("/api/environment"),
+      fetchJson<EnvironmentReading[]>("/api/environment/latest"),
       fetchJson<DeviceStatus[]>("/api/devices"),
       fetchJson<AlarmEvent[]>("/api/alarms"),
     ])
       .then(([envData, deviceData, alarmData]) => {
         setEnvironment(envData);
         setDevices(deviceData);
-        setAlarms(alarmData);
+        // Alarms from a snapshot that arrived first are newer than the fetched copies.
+        setAlarms((current) => mergeAlarms(alarmData, current));
       })
       .catch((error) => console.error(error));
   }, []);
 
+  useEffect(() => {
+    // Every (re)connect starts with the server's in-memory state, so no refetch is needed.
+    return realtimeService.on("snapshot", (payload) => {
+      const snapshot = payload as RealtimeSnapshot;
+      if (snapshot.environment) setEnvironment(snapshot.environment);
+      if (snapshot.devices) setDevices(snapshot.devices);
+      const snapshotAlarms = snapshot.alarms;
+      if (snapshotAlarms) setAlarms((current) => mergeAlarms(current, snapshotAlarms));
+    });
+  }, []);
+
   useEffect(() => {
     const handleOpen = () => setConnected(true);
     const handleClose = () => setConnected(false);
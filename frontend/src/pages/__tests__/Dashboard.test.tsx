@@ -70,7 +70,7 @@ describe("DashboardPage", () => {
     openHandlers.clear();
     closeHandlers.clear();
     vi.stubGlobal("fetch", vi.fn(async (input: RequestInfo) => {
-      if (typeof input === "string" && input.endsWith("/api/environment")) {
+      if (typeof input === "string" && input.endsWith("/api/environment/latest")) {
         return new Response(JSON.stringify(environment), {
           status: 200,
           headers: { "Content-Type": "application/json" }
@@ -136,4 +136,58 @@ describe("DashboardPage", () => {
       expect(screen.getByText("Connecting...")).toBeInTheDocument();
     });
   });
+
+  it("applies the snapshot sent on connect and keeps the alarm history", async () => {
+    render(<DashboardPage />);
+
+    await waitFor(() => {
+      expect(screen.getByText("Edge Node")).toBeInTheDocument();
+    });
+
+    const snapshot = {
+      devices: [{ ...devices[0], device_id: "node-2", name: "Backup Node" }],
+      alarms: [{ ...alarms[0], id: 3, code: "HUMIDITY_LOW", created_at: new Date().toISOString() }]
+    };
+    (realtimeEvents["snapshot"] ?? []).forEach((listener) => listener(snapshot));
+
+    await waitFor(() => {
+      expect(screen.getByText("Backup Node")).toBeInTheDocument();
+      expect(screen.queryByText("Edge Node")).not.toBeInTheDocument();
+      expect(screen.getByText("HUMIDITY_LOW")).toBeInTheDocument();
+      expect(screen.getByText("DEVICE_OFFLINE")).toBeInTheDocument();
+    });
+  });
+
+  it("keeps snapshot alarms when the initial fetch resolves later", async () => {
+    let resolveAlarms: (response: Response) => void = () => undefined;
+    const fetchMock = vi.mocked(fetch);
+    const respond = fetchMock.getMockImplementation()!;
+    fetchMock.mockImplementation(async (input: RequestInfo | URL) => {
+      if (typeof input === "string" && input.endsWith("/api/alarms")) {
+        return new Promise<Response>((resolve) => {
+          resolveAlarms = resolve;
+        });
+      }
+      return respond(input);
+    });
+
+    render(<DashboardPage />);
+    const openAlarm = { ...alarms[0], id: 3, code: "HUMIDITY_LOW" };
+    (realtimeEvents["snapshot"] ?? []).forEach((listener) => listener({ alarms: [openAlarm] }));
+    await waitFor(() => {
+      expect(screen.getByText("HUMIDITY_LOW")).toBeInTheDocument();
+    });
+
+    resolveAlarms(
+      new Response(JSON.stringify(alarms), {
+        status: 200,
+        headers: { "Content-Type": "application/json" }
+      })
+    );
+
+    await waitFor(() => {
+      expect(screen.getByText("DEVICE_OFFLINE")).toBeInTheDocument();
+      expect(screen.getByText("HUMIDITY_LOW")).toBeInTheDocument();
+    });
+  });
 });
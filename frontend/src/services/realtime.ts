@@ -11,6 +11,15 @@ type Listener = (payload: any) => void;
 
 type EventMap = Record<string, Set<Listener>>;
 
+// Frame sent to WebSocket clients connected with `?protocol=delta`.
+interface BatchFrame {
+  event: "batch";
+  seq: number;
+  keyframe: boolean;
+  events: { event: string; payload: any }[];
+  state: Record<string, Record<string, Record<string, any>>>;
+}
+
 const DEFAULT_ENDPOINT = "/api/ws";
 const RECONNECT_INTERVAL = 3000;
 
@@ -24,6 +33,7 @@ export class RealtimeService {
   private eventSource: EventSource | null = null;
   private failureCount = 0;
   private useSse = false;
+  private deltaState: Record<string, Record<string, Record<string, any>>> = {};
 
   constructor(endpoint: string = DEFAULT_ENDPOINT) {
     this.url = this.resolveUrl(endpoint);
@@ -46,6 +56,7 @@ export class RealtimeService {
       this.openSse();
       return;
     }
+    this.deltaState = {};
     this.socket = new WebSocket(this.url);
     this.socket.onopen = (event) => {
       if (this.reconnectTimer) {
@@ -70,7 +81,11 @@ export class RealtimeService {
       try {
         const payload = JSON.parse(event.data);
         this.emitter.emit("message", payload);
-        this.dispatchEvent(payload.event, payload.payload);
+        if (payload.event === "batch") {
+          this.applyBatch(payload as BatchFrame);
+        } else {
+          this.dispatchEvent(payload.event, payload.payload);
+        }
       } catch (error) {
         console.error("Failed to parse realtime message", error);
       }
@@ -129,6 +144,26 @@ export class RealtimeService {
     };
   }
 
+  private applyBatch(frame: BatchFrame) {
+    frame.events.forEach((item) => this.dispatchEvent(item.event, item.payload));
+    Object.entries(frame.state).forEach(([event, entities]) => {
+      const known = (this.deltaState[event] ??= {});
+      Object.entries(entities).forEach(([key, fields]) => {
+        const previous = known[key];
+        if (
+          frame.keyframe &&
+          previous &&
+          Object.keys(fields).every((name) => previous[name] === fields[name])
+        ) {
+          return;
+        }
+        const merged = frame.keyframe ? { ...fields } : { ...previous, ...fields };
+        known[key] = merged;
+        this.dispatchEvent(event, merged);
+      });
+    });
+  }
+
   private dispatchEvent(event: string, payload: any) {
     const listeners = this.eventMap[event];
     if (!listeners) return;
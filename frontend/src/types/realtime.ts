@@ -23,6 +23,16 @@ export interface AlarmEvent {
   severity: "info" | "warning" | "critical";
   device_id?: string | null;
   created_at: string;
+  occurrence_count?: number;
+  first_seen_at?: string;
+  last_seen_at?: string;
+}
+
+// First message on every realtime connection; sections the client filtered out are omitted.
+export interface RealtimeSnapshot {
+  devices?: DeviceStatus[];
+  environment?: EnvironmentReading[];
+  alarms?: AlarmEvent[];
 }
 
 export interface RealtimeMessage<T = any> {